@@ -1,17 +1,25 @@
 import os
-import sys
-import click
-from flask import Config, Flask, render_template
-from flask_login import LoginManager
-from flask_sqlalchemy import SQLAlchemy
+from flask import Flask, render_template
 from dotenv import load_dotenv
 
 from app.config import ProductionConfig, TestingConfig
-from app.models import Movie, User
 from app.extensions import db, login_manager, limiter
-
-
-WIN = sys.platform.startswith('win')
+from app.assets import init_assets
+from app.cache import FragmentCache, TTLCache, load_cached_user
+from app.commands import register_commands
+from app.compression import init_compression
+from app.hashing import HashingBusy, PasswordHasher
+from app.http_cache import init_static_versioning
+from app.instrumentation import init_instrumentation
+from app.metrics import init_metrics
+from app.serialization import init_json
+from app.sessions import init_sessions
+from app.ratelimit import SQLiteStorage  # noqa: F401  registers sqlite:// for RATELIMIT_STORAGE_URI
+from app.sqlite import apply_pragmas
+from app.templating import init_templates
+
+
+WIN = os.name == 'nt'
 if WIN:
     prefix = 'sqlite:///'
 else: 
@@ -29,6 +37,7 @@ def create_app(config=ProductionConfig):
         config = TestingConfig
     
     app.config.from_object(config)
+    init_json(app)
 
     if config == ProductionConfig:
 
@@ -39,79 +48,51 @@ def create_app(config=ProductionConfig):
 
         app.config['SQLALCHEMY_DATABASE_URI'] = prefix + db_file_path
 
+        if 'RATELIMIT_STORAGE_URI' not in os.environ:
+            app.config['RATELIMIT_STORAGE_URI'] = prefix + os.path.join(os.path.dirname(db_file_path), 'ratelimit.db')
+
+        if 'SESSION_STORAGE_URI' not in os.environ:
+            app.config['SESSION_STORAGE_URI'] = prefix + os.path.join(os.path.dirname(db_file_path), 'sessions.db')
+
+    init_templates(app)
 
     db.init_app(app)
+    with app.app_context():
+        if db.engine.dialect.name == 'sqlite':
+            apply_pragmas(db.engine, app.config['SQLITE_PRAGMAS'])
     limiter.init_app(app)
     login_manager.init_app(app)
+    init_sessions(app)
+    init_metrics(app)
+    init_instrumentation(app)
+    init_compression(app)
+    app.extensions['user_cache'] = TTLCache(maxsize=app.config['USER_CACHE_SIZE'], ttl=app.config['USER_CACHE_TTL'])
+    app.extensions['fragment_cache'] = FragmentCache(max_bytes=app.config['FRAGMENT_CACHE_MAX_BYTES'])
+    app.extensions['password_hasher'] = PasswordHasher(
+        app.config['PASSWORD_HASH_METHOD'],
+        workers=app.config['PASSWORD_HASH_WORKERS'],
+        queue_limit=app.config['PASSWORD_HASH_QUEUE_LIMIT'],
+        timeout=app.config['PASSWORD_HASH_TIMEOUT'],
+    )
 
     # Import and register blueprints
-    from app.routes import movies_bp, games_bp, auth_bp, main_bp
+    from app.routes import api_bp, movies_bp, games_bp, auth_bp, main_bp, watchlist_bp, jobs_bp
     app.register_blueprint(auth_bp)
     app.register_blueprint(main_bp)
     app.register_blueprint(games_bp)
     app.register_blueprint(movies_bp)
+    app.register_blueprint(api_bp)
+    app.register_blueprint(watchlist_bp)
+    app.register_blueprint(jobs_bp)
+    init_assets(app)
+    init_static_versioning(app)
 
-    with app.app_context():
-        db.create_all()
-    
     @app.context_processor
     def inject():
         name = "ecar33"
-        movie_list = db.session.execute(db.select(Movie)).scalars().all()
-        return dict(name=name, movies=movie_list)
+        return dict(name=name)
     
-    @app.cli.command()
-    @click.option('--drop', is_flag=True, help='Create after drop.')
-    def initdb(drop):
-        if drop:
-            db.drop_all()
-        db.create_all()
-        click.echo('Initialized database.')
-
-    @app.cli.command()
-    @click.option('--username', prompt=True, help='The username used to login.')
-    @click.option('--password', prompt=True, hide_input=True, confirmation_prompt=True, help='The password used to login')
-    def admin(username, password):
-        db.create_all()
-
-        user = db.session.execute(db.select(User)).scalars().first()
-
-        if user is not None:
-            click.echo('Updating user...')
-            user.username = username
-            user.set_password(password)
-        else:
-            click.echo('Creating user...')
-            user = User(username=username, name='Admin')
-            user.set_password(password)
-            db.session.add(user)
-        
-        db.session.commit()
-        click.echo('Done.')
-
-    @app.cli.command()
-    @click.option('--username', prompt="Enter the username: ", help='The username used to login.')
-    @click.option('--password', prompt=True, hide_input=True, confirmation_prompt=True, help='The password used to login')
-    def check_password(username, password):    
-        while True:
-            user: User = db.session.execute(db.select(User).where(User.username == username)).scalars().first()
-
-            if user is not None:
-                break
-            else:
-                click.echo('User does not exist!')
-                username = click.prompt('Enter the username: ')
-
-        while True:
-            if user.validate_password(password):
-                print("Password is correct.")
-                break
-            else:
-                print("Password is incorrect")
-
-            password = click.prompt('Enter the correct password: ', hide_input=True, confirmation_prompt=True)
-
-        click.echo("Done.")
+    register_commands(app)
 
     @app.errorhandler(404)
     def page_not_found(e):
@@ -124,14 +105,16 @@ def create_app(config=ProductionConfig):
     @app.errorhandler(400)
     def bad_request(e):
         return render_template('errors/400.html'), 400
+
+    @app.errorhandler(HashingBusy)
+    def hashing_busy(e):
+        return render_template('errors/503.html'), 503
         
     return app
 
 
 @login_manager.user_loader
 def load_user(user_id):
-    from app.models import User 
-    user = db.session.execute(db.select(User).where(User.id == user_id)).scalars().first()
-    return user
+    return load_cached_user(user_id)
 
 
@@ -0,0 +1,174 @@
+from urllib.parse import unquote
+
+from asgiref.sync import sync_to_async
+from asgiref.wsgi import WsgiToAsgi
+from flask import abort, g, make_response, render_template
+from sqlalchemy import select
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from app.cache import fragment_key
+from app.forms import AddMovieForm, DeleteMovieForm
+from app.http_cache import not_modified, set_validators, validators
+from app.instrumentation import install_query_events
+from app.models import ResourceVersion
+from app.queries import (GAME_SORTS, KeysetPage, game_count_statement, game_cursor, game_page_statement,
+                         movie_count_statement, movie_cursor, movie_page_statement)
+from app.routes import game_list_args, movie_list_args
+from app.sqlite import apply_pragmas
+
+
+class AsyncWatchlist:
+    # ASGI entry point for the Flask app. Anonymous GETs of /movies/ and
+    # /games/ are served by async views that query through an AsyncSession on
+    # aiosqlite, so slow clients and slow queries wait on the event loop instead
+    # of holding a worker thread. Everything else (forms, logins, anything with
+    # a session cookie) goes to the unchanged Flask blueprints via WsgiToAsgi.
+    def __init__(self, app):
+        self.app = app
+        self.wsgi = WsgiToAsgi(app)
+
+        url = make_url(app.config['SQLALCHEMY_DATABASE_URI']).set(drivername='sqlite+aiosqlite')
+        # aiosqlite defaults to NullPool for files: a new connection, worker
+        # thread and pragma round per request. Keep connections pooled instead.
+        self.engine = create_async_engine(url, poolclass=AsyncAdaptedQueuePool,
+                                          pool_size=app.config['ASYNC_POOL_SIZE'], max_overflow=0)
+        apply_pragmas(self.engine.sync_engine, app.config['SQLITE_PRAGMAS'])
+        if app.config['QUERY_INSTRUMENTATION'] or app.config['METRICS_ENABLED']:
+            install_query_events(app, self.engine.sync_engine)
+        self.session = async_sessionmaker(self.engine, expire_on_commit=False)
+
+        self.views = {
+            '/movies/': (self.movies, 'movies'),
+            '/games/': (self.games, 'games'),
+        }
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+
+        if scope['type'] == 'http' and scope['method'] in ('GET', 'HEAD'):
+            route = self.views.get(scope['path'])
+            if route is not None and not self._has_session(scope):
+                return await self.respond(*route, scope, send)
+
+        await self.wsgi(scope, receive, send)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self.engine.dispose()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    def _has_session(self, scope):
+        cookie_name = self.app.config['SESSION_COOKIE_NAME'].encode()
+        for name, value in scope['headers']:
+            if name == b'cookie' and cookie_name + b'=' in value:
+                return True
+        return False
+
+    def request_context(self, scope):
+        headers = {name.decode('latin-1'): value.decode('latin-1') for name, value in scope['headers']}
+        return self.app.test_request_context(
+            unquote(scope['path']),
+            query_string=scope['query_string'].decode('latin-1'),
+            method=scope['method'],
+            headers=headers,
+            base_url=f"{scope.get('scheme', 'http')}://{headers.get('host', 'localhost')}",
+            # The rate limiter keys anonymous clients on their address
+            environ_overrides={'REMOTE_ADDR': scope['client'][0]} if scope.get('client') else None,
+        )
+
+    async def respond(self, view, resource, scope, send):
+        # The request context makes url_for, current_user, forms and context
+        # processors behave exactly as they do in the Flask views, and the
+        # app's before/after request hooks run around the async view, so the
+        # rate limiter, metrics, compression and error pages all apply. The
+        # hooks may block (the limiter's SQLite storage), so they run on a
+        # thread rather than the event loop.
+        with self.request_context(scope):
+            try:
+                response = await sync_to_async(self.app.preprocess_request, thread_sensitive=False)()
+                if response is None:
+                    response = await self.render(view, resource)
+            except Exception as e:
+                response = await sync_to_async(self.handle_exception, thread_sensitive=False)(e)
+            response = await sync_to_async(self.finish, thread_sensitive=False)(response)
+            body = b'' if scope['method'] == 'HEAD' else response.get_data()
+
+        await send({
+            'type': 'http.response.start',
+            'status': response.status_code,
+            'headers': [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                        for name, value in response.headers.items()],
+        })
+        await send({'type': 'http.response.body', 'body': body})
+
+    def handle_exception(self, e):
+        # As in Flask's dispatch: error handlers first, then the 500 handler
+        # (and logging) for anything they don't cover.
+        try:
+            return self.app.handle_user_exception(e)
+        except Exception as e:
+            return self.app.handle_exception(e)
+
+    def finish(self, response):
+        return self.app.process_response(self.app.make_response(response))
+
+    async def render(self, view, resource):
+        # @conditional and @cached_fragment for the async views: the same
+        # ETag/304 handling, and bodies cached under the same keys.
+        cache = self.app.extensions['fragment_cache']
+        async with self.session() as session:
+            row = (await session.execute(
+                select(ResourceVersion.version, ResourceVersion.updated_at)
+                .where(ResourceVersion.name == resource))).first()
+            versions = g.resource_versions = [(resource, row.version, row.updated_at) if row else (resource, 0, None)]
+            etag, last_modified = validators(versions)
+            if not_modified(etag, last_modified):
+                return set_validators(make_response('', 304), etag, last_modified)
+
+            key = fragment_key(versions)
+            cached = cache.get(key) if cache.max_bytes > 0 else None
+            if cached is not None:
+                response = self.app.response_class(cached[0], mimetype=cached[1])
+                response.headers['X-Cache'] = 'HIT'
+            else:
+                response = make_response(await view(session))
+                if cache.max_bytes > 0:
+                    cache.set(key, (response.get_data(), response.mimetype), tags=(resource,))
+                response.headers['X-Cache'] = 'MISS'
+        return set_validators(response, etag, last_modified)
+
+    async def movies(self, session):
+        args = movie_list_args()
+        rows = (await session.scalars(movie_page_statement(args['after'], args['per_page']))).all()
+        count = await session.scalar(movie_count_statement())
+
+        return render_template('movies.html',
+                               movies=KeysetPage(iter(rows), args['per_page'], movie_cursor).load(),
+                               movie_count=count,
+                               add_movie_form=AddMovieForm(),
+                               delete_movie_form=DeleteMovieForm(),
+                               **args)
+
+    async def games(self, session):
+        args = game_list_args()
+        try:
+            statement = game_page_statement(**args)
+        except ValueError:
+            abort(400)
+
+        rows = (await session.scalars(statement)).all()
+        count = await session.scalar(game_count_statement(args['year_from'], args['year_to'], args['sort']))
+
+        return render_template('games.html',
+                               game_details=KeysetPage(iter(rows), args['per_page'], game_cursor(args['sort'])).load(),
+                               game_count=count,
+                               sorts=GAME_SORTS,
+                               **args)
@@ -0,0 +1,188 @@
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import shutil
+import subprocess
+
+from flask import current_app, request, send_from_directory
+
+from app.http_cache import STATIC_MAX_AGE
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - brotli is optional
+    brotli = None
+
+# Formats that are already compressed; gzip/brotli copies would only grow
+PRECOMPRESSED = ('.gif', '.png', '.jpg', '.jpeg', '.webp', '.mp4', '.webm', '.woff', '.woff2')
+MANIFEST = 'manifest.json'
+
+
+def fingerprint(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()[:12]
+
+
+def fingerprinted_name(filename, digest):
+    base, ext = os.path.splitext(filename)
+    return f'{base}.{digest}{ext}'
+
+
+def _write_compressed(path):
+    # .gz and .br siblings, kept only when they actually save bytes
+    with open(path, 'rb') as f:
+        data = f.read()
+    written = []
+    variants = [('.gz', lambda: gzip.compress(data, compresslevel=9, mtime=0))]
+    if brotli is not None:
+        variants.append(('.br', lambda: brotli.compress(data, quality=11)))
+    for suffix, compress in variants:
+        compressed = compress()
+        if len(compressed) < len(data):
+            with open(path + suffix, 'wb') as f:
+                f.write(compressed)
+            written.append(suffix)
+    return written
+
+
+def _convert_gif(source, target_base):
+    # Animated WebP and MP4 copies of a GIF, using whichever of gif2webp and
+    # ffmpeg are installed. Returns {'webp': path, 'mp4': path} for the ones
+    # that came out smaller than the GIF.
+    commands = {}
+    if shutil.which('gif2webp'):
+        commands['webp'] = ['gif2webp', '-quiet', '-mixed', '-m', '6', '-q', '75', source, '-o', target_base + '.webp']
+    elif shutil.which('ffmpeg'):
+        commands['webp'] = ['ffmpeg', '-v', 'error', '-y', '-i', source, '-c:v', 'libwebp', '-q:v', '75',
+                            '-loop', '0', '-an', target_base + '.webp']
+    if shutil.which('ffmpeg'):
+        commands['mp4'] = ['ffmpeg', '-v', 'error', '-y', '-i', source, '-movflags', '+faststart',
+                           '-pix_fmt', 'yuv420p', '-vf', 'scale=trunc(iw/2)*2:trunc(ih/2)*2',
+                           '-c:v', 'libx264', '-crf', '28', '-an', target_base + '.mp4']
+
+    converted = {}
+    for kind, command in commands.items():
+        target = f'{target_base}.{kind}'
+        try:
+            subprocess.run(command, check=True, capture_output=True)
+        except (OSError, subprocess.CalledProcessError) as e:
+            current_app.logger.warning('Could not convert %s to %s: %s', source, kind, e)
+            continue
+        if os.path.getsize(target) < os.path.getsize(source):
+            converted[kind] = target
+        else:
+            os.remove(target)
+    return converted
+
+
+def _check_output_dir(app, output_dir):
+    # The output directory is wiped before each build, so it must not hold
+    # the app or its sources, and if it already has files they must be a
+    # previous build's.
+    output = os.path.realpath(output_dir)
+    for path in (app.root_path, app.static_folder):
+        path = os.path.realpath(path)
+        if os.path.commonpath([output, path]) in (output, path):
+            raise ValueError(f'Refusing to build assets into {output_dir}: it overlaps {path}.')
+    if os.path.isdir(output) and os.listdir(output) and not os.path.exists(os.path.join(output, MANIFEST)):
+        raise ValueError(f'Refusing to replace {output_dir}: it is not empty and has no {MANIFEST}.')
+
+
+def build_assets(app, output_dir=None, convert_images=True):
+    # Copies app/static into output_dir under content-hashed names, with
+    # precompressed siblings and WebP/MP4 versions of GIFs, and writes the
+    # manifest init_assets() serves from. Returns the manifest.
+    output_dir = output_dir or app.config['ASSETS_DIR']
+    _check_output_dir(app, output_dir)
+    if os.path.isdir(output_dir):
+        shutil.rmtree(output_dir)
+
+    manifest = dict(files={}, variants={})
+    for root, dirs, names in os.walk(app.static_folder):
+        dirs.sort()
+        for name in sorted(names):
+            source = os.path.join(root, name)
+            filename = os.path.relpath(source, app.static_folder).replace(os.sep, '/')
+            digest = fingerprint(source)
+            built = fingerprinted_name(filename, digest)
+            target = os.path.join(output_dir, built)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            shutil.copyfile(source, target)
+            manifest['files'][filename] = built
+
+            if not name.lower().endswith(PRECOMPRESSED):
+                _write_compressed(target)
+
+            if convert_images and name.lower().endswith('.gif'):
+                converted = _convert_gif(source, os.path.splitext(target)[0])
+                if converted:
+                    manifest['variants'][filename] = {
+                        kind: os.path.relpath(path, output_dir).replace(os.sep, '/')
+                        for kind, path in converted.items()}
+
+    with open(os.path.join(output_dir, MANIFEST), 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    return manifest
+
+
+def load_manifest(output_dir):
+    try:
+        with open(os.path.join(output_dir, MANIFEST)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def init_assets(app):
+    # When `flask build-assets` has run, url_for('static', filename=...) points
+    # at the fingerprinted copy, and those are served precompressed (per
+    # Accept-Encoding) as immutable for a year. Files missing from the manifest
+    # fall back to app/static with ?v= versioning (init_static_versioning), so
+    # register this first. The manifest is read once, at startup.
+    output_dir = app.config['ASSETS_DIR']
+    manifest = load_manifest(output_dir) if output_dir else None
+    if manifest is None:
+        app.jinja_env.globals['asset_variant'] = lambda filename, kind: None
+        return
+
+    files = manifest['files']
+    built = set(files.values())
+    for variants in manifest['variants'].values():
+        built.update(variants.values())
+    # Which precompressed siblings each built file has, looked up once
+    encodings = {filename: [(encoding, suffix) for encoding, suffix in (('br', '.br'), ('gzip', '.gz'))
+                            if os.path.exists(os.path.join(output_dir, filename + suffix))]
+                 for filename in built}
+    send_static = app.view_functions['static']
+
+    def asset_variant(filename, kind):
+        variant = manifest['variants'].get(filename, {}).get(kind)
+        return variant and app.url_for('static', filename=variant)
+
+    app.jinja_env.globals['asset_variant'] = asset_variant
+
+    @app.url_defaults
+    def use_built_asset(endpoint, values):
+        if endpoint == 'static' and values.get('filename') in files:
+            values['filename'] = files[values['filename']]
+
+    def static(filename):
+        if filename not in built:
+            return send_static(filename=filename)
+
+        mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        encoding, suffix = next(((encoding, suffix) for encoding, suffix in encodings[filename]
+                                 if request.accept_encodings[encoding]), (None, ''))
+
+        response = send_from_directory(output_dir, filename + suffix, mimetype=mimetype, max_age=STATIC_MAX_AGE)
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        response.vary.add('Accept-Encoding')
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+        return response
+
+    app.view_functions['static'] = static
+
@@ -0,0 +1,189 @@
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import current_app, g, has_request_context, make_response, request, session
+from flask_login import current_user
+from sqlalchemy.orm import make_transient_to_detached
+
+from app.extensions import db
+from app.http_cache import resource_versions
+from app.models import User
+
+
+class TTLCache:
+    # Thread-safe LRU map whose entries also expire after ttl seconds
+    def __init__(self, maxsize=1024, ttl=60, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+
+            value, expires = entry
+            if expires is not None and expires <= self.clock():
+                del self._data[key]
+                return default
+
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        if self.maxsize <= 0:
+            return
+
+        expires = self.clock() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            self._data[key] = (value, expires)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            entry = self._data.pop(key, None)
+        return default if entry is None else entry[0]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class FragmentCache:
+    # LRU of rendered page bodies capped by total size in bytes. Entries are
+    # tagged with the resources they were built from so a write can drop them.
+    def __init__(self, max_bytes=16 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, value, tags=()):
+        size = len(value[0])
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self.size -= len(old[0][0])
+            self._data[key] = (value, frozenset(tags))
+            self.size += size
+            while self.size > self.max_bytes:
+                _, (evicted, _) = self._data.popitem(last=False)
+                self.size -= len(evicted[0])
+                self.evictions += 1
+
+    def invalidate(self, *tags):
+        with self._lock:
+            for key in [key for key, (_, entry_tags) in self._data.items() if entry_tags.intersection(tags)]:
+                value, _ = self._data.pop(key)
+                self.size -= len(value[0])
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.size = 0
+
+    def stats(self):
+        return dict(hits=self.hits, misses=self.misses, evictions=self.evictions,
+                    entries=len(self._data), bytes=self.size, max_bytes=self.max_bytes)
+
+
+def fragment_key(versions):
+    return request.full_path, tuple((name, version) for name, version, _ in versions)
+
+
+def cached_fragment(*resources):
+    # Serves the stored body of an anonymous GET when nothing it was rendered
+    # from has changed; the key carries the query string and resource versions.
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            cache = current_app.extensions['fragment_cache']
+            if (cache.max_bytes <= 0 or request.method != 'GET' or current_user.is_authenticated
+                    or session.get('_flashes')):
+                return view(*args, **kwargs)
+
+            key = fragment_key(g.get('resource_versions') or resource_versions(resources))
+
+            cached = cache.get(key)
+            if cached is not None:
+                body, mimetype = cached
+                response = current_app.response_class(body, mimetype=mimetype)
+                response.headers['X-Cache'] = 'HIT'
+                return response
+
+            response = make_response(view(*args, **kwargs))
+            if response.status_code == 200 and not response.is_streamed:
+                cache.set(key, (response.get_data(), response.mimetype), tags=resources)
+            response.headers['X-Cache'] = 'MISS'
+            return response
+        return wrapper
+    return decorator
+
+
+def user_snapshot(user):
+    return {column.key: getattr(user, column.key) for column in User.__table__.columns}
+
+
+def _session_snapshot(user_id):
+    # Server-side sessions (app/sessions.py) carry the user's columns too, so a
+    # worker whose own cache is cold can still skip the SELECT.
+    if not has_request_context() or not getattr(session, 'server_side', False):
+        return None
+    cached = session.get('_user')
+    if cached and str(cached[1]['id']) == str(user_id) and cached[0] > time.time():
+        return cached[1]
+    return None
+
+
+def load_cached_user(user_id):
+    # Rebuild the user from its cached column values and attach it to the
+    # session without a SELECT; merge(load=False) trusts the snapshot.
+    cache = current_app.extensions['user_cache']
+    snapshot = cache.get(str(user_id)) or _session_snapshot(user_id)
+
+    if snapshot is not None:
+        user = User(**snapshot)
+        make_transient_to_detached(user)
+        return db.session.merge(user, load=False)
+
+    user = db.session.execute(db.select(User).where(User.id == user_id)).scalars().first()
+    if user is not None:
+        snapshot = user_snapshot(user)
+        cache.set(str(user_id), snapshot)
+        if has_request_context() and getattr(session, 'server_side', False):
+            # The hash stays out of the session store; it's loaded on access
+            session['_user'] = [time.time() + cache.ttl,
+                                {key: value for key, value in snapshot.items() if key != 'password_hash'}]
+    return user
+
+
+def forget_user(user_id):
+    current_app.extensions['user_cache'].pop(str(user_id))
+    if has_request_context() and getattr(session, 'server_side', False):
+        session.pop('_user', None)
@@ -0,0 +1,211 @@
+import os
+import sys
+
+import click
+from flask import current_app
+
+from app.extensions import db
+
+
+def register_commands(app):
+    # Commands import what they use when they run, so building the app doesn't
+    # pay for modules only the CLI needs (the importer and migrations; search
+    # and stats are loaded anyway, by app.routes).
+
+    @app.cli.command()
+    @click.option('--drop', is_flag=True, help='Create after drop.')
+    def initdb(drop):
+        from app.migrations import create_schema, drop_schema
+
+        if drop:
+            drop_schema(db.engine)
+        create_schema(db.engine)
+        click.echo('Initialized database.')
+
+    @app.cli.group('db')
+    def db_group():
+        """Versioned schema migrations."""
+
+    @db_group.command()
+    @click.option('--to', 'target', type=int, help='Stop at this version instead of the latest.')
+    def upgrade(target):
+        from app.migrations import upgrade as run_upgrade
+
+        applied = run_upgrade(db.engine, target,
+                              on_migration=lambda version, name: click.echo(f'Applying {version}: {name}...'))
+        click.echo(f'Applied {len(applied)} migrations.' if applied else 'Schema is up to date.')
+
+    @db_group.command()
+    def current():
+        from app.migrations import current_version, head
+
+        with db.engine.connect() as connection:
+            click.echo(f'Schema version {current_version(connection)} (latest {head()}).')
+
+    @app.cli.command()
+    @click.argument('path', type=click.Path(exists=True, dir_okay=False, allow_dash=True))
+    @click.option('--format', 'fmt', type=click.Choice(['jsonl', 'csv']), help='Input format, guessed from the file extension by default.')
+    @click.option('--batch-size', type=click.IntRange(min=1), default=None, help='Rows per insert batch.')
+    def import_games(path, fmt, batch_size):
+        from app.importer import detect_format, import_games as run_import
+
+        fmt = fmt or detect_format(path)
+        batch_size = batch_size or current_app.config['IMPORT_BATCH_SIZE']
+
+        def report(stats):
+            click.echo(f'Imported {stats.imported} rows ({stats.skipped} skipped)...')
+
+        if path == '-':
+            stats = run_import(sys.stdin, fmt, batch_size, on_batch=report)
+        else:
+            with open(path, newline='', encoding='utf-8') as stream:
+                stats = run_import(stream, fmt, batch_size, on_batch=report)
+
+        for error in stats.errors:
+            click.echo(f'Skipped {error}', err=True)
+        click.echo(f'Done. Imported {stats.imported} games, skipped {stats.skipped} invalid rows.')
+
+    @app.cli.command()
+    def compile_templates():
+        from app.templating import compile_templates as run_compile
+
+        names = run_compile(current_app)
+        cache_dir = current_app.config['JINJA_BYTECODE_CACHE_DIR']
+        click.echo(f'Compiled {len(names)} templates' + (f' into {cache_dir}.' if cache_dir else ' (no bytecode cache configured).'))
+
+    @app.cli.command()
+    @click.option('--output', type=click.Path(file_okay=False), help='Defaults to ASSETS_DIR.')
+    @click.option('--no-images', is_flag=True, help='Skip converting GIFs to WebP/MP4.')
+    def build_assets(output, no_images):
+        from app.assets import build_assets as run_build
+
+        output = output or current_app.config['ASSETS_DIR']
+        if not output:
+            raise click.UsageError('Set ASSETS_DIR or pass --output.')
+
+        try:
+            manifest = run_build(current_app, output, convert_images=not no_images)
+        except ValueError as e:
+            raise click.UsageError(str(e))
+        for filename, built in sorted(manifest['files'].items()):
+            path = os.path.join(output, built)
+            sizes = [f'{os.path.getsize(path)} B']
+            sizes += [f'{suffix} {os.path.getsize(path + suffix)} B' for suffix in ('.gz', '.br')
+                      if os.path.exists(path + suffix)]
+            sizes += [f'{kind} {os.path.getsize(os.path.join(output, variant))} B'
+                      for kind, variant in sorted(manifest['variants'].get(filename, {}).items())]
+            click.echo(f'{built}: ' + ', '.join(sizes))
+        click.echo(f'Built {len(manifest["files"])} assets into {output}. Restart the app to serve them.')
+
+    @app.cli.command()
+    def rebuild_stats():
+        from app.stats import rebuild_stats as run_rebuild
+
+        from app.http_cache import bump_version
+
+        with db.engine.begin() as connection:
+            run_rebuild(connection)
+        # Pages showing counts are cached under these versions
+        bump_version('movies', 'games')
+        db.session.commit()
+        click.echo('Rebuilt catalog stats.')
+
+    @app.cli.command()
+    def reindex_search():
+        from app.search import rebuild_search_index
+
+        with db.engine.begin() as connection:
+            rebuild_search_index(connection)
+        click.echo('Rebuilt search index.')
+
+    @app.cli.command()
+    @click.option('--concurrency', type=click.IntRange(min=1), default=None, help='Jobs run at once.')
+    @click.option('--burst', is_flag=True, help='Exit once no jobs are due instead of waiting for more.')
+    def worker(concurrency, burst):
+        from app.jobs import run_worker
+
+        def report(row, ok):
+            click.echo(f'Job {row.id} ({row.kind}) ' + ('done.' if ok else f'failed, attempt {row.attempts} of {row.max_attempts}.'))
+
+        concurrency = concurrency or current_app.config['JOB_CONCURRENCY']
+        click.echo(f'Worker started with concurrency {concurrency}.')
+        try:
+            count = run_worker(current_app._get_current_object(), concurrency, burst, on_job=report)
+        except KeyboardInterrupt:
+            click.echo('Stopping.')
+            return
+        click.echo(f'Ran {count} jobs.')
+
+    @app.cli.command()
+    @click.argument('kind')
+    @click.option('--payload', default='{}', help='Job arguments as a JSON object.')
+    def enqueue(kind, payload):
+        import json
+
+        from app.jobs import enqueue as add_job
+
+        try:
+            job = add_job(kind, json.loads(payload))
+        except ValueError as e:
+            raise click.BadParameter(str(e))
+        db.session.commit()
+        click.echo(f'Queued job {job.id}.')
+
+    @app.cli.command()
+    @click.option('--limit', type=click.IntRange(min=1), default=20)
+    def jobs(limit):
+        from app.models import Job
+
+        for job in db.session.execute(db.select(Job).order_by(Job.id.desc()).limit(limit)).scalars():
+            progress = f'{job.progress}/{job.total}' if job.total is not None else str(job.progress)
+            click.echo(f'{job.id:>6} {job.kind:<16} {job.status:<8} {progress:>12} '
+                       f'attempt {job.attempts}/{job.max_attempts}' + (f'  {job.error}' if job.error else ''))
+
+    @app.cli.command()
+    @click.option('--username', prompt=True, help='The username used to login.')
+    @click.option('--password', prompt=True, hide_input=True, confirmation_prompt=True, help='The password used to login')
+    def admin(username, password):
+        from app.models import User
+
+        user = db.session.execute(db.select(User)).scalars().first()
+
+        if user is not None:
+            click.echo('Updating user...')
+            user.username = username
+            user.set_password(password)
+        else:
+            click.echo('Creating user...')
+            user = User(username=username, name='Admin')
+            user.set_password(password)
+            db.session.add(user)
+
+        db.session.commit()
+        # Running web workers keep their cached copy of this user for up to
+        # USER_CACHE_TTL seconds; the CLI has no way to reach their caches.
+        click.echo('Done.')
+
+    @app.cli.command()
+    @click.option('--username', prompt="Enter the username: ", help='The username used to login.')
+    @click.option('--password', prompt=True, hide_input=True, confirmation_prompt=True, help='The password used to login')
+    def check_password(username, password):
+        from app.models import User
+
+        while True:
+            user: User = db.session.execute(db.select(User).where(User.username == username)).scalars().first()
+
+            if user is not None:
+                break
+            else:
+                click.echo('User does not exist!')
+                username = click.prompt('Enter the username: ')
+
+        while True:
+            if user.validate_password(password):
+                print("Password is correct.")
+                break
+            else:
+                print("Password is incorrect")
+
+            password = click.prompt('Enter the correct password: ', hide_input=True, confirmation_prompt=True)
+
+        click.echo("Done.")
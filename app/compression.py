@@ -0,0 +1,60 @@
+import gzip
+
+from flask import current_app, request
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - brotli is optional
+    brotli = None
+
+
+def _encoding(accept_encodings):
+    if brotli is not None and accept_encodings['br']:
+        return 'br'
+    if accept_encodings['gzip']:
+        return 'gzip'
+    return None
+
+
+def _compress(data, encoding):
+    if encoding == 'br':
+        return brotli.compress(data, quality=current_app.config['COMPRESS_BROTLI_QUALITY'])
+    return gzip.compress(data, compresslevel=current_app.config['COMPRESS_LEVEL'], mtime=0)
+
+
+def init_compression(app):
+    # Compressed bodies get their own ETag ("<tag>-gzip", "<tag>-br") so a
+    # cache never hands one encoding's validator to the other; @conditional
+    # accepts either suffix when revalidating.
+    if not app.config['COMPRESS_ENABLED']:
+        return
+
+    @app.after_request
+    def compress(response):
+        if response.mimetype not in current_app.config['COMPRESS_MIMETYPES']:
+            return response
+
+        response.vary.add('Accept-Encoding')
+        encoding = _encoding(request.accept_encodings)
+        if encoding is None:
+            return response
+
+        etag, weak = response.get_etag()
+        if response.status_code == 304:
+            if etag and f'{etag}-{encoding}' in request.if_none_match:
+                response.set_etag(f'{etag}-{encoding}', weak)
+            return response
+
+        if (response.status_code != 200 or response.direct_passthrough or response.is_streamed
+                or 'Content-Encoding' in response.headers):
+            return response
+
+        data = response.get_data()
+        if len(data) < current_app.config['COMPRESS_MIN_SIZE']:
+            return response
+
+        response.set_data(_compress(data, encoding))
+        response.headers['Content-Encoding'] = encoding
+        if etag:
+            response.set_etag(f'{etag}-{encoding}', weak)
+        return response
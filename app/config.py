@@ -4,19 +4,141 @@ import sys
 class Config:
     SECRET_KEY = os.getenv('SECRET_KEY', 'dev')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+    # Applied to every SQLite connection. WAL lets readers run alongside a
+    # writer, busy_timeout makes writers wait for the lock instead of failing.
+    SQLITE_PRAGMAS = {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'busy_timeout': int(os.getenv('SQLITE_BUSY_TIMEOUT', 5000)),
+        'cache_size': int(os.getenv('SQLITE_CACHE_SIZE', -20000)),
+        'mmap_size': int(os.getenv('SQLITE_MMAP_SIZE', 268435456)),
+        'temp_store': 'MEMORY',
+    }
     
     # Rate Limiting
-    RATELIMIT_STORAGE_URL = "memory://"
+    # memory:// keeps separate counters per worker process. Point every worker
+    # at shared storage in production: sqlite:////path/to/ratelimit.db (see
+    # app/ratelimit.py) or redis://host:6379.
+    RATELIMIT_STORAGE_URI = os.getenv('RATELIMIT_STORAGE_URI', 'memory://')
     RATELIMIT_HEADERS_ENABLED = True
     RATELIMIT_DEFAULT = "200 per hour"
 
+    # Sessions: 'cookie' keeps Flask's signed cookie. 'sqlite' (shared by every
+    # worker using SESSION_STORAGE_URI) or 'memory' (one process only) keep the
+    # data server-side behind a random id, along with the logged-in user's
+    # columns; expired sessions are swept every SESSION_SWEEP_INTERVAL seconds.
+    SESSION_BACKEND = os.getenv('SESSION_BACKEND', 'cookie')
+    SESSION_STORAGE_URI = os.getenv('SESSION_STORAGE_URI')
+    SESSION_SWEEP_INTERVAL = 600
+
+    # Identity cache for Flask-Login's user_loader
+    USER_CACHE_SIZE = 1024
+    USER_CACHE_TTL = 60
+
+    # Rendered /movies/ and /games/ bodies for anonymous visitors; 0 disables
+    FRAGMENT_CACHE_MAX_BYTES = int(os.getenv('FRAGMENT_CACHE_MAX_BYTES', 16 * 1024 * 1024))
+
+    # Password hashing: werkzeug method string, e.g. "scrypt:32768:8:1" or
+    # "pbkdf2:sha256:600000". Stored hashes using anything else are upgraded
+    # at the next successful login. PASSWORD_HASH_WORKERS = 0 hashes inline.
+    PASSWORD_HASH_METHOD = os.getenv('PASSWORD_HASH_METHOD', 'scrypt:32768:8:1')
+    PASSWORD_HASH_WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS', 2))
+    PASSWORD_HASH_QUEUE_LIMIT = int(os.getenv('PASSWORD_HASH_QUEUE_LIMIT', 16))
+    PASSWORD_HASH_TIMEOUT = float(os.getenv('PASSWORD_HASH_TIMEOUT', 5))
+
+    # Connections held by the optional ASGI entry point (asgi.py)
+    ASYNC_POOL_SIZE = int(os.getenv('ASYNC_POOL_SIZE', 10))
+
+    # Latency histograms at /metrics, and a Server-Timing header per response
+    METRICS_ENABLED = os.getenv('METRICS_ENABLED', '1') == '1'
+    SERVER_TIMING_ENABLED = os.getenv('SERVER_TIMING_ENABLED', '0') == '1'
+
+    # Templates: trim_blocks/lstrip_blocks drop the lines that only hold tags.
+    # A bytecode cache directory lets every worker load compiled templates
+    # (fill it at build time with `flask compile-templates`).
+    JINJA_TRIM_BLOCKS = True
+    JINJA_BYTECODE_CACHE_DIR = os.getenv('JINJA_BYTECODE_CACHE_DIR')
+
+    # `flask build-assets` writes fingerprinted, precompressed copies of
+    # app/static and a manifest here. When the manifest exists at startup,
+    # static URLs point at those copies (see app/assets.py).
+    ASSETS_DIR = os.getenv('ASSETS_DIR')
+
+    # Response compression: gzip, or brotli when installed and accepted
+    COMPRESS_ENABLED = os.getenv('COMPRESS_ENABLED', '0') == '1'
+    COMPRESS_MIN_SIZE = int(os.getenv('COMPRESS_MIN_SIZE', 1024))
+    COMPRESS_LEVEL = 6
+    COMPRESS_BROTLI_QUALITY = 4
+    COMPRESS_MIMETYPES = ('text/html', 'text/plain', 'text/css', 'text/javascript',
+                          'application/javascript', 'application/json')
+
+    # Per-request SQL counting and @query_budget checks (see app/instrumentation.py)
+    QUERY_INSTRUMENTATION = False
+
+    # Movie list
+    MOVIES_PER_PAGE = 50
+    MOVIES_MAX_PER_PAGE = 500
+    MOVIES_STREAM = False
+
+    # Game list
+    GAMES_PER_PAGE = 20
+    GAMES_MAX_PER_PAGE = 200
+
+    # Per-user watchlists
+    WATCHLIST_PER_PAGE = 50
+    WATCHLIST_MAX_PER_PAGE = 500
+
+    # JSON API
+    API_PER_PAGE = 100
+    API_MAX_PER_PAGE = 1000
+    API_BATCH_LIMIT = 1000
+
+    # Search
+    SEARCH_RESULTS_LIMIT = 20
+
+    # Catalog import
+    IMPORT_BATCH_SIZE = 1000
+
+    # Rows copied per committed batch when a migration rebuilds a table
+    MIGRATION_BATCH_SIZE = int(os.getenv('MIGRATION_BATCH_SIZE', 5000))
+
+    # Background jobs run by `flask worker`. Failed jobs are retried after
+    # JOB_RETRY_DELAY seconds, doubling each time; running jobs that haven't
+    # sent a heartbeat for JOB_TIMEOUT seconds are assumed lost and requeued.
+    JOB_CONCURRENCY = int(os.getenv('JOB_CONCURRENCY', 2))
+    JOB_MAX_ATTEMPTS = 3
+    JOB_RETRY_DELAY = 30
+    JOB_POLL_INTERVAL = 1.0
+    JOB_TIMEOUT = 600
+    JOB_HEARTBEAT_INTERVAL = 60
+    # Uploaded imports wait here for a worker; defaults to <instance>/uploads
+    JOB_UPLOAD_DIR = os.getenv('JOB_UPLOAD_DIR')
+
 class DevelopmentConfig(Config):
+    QUERY_INSTRUMENTATION = True
+    SERVER_TIMING_ENABLED = True
     SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.join(os.getcwd(), 'dev.db')
 
 class TestingConfig(Config):
     TESTING = True
     SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
     WTF_CSRF_ENABLED = False
+    QUERY_INSTRUMENTATION = True
+    PASSWORD_HASH_METHOD = 'pbkdf2:sha256:1000'
+    PASSWORD_HASH_WORKERS = 0
 
 class ProductionConfig(Config):
-    SQLALCHEMY_DATABASE_URI = None 
\ No newline at end of file
+    SQLALCHEMY_DATABASE_URI = None
+    TEMPLATES_AUTO_RELOAD = False
+    ASSETS_DIR = os.getenv('ASSETS_DIR',
+                           os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'build', 'static'))
+    JINJA_BYTECODE_CACHE_DIR = os.getenv('JINJA_BYTECODE_CACHE_DIR',
+                                         os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), '.jinja-cache'))
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        'pool_size': int(os.getenv('DATABASE_POOL_SIZE', 10)),
+        'max_overflow': int(os.getenv('DATABASE_MAX_OVERFLOW', 20)),
+        'pool_timeout': 30,
+        'pool_pre_ping': False,
+        'connect_args': {'timeout': 30, 'check_same_thread': False},
+    } 
\ No newline at end of file
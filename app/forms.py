@@ -1,6 +1,7 @@
-from wtforms.validators import DataRequired, Length, EqualTo
+from wtforms.validators import DataRequired, Length, EqualTo, Regexp
 from flask_wtf import FlaskForm
-from wtforms import HiddenField, PasswordField, StringField, SubmitField
+from flask_wtf.file import FileAllowed, FileField, FileRequired
+from wtforms import HiddenField, PasswordField, SelectField, StringField, SubmitField
 
 
 class AddMovieForm(FlaskForm):
@@ -9,13 +10,29 @@ class AddMovieForm(FlaskForm):
         Length(1, max=50)])
     year = StringField('Year', validators=[
         DataRequired(),
-        Length(4,4)])
+        Length(4,4),
+        Regexp(r'^\d{4}$')])
     submit = SubmitField('Add')
 
 class DeleteMovieForm(FlaskForm):
     movie_id = HiddenField('Movie ID')
     submit = SubmitField('Delete')
 
+class WatchlistForm(FlaskForm):
+    submit = SubmitField('Watch')
+
+class WatchlistStatusForm(FlaskForm):
+    status = SelectField('Status', choices=[('planned', 'Planned'), ('watching', 'Watching'),
+                                            ('finished', 'Finished'), ('dropped', 'Dropped')])
+    submit = SubmitField('Update')
+
+class JobForm(FlaskForm):
+    submit = SubmitField('Run')
+
+class ImportGamesForm(FlaskForm):
+    dump = FileField('Games dump', validators=[FileRequired(), FileAllowed(['jsonl', 'json', 'csv'])])
+    submit = SubmitField('Import')
+
 class LoginForm(FlaskForm):
     username = StringField('Username', validators=[DataRequired()])
     password = PasswordField('Password', validators=[DataRequired()])
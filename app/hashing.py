@@ -0,0 +1,110 @@
+import concurrent.futures
+import os
+import threading
+import time
+from concurrent.futures.process import BrokenProcessPool
+
+from flask import current_app, g, has_request_context
+from werkzeug.security import DEFAULT_PBKDF2_ITERATIONS, check_password_hash, generate_password_hash
+
+
+class HashingBusy(Exception):
+    pass
+
+
+def hash_prefix(method):
+    # The method part of werkzeug's "method$salt$hash", with werkzeug's
+    # defaults filled in ("scrypt" -> "scrypt:32768:8:1"), worked out without
+    # running a hash.
+    name, *args = method.split(':')
+    if name == 'scrypt' and len(args) in (0, 3):
+        defaults = ['32768', '8', '1']
+    elif name == 'pbkdf2' and len(args) <= 2:
+        defaults = ['sha256', str(DEFAULT_PBKDF2_ITERATIONS)]
+    else:
+        # Anything else (including invalid methods, which raise here)
+        return generate_password_hash('', method).split('$', 1)[0]
+    return ':'.join([name] + [str(int(arg)) if arg.isdigit() else arg for arg in args] + defaults[len(args):])
+
+
+class PasswordHasher:
+    # Runs werkzeug's hash/check on a small process pool so a burst of logins
+    # can't pin every request thread on CPU. At most queue_limit calls may be
+    # queued or running; beyond that, or past the timeout, HashingBusy is raised
+    # and the request gets a 503. workers=0 hashes inline in the caller.
+    def __init__(self, method, workers=0, queue_limit=16, timeout=5):
+        self.method = method
+        self.workers = workers
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(max(queue_limit, 1))
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self.prefix = hash_prefix(method)
+
+    def _pool(self):
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                self._executor = concurrent.futures.ProcessPoolExecutor(max_workers=self.workers)
+                self._pid = os.getpid()
+            return self._executor
+
+    def _discard(self, executor):
+        # A worker process died (e.g. OOM-killed) and the pool refuses all
+        # further work; the next call starts a fresh one.
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def _run(self, fn, *args):
+        start = time.perf_counter()
+        try:
+            return self._call(fn, *args)
+        finally:
+            if has_request_context():
+                g.hash_time = g.get('hash_time', 0.0) + time.perf_counter() - start
+
+    def _call(self, fn, *args):
+        if self.workers <= 0:
+            return fn(*args)
+
+        # Hashing is repeatable, so a call caught by a breaking pool is
+        # retried once on a new one.
+        for _ in range(2):
+            executor = self._pool()
+            try:
+                return self._submit(executor, fn, *args)
+            except BrokenProcessPool:
+                self._discard(executor)
+        raise HashingBusy('Password hashing pool is broken.')
+
+    def _submit(self, executor, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            raise HashingBusy('Too many password hashes in flight.')
+        try:
+            future = executor.submit(fn, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        # cancel() can't stop a hash that has started, so a timed-out call
+        # keeps its slot until the pool is actually done with it.
+        future.add_done_callback(lambda future: self._slots.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            raise HashingBusy('Password hashing timed out.') from None
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.method)
+
+    def verify(self, password_hash, password):
+        return self._run(check_password_hash, password_hash, password)
+
+    def needs_rehash(self, password_hash):
+        return password_hash.split('$', 1)[0] != self.prefix
+
+
+def password_hasher():
+    return current_app.extensions['password_hasher']
@@ -0,0 +1,140 @@
+import datetime
+import hashlib
+import os
+import time
+from functools import wraps
+
+from flask import current_app, g, make_response, request, session
+from flask_login import current_user
+from sqlalchemy.dialects.sqlite import insert
+
+from app.extensions import db
+from app.models import ResourceVersion
+
+STATIC_MAX_AGE = 365 * 24 * 60 * 60
+
+
+def bump_version(*names):
+    # Call inside the writing transaction, before commit, so the new version
+    # becomes visible together with the data it describes. Fragments cached by
+    # this process are dropped right away; other workers miss on the new version.
+    now = datetime.datetime.utcnow()
+    table = ResourceVersion.__table__
+    for name in names:
+        statement = insert(table).values(name=name, version=1, updated_at=now)
+        db.session.execute(statement.on_conflict_do_update(
+            index_elements=[table.c.name],
+            set_=dict(version=table.c.version + 1, updated_at=now),
+        ))
+
+    fragment_cache = current_app.extensions.get('fragment_cache')
+    if fragment_cache is not None:
+        fragment_cache.invalidate(*names)
+
+
+def resource_versions(names):
+    rows = db.session.execute(db.select(ResourceVersion).where(ResourceVersion.name.in_(names))).scalars()
+    found = {row.name: row for row in rows}
+    return [(name, found[name].version if name in found else 0,
+             found[name].updated_at if name in found else None) for name in names]
+
+
+def _etag(versions):
+    parts = [request.full_path]
+    parts += [f'{name}:{version}' for name, version, _ in versions]
+
+    if current_user.is_authenticated:
+        # The page embeds the user's name and a CSRF token, so tie the tag to
+        # both and roll it over before the signed token would expire.
+        parts += [str(current_user.id), current_user.name or '', session.get('csrf_token', '')]
+        limit = current_app.config.get('WTF_CSRF_TIME_LIMIT') or 3600
+        parts.append(str(int(time.time() // max(limit // 2, 1))))
+
+    return hashlib.sha1('\0'.join(parts).encode()).hexdigest()
+
+
+def validators(versions):
+    # (ETag, Last-Modified) for a page built from the given resource versions
+    etag = _etag(versions)
+    modified = [updated for _, _, updated in versions if updated is not None]
+    last_modified = max(modified).replace(tzinfo=datetime.timezone.utc, microsecond=0) if modified else None
+    return etag, last_modified
+
+
+def not_modified(etag, last_modified):
+    # Compressed responses carry the tag with an encoding suffix (app/compression.py)
+    if any(tag in request.if_none_match for tag in (etag, f'{etag}-gzip', f'{etag}-br')):
+        return True
+    if not request.if_none_match and last_modified and request.if_modified_since:
+        return last_modified <= request.if_modified_since
+    return False
+
+
+def set_validators(response, etag, last_modified):
+    response.set_etag(etag)
+    if last_modified:
+        response.last_modified = last_modified
+    response.cache_control.no_cache = True
+    if current_user.is_authenticated:
+        response.cache_control.private = True
+    else:
+        response.cache_control.public = True
+    return response
+
+
+def conditional(*resources):
+    # Answers GET/HEAD with 304 Not Modified before the view runs when the
+    # client's ETag or Last-Modified still matches the resources' versions.
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if request.method not in ('GET', 'HEAD') or session.get('_flashes'):
+                return view(*args, **kwargs)
+
+            versions = g.resource_versions = resource_versions(resources)
+            etag, last_modified = validators(versions)
+
+            if not_modified(etag, last_modified):
+                response = make_response('', 304)
+            else:
+                response = make_response(view(*args, **kwargs))
+            if response.status_code not in (200, 304):
+                return response
+            return set_validators(response, etag, last_modified)
+        return wrapper
+    return decorator
+
+
+def init_static_versioning(app):
+    # url_for('static', filename=...) gains ?v=<content hash>, and requests
+    # carrying one are served as immutable for a year.
+    hashes = {}
+
+    def static_hash(filename):
+        path = os.path.join(app.static_folder, filename)
+        try:
+            mtime = os.stat(path).st_mtime
+        except OSError:
+            return None
+
+        cached = hashes.get(filename)
+        if cached is None or cached[0] != mtime:
+            with open(path, 'rb') as f:
+                cached = (mtime, hashlib.sha1(f.read()).hexdigest()[:12])
+            hashes[filename] = cached
+        return cached[1]
+
+    @app.url_defaults
+    def add_static_hash(endpoint, values):
+        if endpoint == 'static' and 'v' not in values and values.get('filename'):
+            digest = static_hash(values['filename'])
+            if digest:
+                values['v'] = digest
+
+    @app.after_request
+    def cache_versioned_static(response):
+        if request.endpoint == 'static' and request.args.get('v') and response.status_code in (200, 304):
+            response.cache_control.public = True
+            response.cache_control.max_age = STATIC_MAX_AGE
+            response.cache_control.immutable = True
+        return response
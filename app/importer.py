@@ -0,0 +1,183 @@
+import csv
+import datetime
+import json
+import re
+
+from sqlalchemy.dialects.sqlite import insert
+
+from app.extensions import db
+from app.http_cache import bump_version
+from app.models import GameDetails, Genre, Platform, game_genres, game_platforms
+
+GAME_FIELDS = ('slug', 'name', 'description', 'metacritic', 'released', 'website')
+# field -> (model, association table, its foreign key column)
+TAG_FIELDS = {
+    'platforms': (Platform, game_platforms, 'platform_id'),
+    'genres': (Genre, game_genres, 'genre_id'),
+}
+
+
+class ImportStats:
+    def __init__(self):
+        self.imported = 0
+        self.skipped = 0
+        self.errors = []
+
+
+def detect_format(path):
+    if path.endswith('.csv'):
+        return 'csv'
+    return 'jsonl'
+
+
+def read_rows(stream, fmt):
+    # Yields (line number, raw row) one at a time so memory stays flat however
+    # large the dump is.
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+        return
+
+    for line_number, line in enumerate(stream, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield line_number, json.loads(line)
+        except ValueError as e:
+            yield line_number, e
+
+
+def _text(value):
+    if value is None:
+        return None
+    value = str(value).strip()
+    return value or None
+
+
+def slugify(name):
+    return re.sub(r'[^a-z0-9]+', '-', name.lower()).strip('-') or name.lower()
+
+
+def _names(value, field):
+    # "PC; Xbox One" (CSV), ["PC", "Xbox One"], or RAWG's
+    # [{"platform": {"name": "PC"}}] / [{"name": "Action"}]
+    if isinstance(value, str):
+        value = value.split(';')
+    if not isinstance(value, list):
+        raise ValueError(f'{field} must be a list')
+
+    names = []
+    for item in value:
+        if isinstance(item, dict):
+            item = item.get('platform') or item
+            if not isinstance(item, dict):
+                raise ValueError(f'{field} entries must be names or objects with a name')
+            item = item.get('name')
+        name = _text(item)
+        if name is None or name in names:
+            continue
+        if len(name) > 60:
+            raise ValueError(f'{field} name too long: {name[:20]!r}...')
+        names.append(name)
+    return names
+
+
+def clean_row(raw):
+    if not isinstance(raw, dict):
+        raise ValueError('row is not an object')
+
+    row = {field: _text(raw.get(field)) for field in GAME_FIELDS}
+
+    if row['slug'] is None:
+        raise ValueError('missing slug')
+    if row['name'] is None:
+        raise ValueError('missing name')
+
+    if row['metacritic'] is not None:
+        try:
+            row['metacritic'] = int(float(row['metacritic']))
+        except (ValueError, OverflowError):
+            raise ValueError(f"invalid metacritic {row['metacritic']!r}") from None
+        if not 0 <= row['metacritic'] <= 100:
+            raise ValueError(f"metacritic out of range: {row['metacritic']}")
+
+    if row['released'] is not None:
+        try:
+            row['released'] = datetime.date.fromisoformat(row['released'])
+        except ValueError:
+            raise ValueError(f"invalid released date {row['released']!r}") from None
+
+    # Absent means "leave this game's links alone"; an empty value clears them
+    for field in TAG_FIELDS:
+        row[field] = _names(raw[field], field) if raw.get(field) is not None else None
+
+    return row
+
+
+def link_tags(rows):
+    # Replaces the platform/genre links of the given (already upserted) games,
+    # creating any platforms and genres not seen before. A handful of
+    # statements per batch, whatever its size.
+    for field, (model, table, column) in TAG_FIELDS.items():
+        tagged = {row['slug']: row[field] for row in rows if row[field] is not None}
+        if not tagged:
+            continue
+
+        names = {slugify(name): name for row_names in tagged.values() for name in row_names}
+        ids = {}
+        if names:
+            db.session.execute(insert(model).on_conflict_do_nothing(index_elements=['slug']),
+                               [dict(slug=slug, name=name) for slug, name in names.items()])
+            ids = dict(db.session.execute(db.select(model.slug, model.id).where(model.slug.in_(names))).all())
+
+        game_ids = dict(db.session.execute(
+            db.select(GameDetails.slug, GameDetails.id).where(GameDetails.slug.in_(tagged))).all())
+        db.session.execute(db.delete(table).where(table.c.game_id.in_(game_ids.values())))
+        links = {(game_ids[slug], ids[slugify(name)]) for slug, row_names in tagged.items() for name in row_names}
+        if links:
+            db.session.execute(table.insert(), [{'game_id': game_id, column: tag_id} for game_id, tag_id in links])
+
+
+def upsert_statement():
+    statement = insert(GameDetails.__table__)
+    return statement.on_conflict_do_update(
+        index_elements=[GameDetails.__table__.c.slug],
+        set_={field: statement.excluded[field] for field in GAME_FIELDS if field != 'slug'},
+    )
+
+
+def import_games(stream, fmt='jsonl', batch_size=1000, on_batch=None, max_errors=10):
+    stats = ImportStats()
+    statement = upsert_statement()
+    batch = []
+
+    def flush():
+        # One executemany per batch, committed so the write lock is held briefly
+        db.session.execute(statement, [{field: row[field] for field in GAME_FIELDS} for row in batch])
+        link_tags(batch)
+        bump_version('games')
+        db.session.commit()
+        stats.imported += len(batch)
+        batch.clear()
+        if on_batch is not None:
+            on_batch(stats)
+
+    for line_number, raw in read_rows(stream, fmt):
+        try:
+            if isinstance(raw, Exception):
+                raise ValueError(f'invalid JSON: {raw}')
+            batch.append(clean_row(raw))
+        except ValueError as e:
+            stats.skipped += 1
+            if len(stats.errors) < max_errors:
+                stats.errors.append(f'line {line_number}: {e}')
+            continue
+
+        if len(batch) >= batch_size:
+            flush()
+
+    if batch:
+        flush()
+    return stats
@@ -0,0 +1,68 @@
+import time
+
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+
+from app.extensions import db
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+def query_budget(limit):
+    # Declares the most SQL statements one request to this view may run.
+    # Place directly under @route so the registered view carries it.
+    def decorator(view):
+        view.query_budget = limit
+        return view
+    return decorator
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context():
+        conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get('query_start')
+    if has_request_context() and starts:
+        g.query_count = g.get('query_count', 0) + 1
+        g.query_time = g.get('query_time', 0.0) + time.perf_counter() - starts.pop()
+
+
+def query_stats():
+    return g.get('query_count', 0), g.get('query_time', 0.0)
+
+
+def install_query_events(app, engine=None):
+    with app.app_context():
+        engine = engine or db.engine
+        if not event.contains(engine, 'after_cursor_execute', _after_cursor_execute):
+            event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+            event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+
+
+def init_instrumentation(app):
+    # Development/test hook: count statements and SQL time per request, report
+    # them in X-Query-Count / X-Query-Time, and hold views to their
+    # @query_budget. Over budget raises under TESTING and logs a warning otherwise.
+    if not app.config['QUERY_INSTRUMENTATION']:
+        return
+
+    install_query_events(app)
+
+    @app.after_request
+    def check_query_budget(response):
+        count, elapsed = query_stats()
+        response.headers['X-Query-Count'] = str(count)
+        response.headers['X-Query-Time'] = f'{elapsed * 1000:.2f}ms'
+
+        view = current_app.view_functions.get(request.endpoint)
+        budget = getattr(view, 'query_budget', None)
+        if budget is not None and count > budget:
+            message = f'{request.method} {request.path} ran {count} queries, budget is {budget}'
+            if current_app.testing:
+                raise QueryBudgetExceeded(message)
+            current_app.logger.warning(message)
+        return response
@@ -0,0 +1,229 @@
+import contextlib
+import datetime
+import os
+import socket
+import threading
+import traceback
+
+from flask import current_app
+
+from app.extensions import db
+from app.models import Job
+
+# kind -> function(payload, progress) returning a JSON-able result
+HANDLERS = {}
+
+
+def handler(kind):
+    def decorator(fn):
+        HANDLERS[kind] = fn
+        return fn
+    return decorator
+
+
+def _now():
+    return datetime.datetime.utcnow()
+
+
+def enqueue(kind, payload=None, max_attempts=None):
+    # Adds the job to the session; it becomes visible to workers when the
+    # caller commits.
+    if kind not in HANDLERS:
+        raise ValueError(f'Unknown job kind: {kind!r}')
+    job = Job(kind=kind, payload=payload or {},
+              max_attempts=max_attempts or current_app.config['JOB_MAX_ATTEMPTS'])
+    db.session.add(job)
+    return job
+
+
+def _owned(job_id, worker):
+    # A job requeue_stale gave up on may be running again elsewhere; the
+    # original run must not write over it.
+    return Job.id == job_id, Job.worker == worker, Job.status == 'running'
+
+
+class Progress:
+    # Passed to each handler: progress(done, total=None) records how far the
+    # job has got, and doubles as the worker's heartbeat.
+    def __init__(self, job_id, worker):
+        self.job_id = job_id
+        self.worker = worker
+
+    def __call__(self, done, total=None):
+        values = dict(progress=done, heartbeat_at=_now())
+        if total is not None:
+            values['total'] = total
+        db.session.execute(db.update(Job).where(*_owned(self.job_id, self.worker)).values(**values))
+        db.session.commit()
+
+
+@contextlib.contextmanager
+def heartbeat(job_id, worker):
+    # Touches heartbeat_at from a side thread while the handler runs, so a
+    # long step that never calls progress() isn't requeued as lost.
+    app = current_app._get_current_object()
+    stop = threading.Event()
+
+    def beat():
+        with app.app_context():
+            while not stop.wait(app.config['JOB_HEARTBEAT_INTERVAL']):
+                try:
+                    with db.engine.begin() as connection:
+                        connection.execute(db.update(Job).where(*_owned(job_id, worker)).values(heartbeat_at=_now()))
+                except Exception:
+                    app.logger.exception('Heartbeat for job %s failed', job_id)
+
+    thread = threading.Thread(target=beat, daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+
+def claim(worker):
+    # One UPDATE picks the oldest due job and marks it running, so two workers
+    # can never take the same one (SQLite serializes writers).
+    now = _now()
+    due = (db.select(Job.id)
+           .where(Job.status == 'queued', Job.run_after <= now)
+           .order_by(Job.run_after, Job.id)
+           .limit(1)
+           .scalar_subquery())
+    row = db.session.execute(
+        db.update(Job)
+        .where(Job.id == due, Job.status == 'queued')
+        .values(status='running', attempts=Job.attempts + 1, worker=worker, started_at=now, heartbeat_at=now)
+        .returning(Job.id, Job.kind, Job.payload, Job.attempts, Job.max_attempts)).first()
+    db.session.commit()
+    return row
+
+
+def requeue_stale(timeout=None):
+    # Jobs whose worker died mid-run: retry them if they have attempts left
+    timeout = current_app.config['JOB_TIMEOUT'] if timeout is None else timeout
+    stale = (Job.status == 'running', Job.heartbeat_at < _now() - datetime.timedelta(seconds=timeout))
+    error = 'worker stopped responding'
+    failed = db.session.execute(db.update(Job).where(*stale, Job.attempts >= Job.max_attempts)
+                                .values(status='failed', error=error, finished_at=_now())).rowcount
+    requeued = db.session.execute(db.update(Job).where(*stale)
+                                  .values(status='queued', error=error, worker=None)).rowcount
+    db.session.commit()
+    return requeued + failed
+
+
+def run_job(row, worker):
+    # Returns True when the job finished, False when it failed (and was
+    # either rescheduled or given up on).
+    try:
+        with heartbeat(row.id, worker):
+            result = HANDLERS[row.kind](row.payload, Progress(row.id, worker))
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.exception('Job %s (%s) failed, attempt %s of %s', row.id, row.kind,
+                                     row.attempts, row.max_attempts)
+        error = ''.join(traceback.format_exception_only(type(e), e)).strip()
+        if row.attempts < row.max_attempts:
+            delay = current_app.config['JOB_RETRY_DELAY'] * 2 ** (row.attempts - 1)
+            values = dict(status='queued', error=error, worker=None,
+                          run_after=_now() + datetime.timedelta(seconds=delay))
+        else:
+            values = dict(status='failed', error=error, finished_at=_now())
+        _finish(row, worker, values)
+        return False
+
+    _finish(row, worker, dict(status='done', result=result, error=None, finished_at=_now()))
+    return True
+
+
+def _finish(row, worker, values):
+    if not db.session.execute(db.update(Job).where(*_owned(row.id, worker)).values(**values)).rowcount:
+        current_app.logger.warning('Job %s (%s) was requeued while running; keeping the newer run',
+                                   row.id, row.kind)
+    db.session.commit()
+
+
+def work(app, burst=False, stop=None, on_job=None):
+    # Claims and runs jobs until `stop` is set, or until none are due when
+    # `burst` is true. Returns the number of jobs run.
+    stop = stop or threading.Event()
+    worker = f'{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}'
+    count = 0
+    with app.app_context():
+        while not stop.is_set():
+            row = claim(worker)
+            if row is None:
+                if burst:
+                    break
+                requeue_stale()
+                stop.wait(app.config['JOB_POLL_INTERVAL'])
+                continue
+
+            ok = run_job(row, worker)
+            count += 1
+            if on_job is not None:
+                on_job(row, ok)
+            db.session.remove()
+    return count
+
+
+def run_worker(app, concurrency=1, burst=False, stop=None, on_job=None):
+    # `concurrency` threads each claim and run one job at a time
+    stop = stop or threading.Event()
+    if concurrency <= 1:
+        return work(app, burst, stop, on_job)
+
+    counts = []
+    threads = [threading.Thread(target=lambda: counts.append(work(app, burst, stop, on_job)), daemon=True)
+               for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    try:
+        for thread in threads:
+            while thread.is_alive():
+                thread.join(0.5)
+    finally:
+        stop.set()
+    return sum(counts)
+
+
+@handler('import-games')
+def import_games_job(payload, progress):
+    from app.importer import detect_format, import_games
+
+    path = payload['path']
+    with open(path, newline='', encoding='utf-8') as stream:
+        stats = import_games(stream, payload.get('format') or detect_format(path),
+                             payload.get('batch_size') or current_app.config['IMPORT_BATCH_SIZE'],
+                             on_batch=lambda stats: progress(stats.imported + stats.skipped))
+    progress(stats.imported + stats.skipped, stats.imported + stats.skipped)
+    if payload.get('remove'):
+        os.remove(path)
+    return dict(imported=stats.imported, skipped=stats.skipped, errors=stats.errors)
+
+
+@handler('reindex-search')
+def reindex_search_job(payload, progress):
+    from app.search import rebuild_search_index
+
+    with db.engine.begin() as connection:
+        rebuild_search_index(connection)
+
+
+@handler('rebuild-stats')
+def rebuild_stats_job(payload, progress):
+    from app.http_cache import bump_version
+    from app.stats import rebuild_stats
+
+    with db.engine.begin() as connection:
+        rebuild_stats(connection)
+    bump_version('movies', 'games')
+    db.session.commit()
+
+
+@handler('sweep-sessions')
+def sweep_sessions_job(payload, progress):
+    # Only meaningful for stores shared with the worker (SESSION_BACKEND = "sqlite")
+    store = getattr(current_app.session_interface, 'store', None)
+    return dict(swept=store.sweep() if store is not None else 0)
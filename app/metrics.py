@@ -0,0 +1,141 @@
+import threading
+import time
+
+from flask import before_render_template, current_app, g, request, template_rendered
+
+from app.extensions import limiter
+from app.instrumentation import install_query_events, query_stats
+
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+PHASES = ('total', 'handler', 'sql', 'render', 'hashing', 'ratelimit')
+
+
+class Histograms:
+    # Per-process latency histograms keyed by (endpoint, phase). With several
+    # gunicorn workers each exposes its own counts; sum them when scraping.
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self._data = {}
+        self._queries = {}
+        self._lock = threading.Lock()
+
+    def observe(self, endpoint, phase, seconds):
+        with self._lock:
+            entry = self._data.get((endpoint, phase))
+            if entry is None:
+                entry = self._data[(endpoint, phase)] = [[0] * len(self.buckets), 0.0, 0]
+            for index, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    entry[0][index] += 1
+            entry[1] += seconds
+            entry[2] += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._queries.clear()
+
+    def count_queries(self, endpoint, count):
+        with self._lock:
+            self._queries[endpoint] = self._queries.get(endpoint, 0) + count
+
+    def render(self):
+        lines = [
+            '# HELP watchlist_request_duration_seconds Request latency split by phase.',
+            '# TYPE watchlist_request_duration_seconds histogram',
+        ]
+        with self._lock:
+            for (endpoint, phase), (buckets, total, count) in sorted(self._data.items()):
+                labels = f'endpoint="{endpoint}",phase="{phase}"'
+                for bound, bucket in zip(self.buckets, buckets):
+                    lines.append(f'watchlist_request_duration_seconds_bucket{{{labels},le="{bound}"}} {bucket}')
+                lines.append(f'watchlist_request_duration_seconds_bucket{{{labels},le="+Inf"}} {count}')
+                lines.append(f'watchlist_request_duration_seconds_sum{{{labels}}} {total:.6f}')
+                lines.append(f'watchlist_request_duration_seconds_count{{{labels}}} {count}')
+
+            lines += [
+                '# HELP watchlist_sql_queries_total SQL statements executed, by endpoint.',
+                '# TYPE watchlist_sql_queries_total counter',
+            ]
+            lines += [f'watchlist_sql_queries_total{{endpoint="{endpoint}"}} {count}'
+                      for endpoint, count in sorted(self._queries.items())]
+        return lines
+
+
+def _fragment_cache_lines(cache):
+    stats = cache.stats()
+    return [
+        '# TYPE watchlist_fragment_cache_hits_total counter',
+        f'watchlist_fragment_cache_hits_total {stats["hits"]}',
+        '# TYPE watchlist_fragment_cache_misses_total counter',
+        f'watchlist_fragment_cache_misses_total {stats["misses"]}',
+        '# TYPE watchlist_fragment_cache_evictions_total counter',
+        f'watchlist_fragment_cache_evictions_total {stats["evictions"]}',
+        '# TYPE watchlist_fragment_cache_bytes gauge',
+        f'watchlist_fragment_cache_bytes {stats["bytes"]}',
+    ]
+
+
+def add_time(name, seconds):
+    setattr(g, name, g.get(name, 0.0) + seconds)
+
+
+def init_metrics(app):
+    # Call after limiter.init_app: the start hook is put ahead of the limiter's
+    # before_request and the second hook after it, so the gap is its overhead.
+    if not app.config['METRICS_ENABLED']:
+        return
+
+    histograms = app.extensions['metrics'] = Histograms()
+    install_query_events(app)
+
+    def start_request():
+        g.request_start = time.perf_counter()
+
+    def ratelimit_checked():
+        add_time('ratelimit_time', time.perf_counter() - g.request_start)
+
+    app.before_request_funcs.setdefault(None, []).insert(0, start_request)
+    app.before_request(ratelimit_checked)
+
+    def render_started(sender, template, context, **extra):
+        g.render_start = time.perf_counter()
+
+    def render_finished(sender, template, context, **extra):
+        if 'render_start' in g:
+            add_time('render_time', time.perf_counter() - g.pop('render_start'))
+
+    before_render_template.connect(render_started, app, weak=False)
+    template_rendered.connect(render_finished, app, weak=False)
+
+    @app.after_request
+    def record_timing(response):
+        if 'request_start' not in g:
+            return response
+
+        total = time.perf_counter() - g.request_start
+        count, sql = query_stats()
+        phases = dict(
+            total=total,
+            sql=sql,
+            render=g.get('render_time', 0.0),
+            hashing=g.get('hash_time', 0.0),
+            ratelimit=g.get('ratelimit_time', 0.0),
+        )
+        phases['handler'] = max(total - sum(value for name, value in phases.items() if name != 'total'), 0.0)
+
+        endpoint = request.endpoint or 'unmatched'
+        for phase in PHASES:
+            histograms.observe(endpoint, phase, phases[phase])
+        histograms.count_queries(endpoint, count)
+
+        if current_app.config['SERVER_TIMING_ENABLED']:
+            response.headers['Server-Timing'] = ', '.join(
+                f'{phase};dur={phases[phase] * 1000:.2f}' for phase in PHASES)
+        return response
+
+    def metrics():
+        lines = histograms.render() + _fragment_cache_lines(app.extensions['fragment_cache'])
+        return '\n'.join(lines) + '\n', 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+
+    app.add_url_rule('/metrics', 'metrics', limiter.exempt(metrics))
@@ -0,0 +1,311 @@
+import datetime
+
+import sqlalchemy as sa
+from flask import current_app, has_app_context
+
+from app.extensions import db
+from app.search import install_search_index
+from app.stats import install_stats, rebuild_stats
+from app.watchlist import install_watchlist_triggers
+
+# Applied versions live outside db.metadata so create_all/drop_all of the
+# app tables never touch them.
+schema_metadata = sa.MetaData()
+schema_version = sa.Table(
+    'schema_version', schema_metadata,
+    sa.Column('version', sa.Integer, primary_key=True),
+    sa.Column('name', sa.String(100), nullable=False),
+    sa.Column('applied_at', sa.DateTime, nullable=False),
+)
+
+# (version, name, function(connection)) in order. A fresh database gets the
+# current models from create_all and is stamped at head, so migrations only
+# ever run against databases that already hold data. Each one receives a
+# connection it may commit on as it goes (for chunked copies); the version
+# row is recorded and committed after it returns.
+MIGRATIONS = []
+
+
+def migration(version, name):
+    def decorator(fn):
+        MIGRATIONS.append((version, name, fn))
+        MIGRATIONS.sort(key=lambda entry: entry[0])
+        return fn
+    return decorator
+
+
+@migration(1, 'baseline')
+def baseline(connection):
+    # Databases from before versioning had their tables made by create_app()
+    # on boot; fill in anything missing and take them as version 1.
+    db.metadata.create_all(connection)
+
+
+def _batch_size():
+    return current_app.config['MIGRATION_BATCH_SIZE'] if has_app_context() else 5000
+
+
+def _column_type(connection, table, column):
+    for row in connection.exec_driver_sql(f'PRAGMA table_info({table})'):
+        if row[1] == column:
+            return row[2].upper()
+    return None
+
+
+def id_batches(connection, table, batch_size=None):
+    # Yields WHERE clauses covering `table` in id order, batch_size rows each
+    batch_size = batch_size or _batch_size()
+    last = None
+    while True:
+        where = '' if last is None else f'WHERE id > {last}'
+        upper = connection.exec_driver_sql(
+            f'SELECT max(id) FROM (SELECT id FROM {table} {where} ORDER BY id LIMIT {int(batch_size)})').scalar()
+        if upper is None:
+            return
+        yield f'id <= {upper}' if last is None else f'id > {last} AND id <= {upper}'
+        last = upper
+
+
+def _begin_immediate(connection):
+    # pysqlite only opens a transaction before INSERT/UPDATE/DELETE, so DDL
+    # would otherwise commit statement by statement.
+    connection.exec_driver_sql('BEGIN IMMEDIATE')
+
+
+def rebuild_table(connection, table, expressions, batch_size=None):
+    # SQLite can't change a column's type in place, so build the new layout
+    # alongside the old one and swap. Triggers mirror writes into the shadow
+    # table while rows are copied across in id order, one committed batch at a
+    # time, so readers (WAL) are never blocked and writers only wait out a
+    # single batch. Dropping the old table and renaming the shadow happen in
+    # one transaction left open for the caller to commit with the version
+    # record, so a failure (say, a unique index the old rows violate) leaves
+    # the old table untouched.
+    #
+    # `table` describes the new layout, keyed on an integer `id`; `expressions`
+    # maps a column name to the SQL computing it from the old row.
+    batch_size = batch_size or _batch_size()
+    name = table.name
+    shadow = f'_{name}_rebuild'
+    columns = ', '.join(column.name for column in table.columns)
+    select = f"SELECT {', '.join(expressions.get(column.name, column.name) for column in table.columns)} FROM {name}"
+
+    for suffix in ('insert', 'update', 'delete'):
+        connection.exec_driver_sql(f'DROP TRIGGER IF EXISTS {shadow}_{suffix}')
+    connection.exec_driver_sql(f'DROP TABLE IF EXISTS {shadow}')
+    connection.execute(sa.schema.CreateTable(table.to_metadata(sa.MetaData(), name=shadow)))
+    connection.exec_driver_sql(f'''
+        CREATE TRIGGER {shadow}_insert AFTER INSERT ON {name} BEGIN
+            INSERT OR REPLACE INTO {shadow} ({columns}) {select} WHERE id = new.id;
+        END''')
+    connection.exec_driver_sql(f'''
+        CREATE TRIGGER {shadow}_update AFTER UPDATE ON {name} BEGIN
+            DELETE FROM {shadow} WHERE id = old.id;
+            INSERT OR REPLACE INTO {shadow} ({columns}) {select} WHERE id = new.id;
+        END''')
+    connection.exec_driver_sql(f'''
+        CREATE TRIGGER {shadow}_delete AFTER DELETE ON {name} BEGIN
+            DELETE FROM {shadow} WHERE id = old.id;
+        END''')
+    connection.commit()
+
+    # Rows the triggers already wrote are newer than this copy; keep them
+    for where in id_batches(connection, name, batch_size):
+        connection.exec_driver_sql(f'INSERT OR IGNORE INTO {shadow} ({columns}) {select} WHERE {where}')
+        connection.commit()
+
+    _begin_immediate(connection)
+    for suffix in ('insert', 'update', 'delete'):
+        connection.exec_driver_sql(f'DROP TRIGGER {shadow}_{suffix}')
+    connection.exec_driver_sql(f'DROP TABLE {name}')
+    connection.exec_driver_sql(f'ALTER TABLE {shadow} RENAME TO {name}')
+    for index in table.indexes:
+        index.create(connection)
+
+
+# Layouts as of the migrations below; the models may move on from these
+MOVIE_V2 = sa.Table(
+    'movie', sa.MetaData(),
+    sa.Column('id', sa.Integer, primary_key=True),
+    sa.Column('title', sa.String(60)),
+    sa.Column('year', sa.Integer),
+    sa.Index('ix_movie_title', 'title'),
+)
+
+GAME_DETAILS_V3 = sa.Table(
+    'game_details', sa.MetaData(),
+    sa.Column('id', sa.Integer, primary_key=True),
+    sa.Column('slug', sa.String),
+    sa.Column('name', sa.String),
+    sa.Column('description', sa.String),
+    sa.Column('metacritic', sa.Integer),
+    sa.Column('released', sa.Date),
+    sa.Column('website', sa.String),
+    sa.Index('ix_game_details_slug', 'slug', unique=True),
+    sa.Index('ix_game_details_metacritic_id', 'metacritic', 'id'),
+    sa.Index('ix_game_details_released_id', 'released', 'id'),
+)
+
+
+@migration(2, 'movie.year as integer, index movie.title')
+def movie_year_integer(connection):
+    if _column_type(connection, 'movie', 'year') == 'INTEGER':
+        for index in MOVIE_V2.indexes:
+            index.create(connection, checkfirst=True)
+        return
+
+    # Anything that isn't a four digit year becomes NULL
+    rebuild_table(connection, MOVIE_V2, dict(
+        year="CASE WHEN trim(year) GLOB '[0-9][0-9][0-9][0-9]' THEN CAST(trim(year) AS INTEGER) END",
+    ))
+    install_search_index(connection)
+
+
+def _dedupe_slugs(connection):
+    # Slugs weren't always unique; the first game keeps its slug and later
+    # ones get their id appended, so ix_game_details_slug can be built.
+    connection.exec_driver_sql(
+        "UPDATE game_details SET slug = slug || '-' || id WHERE slug IS NOT NULL AND id NOT IN "
+        "(SELECT min(id) FROM game_details WHERE slug IS NOT NULL GROUP BY slug)")
+
+
+@migration(3, 'game_details.released as date')
+def game_released_date(connection):
+    if _column_type(connection, 'game_details', 'released') == 'DATE':
+        # Already converted, e.g. by a run that failed before recording it
+        _begin_immediate(connection)
+        _dedupe_slugs(connection)
+        for index in GAME_DETAILS_V3.indexes:
+            index.create(connection, checkfirst=True)
+        install_search_index(connection)
+        return
+
+    _dedupe_slugs(connection)
+    connection.commit()
+    # SQLAlchemy stores dates as ISO text on SQLite; keep the date part of
+    # anything ISO-shaped and drop free-form values that can't be ranged over.
+    rebuild_table(connection, GAME_DETAILS_V3, dict(
+        released="CASE WHEN released GLOB '[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9]*' "
+                 "THEN date(substr(released, 1, 10)) END",
+    ))
+    install_search_index(connection)
+
+
+@migration(4, 'catalog_stats summary table')
+def catalog_stats(connection):
+    from app.models import CatalogStat
+
+    CatalogStat.__table__.create(connection, checkfirst=True)
+    install_stats(connection)
+    rebuild_stats(connection)
+
+
+@migration(5, 'per-user watchlists')
+def watchlists(connection):
+    # The movie list used to be one shared list: it becomes the admin's
+    # (first user's) watchlist.
+    from app.models import WatchlistEntry
+
+    WatchlistEntry.__table__.create(connection, checkfirst=True)
+    install_watchlist_triggers(connection)
+    connection.commit()
+
+    admin_id = connection.exec_driver_sql('SELECT min(id) FROM user').scalar()
+    if admin_id is None:
+        return
+
+    now = datetime.datetime.utcnow().isoformat(sep=' ')
+    for where in id_batches(connection, 'movie'):
+        connection.exec_driver_sql(
+            'INSERT OR IGNORE INTO watchlist_entry (user_id, movie_id, title, year, status, added_at) '
+            f"SELECT ?, id, title, year, 'planned', ? FROM movie WHERE {where}", (admin_id, now))
+        connection.commit()
+
+
+@migration(6, 'background job queue')
+def job_queue(connection):
+    from app.models import Job
+
+    Job.__table__.create(connection, checkfirst=True)
+
+
+@migration(7, 'game platforms and genres')
+def game_platforms(connection):
+    from app.models import Genre, Platform, game_genres, game_platforms
+
+    # Older databases may hold a game_platforms table scraped with some other
+    # layout; keep it aside rather than guess at its columns.
+    columns = {row[1] for row in connection.exec_driver_sql('PRAGMA table_info(game_platforms)')}
+    if columns and 'platform_id' not in columns:
+        connection.exec_driver_sql('ALTER TABLE game_platforms RENAME TO game_platforms_legacy')
+
+    for table in (Platform.__table__, Genre.__table__, game_platforms, game_genres):
+        table.create(connection, checkfirst=True)
+
+
+def head():
+    return MIGRATIONS[-1][0] if MIGRATIONS else 0
+
+
+def applied_versions(connection):
+    if not sa.inspect(connection).has_table('schema_version'):
+        return set()
+    return set(connection.execute(sa.select(schema_version.c.version)).scalars())
+
+
+def current_version(connection):
+    return max(applied_versions(connection), default=0)
+
+
+def _record(connection, version, name):
+    connection.execute(schema_version.insert().values(
+        version=version, name=name, applied_at=datetime.datetime.utcnow()))
+
+
+def stamp(connection, version=None):
+    version = head() if version is None else version
+    schema_metadata.create_all(connection)
+    done = applied_versions(connection)
+    for number, name, fn in MIGRATIONS:
+        if number <= version and number not in done:
+            _record(connection, number, name)
+
+
+def create_schema(engine):
+    with engine.begin() as connection:
+        db.metadata.create_all(connection)
+        stamp(connection)
+
+
+def drop_schema(engine):
+    with engine.begin() as connection:
+        db.metadata.drop_all(connection)
+        schema_metadata.drop_all(connection)
+
+
+def upgrade(engine, target=None, on_migration=None):
+    # Returns the (version, name) pairs applied, in order.
+    target = head() if target is None else target
+
+    with engine.connect() as connection:
+        if not sa.inspect(connection).get_table_names():
+            connection.rollback()
+            create_schema(engine)
+            return [(version, name) for version, name, fn in MIGRATIONS]
+
+        schema_metadata.create_all(connection)
+        connection.commit()
+
+        applied = []
+        done = applied_versions(connection)
+        connection.rollback()
+        for version, name, fn in MIGRATIONS:
+            if version in done or version > target:
+                continue
+            if on_migration is not None:
+                on_migration(version, name)
+            fn(connection)
+            _record(connection, version, name)
+            connection.commit()
+            applied.append((version, name))
+        return applied
@@ -1,6 +1,8 @@
+import datetime
+
 from flask_login import UserMixin
-from werkzeug.security import generate_password_hash, check_password_hash
 from app.extensions import db
+from app.hashing import password_hasher
 
 class User(db.Model, UserMixin):  
     id = db.Column(db.Integer, primary_key=True) 
@@ -9,27 +11,113 @@ class User(db.Model, UserMixin):
     password_hash = db.Column(db.String(128))
 
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = password_hasher().hash(password)
     
     def validate_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        return password_hasher().verify(self.password_hash, password)
+
+    def password_needs_rehash(self):
+        return password_hasher().needs_rehash(self.password_hash)
 
 class Movie(db.Model): 
     __tablename__ = "movie"
     id = db.Column(db.Integer, primary_key=True) 
-    title = db.Column(db.String(60))  
-    year = db.Column(db.String(4))
+    title = db.Column(db.String(60), index=True)
+    year = db.Column(db.Integer)
+
+game_platforms = db.Table(
+    'game_platforms',
+    db.Column('game_id', db.Integer, db.ForeignKey('game_details.id', ondelete='CASCADE'), primary_key=True),
+    db.Column('platform_id', db.Integer, db.ForeignKey('platform.id', ondelete='CASCADE'), primary_key=True),
+    db.Index('ix_game_platforms_platform_game', 'platform_id', 'game_id'),
+)
+
+game_genres = db.Table(
+    'game_genres',
+    db.Column('game_id', db.Integer, db.ForeignKey('game_details.id', ondelete='CASCADE'), primary_key=True),
+    db.Column('genre_id', db.Integer, db.ForeignKey('genre.id', ondelete='CASCADE'), primary_key=True),
+    db.Index('ix_game_genres_genre_game', 'genre_id', 'game_id'),
+)
+
+class Platform(db.Model):
+    __tablename__ = "platform"
+    id = db.Column(db.Integer, primary_key=True)
+    slug = db.Column(db.String(60), unique=True, nullable=False)
+    name = db.Column(db.String(60), nullable=False)
+
+class Genre(db.Model):
+    __tablename__ = "genre"
+    id = db.Column(db.Integer, primary_key=True)
+    slug = db.Column(db.String(60), unique=True, nullable=False)
+    name = db.Column(db.String(60), nullable=False)
 
 class GameDetails(db.Model):
     __tablename__ = "game_details"
+    __table_args__ = (
+        db.Index('ix_game_details_metacritic_id', 'metacritic', 'id'),
+        db.Index('ix_game_details_released_id', 'released', 'id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
-    slug = db.Column(db.String)
+    slug = db.Column(db.String, unique=True, index=True)
     name = db.Column(db.String)
     description = db.Column(db.String)
     metacritic = db.Column(db.Integer)
-    released = db.Column(db.String)
+    released = db.Column(db.Date)
     website = db.Column(db.String)
+    # Lists load these with selectinload (see games_statement); touching them
+    # on a single game is one lazy SELECT each.
+    platforms = db.relationship(Platform, secondary=game_platforms, order_by=Platform.name)
+    genres = db.relationship(Genre, secondary=game_genres, order_by=Genre.name)
+
+class ResourceVersion(db.Model):
+    __tablename__ = "resource_version"
+    name = db.Column(db.String(30), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.datetime.utcnow)
+
+class WatchlistEntry(db.Model):
+    # One title on one user's list. Title and year are copied from the movie
+    # or game (and kept in step by triggers, see app/watchlist.py) so a list
+    # page reads nothing but this table's (user_id, added_at, id) range.
+    __tablename__ = "watchlist_entry"
+    __table_args__ = (
+        db.Index('ix_watchlist_entry_user_added', 'user_id', 'added_at', 'id'),
+        db.Index('ix_watchlist_entry_movie_user', 'movie_id', 'user_id', unique=True),
+        db.Index('ix_watchlist_entry_game_user', 'game_id', 'user_id', unique=True),
+        db.CheckConstraint('(movie_id IS NULL) != (game_id IS NULL)', name='ck_watchlist_entry_one_title'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    movie_id = db.Column(db.Integer, db.ForeignKey('movie.id'))
+    game_id = db.Column(db.Integer, db.ForeignKey('game_details.id'))
+    status = db.Column(db.String(10), nullable=False, default='planned')
+    added_at = db.Column(db.DateTime, nullable=False, default=datetime.datetime.utcnow)
+    title = db.Column(db.String)
+    year = db.Column(db.Integer)
+
+class CatalogStat(db.Model):
+    # Row counts per bucket, kept current by triggers (see app/stats.py)
+    __tablename__ = "catalog_stats"
+    kind = db.Column(db.String(20), primary_key=True)
+    bucket = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    count = db.Column(db.Integer, nullable=False, default=0)
 
-# class GamesPlatforms(db.Model):
-#     __table__ = db.Table("game_platforms", db.metadata, autoload_with=db.engine)
-    
\ No newline at end of file
+class Job(db.Model):
+    # Background work run by `flask worker` (see app/jobs.py)
+    __table_args__ = (db.Index('ix_job_status_run_after', 'status', 'run_after', 'id'),)
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(40), nullable=False)
+    payload = db.Column(db.JSON, nullable=False, default=dict)
+    status = db.Column(db.String(10), nullable=False, default='queued')
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=3)
+    progress = db.Column(db.Integer, nullable=False, default=0)
+    total = db.Column(db.Integer)
+    result = db.Column(db.JSON)
+    error = db.Column(db.Text)
+    worker = db.Column(db.String(100))
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.datetime.utcnow)
+    run_after = db.Column(db.DateTime, nullable=False, default=datetime.datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    heartbeat_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
@@ -0,0 +1,184 @@
+import base64
+import datetime
+import json
+
+from sqlalchemy.orm import selectinload
+
+from app.extensions import db
+from app.models import GameDetails, Movie
+from app.stats import total_statement
+
+# Sort name -> keyset columns. Non-id sorts run newest/best first and skip NULLs,
+# which keeps every page a single range scan over the matching index.
+GAME_SORTS = {
+    'id': (GameDetails.id,),
+    'metacritic': (GameDetails.metacritic, GameDetails.id),
+    'released': (GameDetails.released, GameDetails.id),
+}
+
+
+class KeysetPage:
+    # Fetches per_page + 1 rows; the extra row only tells us there is a next page.
+    # Iterating yields rows as they come off the cursor, so a streamed template
+    # can render next_cursor after its loop.
+    def __init__(self, result, per_page, cursor_for):
+        self.result = result
+        self.per_page = per_page
+        self.cursor_for = cursor_for
+        self.next_cursor = None
+        self._items = None
+
+    def __iter__(self):
+        if self._items is not None:
+            return iter(self._items)
+        return self._iterate()
+
+    def _iterate(self):
+        last = None
+        for index, item in enumerate(self.result):
+            if index == self.per_page:
+                self.next_cursor = self.cursor_for(last)
+                break
+            last = item
+            yield item
+        if hasattr(self.result, 'close'):
+            self.result.close()
+
+    def load(self):
+        if self._items is None:
+            self._items = list(self._iterate())
+        return self
+
+    def __len__(self):
+        return len(self.load()._items)
+
+
+def encode_cursor(values):
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except (ValueError, TypeError) as e:
+        raise ValueError(f'Invalid cursor: {cursor!r}') from e
+    if not isinstance(values, list):
+        raise ValueError(f'Invalid cursor: {cursor!r}')
+    return values
+
+
+def movies_statement():
+    return db.select(Movie).order_by(Movie.id)
+
+
+def movie_count_statement():
+    # Summed from catalog_stats, a row per year, rather than counting movies
+    return total_statement('movie_year')
+
+
+def movie_count():
+    return db.session.execute(movie_count_statement()).scalar_one()
+
+
+def movie_page_statement(after=None, per_page=50):
+    statement = movies_statement().limit(per_page + 1)
+    if after is not None:
+        statement = statement.where(Movie.id > after)
+    return statement
+
+
+def movie_cursor(movie):
+    return movie.id
+
+
+def movie_page(after=None, per_page=50, stream=False):
+    statement = movie_page_statement(after, per_page)
+    if stream:
+        statement = statement.execution_options(yield_per=per_page)
+
+    result = db.session.execute(statement).scalars()
+    page = KeysetPage(result, per_page, movie_cursor)
+    return page if stream else page.load()
+
+
+def games_statement(sort='id', year_from=None, year_to=None):
+    if sort not in GAME_SORTS:
+        raise ValueError(f'Unknown sort: {sort!r}')
+
+    columns = GAME_SORTS[sort]
+    # Two batched SELECTs (WHERE game_id IN ...) fill platforms and genres for
+    # the whole page, however many rows it has.
+    statement = db.select(GameDetails).options(selectinload(GameDetails.platforms),
+                                               selectinload(GameDetails.genres))
+
+    if sort == 'id':
+        statement = statement.order_by(GameDetails.id)
+    else:
+        statement = statement.where(columns[0].isnot(None)).order_by(*(column.desc() for column in columns))
+
+    if year_from is not None:
+        statement = statement.where(GameDetails.released >= datetime.date(year_from, 1, 1))
+    if year_to is not None:
+        statement = statement.where(GameDetails.released <= datetime.date(year_to, 12, 31))
+    return statement
+
+
+def game_count_statement(year_from=None, year_to=None, sort='id'):
+    # Counts the rows games_statement lists: sorting by released or
+    # metacritic leaves out games where it's NULL (the unknown bucket).
+    if sort == 'metacritic':
+        if year_from is None and year_to is None:
+            return total_statement('game_metacritic', 0)
+        # No summary counts both at once
+        return db.select(db.func.count()).select_from(
+            games_statement(sort, year_from, year_to).order_by(None).subquery())
+    if year_from is None and year_to is None:
+        return total_statement('game_year', 0 if sort == 'released' else None)
+    # Year buckets line up with the year filters; 0 skips the unknown bucket
+    return total_statement('game_year', year_from if year_from is not None else 0, year_to)
+
+
+def game_count(year_from=None, year_to=None, sort='id'):
+    return db.session.execute(game_count_statement(year_from, year_to, sort)).scalar_one()
+
+
+def game_page_statement(sort='id', after=None, year_from=None, year_to=None, per_page=20):
+    columns = GAME_SORTS.get(sort)
+    statement = games_statement(sort, year_from, year_to).limit(per_page + 1)
+
+    if after is not None:
+        values = decode_cursor(after)
+        if len(values) != len(columns):
+            raise ValueError(f'Invalid cursor: {after!r}')
+        # Every keyset column is an integer except released, an ISO date
+        for index, column in enumerate(columns):
+            if column is GameDetails.released:
+                try:
+                    values[index] = datetime.date.fromisoformat(values[index])
+                except TypeError:
+                    raise ValueError(f'Invalid cursor: {after!r}') from None
+            elif type(values[index]) is not int:
+                raise ValueError(f'Invalid cursor: {after!r}')
+        if sort == 'id':
+            statement = statement.where(GameDetails.id > values[0])
+        else:
+            statement = statement.where(db.tuple_(*columns) < db.tuple_(*values))
+    return statement
+
+
+def game_cursor(sort):
+    columns = GAME_SORTS[sort]
+    def cursor(game):
+        values = [getattr(game, column.key) for column in columns]
+        return encode_cursor([value.isoformat() if isinstance(value, datetime.date) else value for value in values])
+    return cursor
+
+
+def game_page(sort='id', after=None, year_from=None, year_to=None, per_page=20, stream=False):
+    statement = game_page_statement(sort, after, year_from, year_to, per_page)
+    if stream:
+        statement = statement.execution_options(yield_per=per_page)
+
+    result = db.session.execute(statement).scalars()
+    page = KeysetPage(result, per_page, game_cursor(sort))
+    return page if stream else page.load()
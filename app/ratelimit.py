@@ -0,0 +1,79 @@
+import sqlite3
+import time
+
+from limits.storage import Storage
+from sqlalchemy.engine import make_url
+
+from app.sqlite import ThreadConnections
+
+
+class SQLiteStorage(Storage):
+    # Shared counter storage for Flask-Limiter (fixed-window strategies). Every
+    # gunicorn worker that points at the same file sees the same counters, and
+    # expired windows are swept so the table doesn't grow with every client IP.
+    #
+    #     RATELIMIT_STORAGE_URI = "sqlite:////var/lib/watchlist/ratelimit.db"
+    STORAGE_SCHEME = ['sqlite']
+    SWEEP_EVERY = 1000
+
+    def __init__(self, uri, wrap_exceptions=False, **options):
+        self.path = make_url(uri).database
+        self.timeout = float(options.get('timeout', 5))
+        self._connection = ThreadConnections(self.path, self.timeout, options.get('pragmas'))
+        self._calls = 0
+        super().__init__(uri, wrap_exceptions=wrap_exceptions, **options)
+
+        self._connection().execute(
+            'CREATE TABLE IF NOT EXISTS ratelimit ('
+            ' key TEXT PRIMARY KEY,'
+            ' count INTEGER NOT NULL,'
+            ' expires_at REAL NOT NULL)')
+
+    @property
+    def base_exceptions(self):
+        return sqlite3.Error
+
+    def incr(self, key, expiry, elastic_expiry=False, amount=1):
+        now = time.time()
+        connection = self._connection()
+        # A single upsert is atomic across processes: an expired window restarts
+        # at `amount`, a live one is incremented in place.
+        count = connection.execute(
+            'INSERT INTO ratelimit (key, count, expires_at) VALUES (:key, :amount, :expires_at) '
+            'ON CONFLICT (key) DO UPDATE SET '
+            ' count = CASE WHEN expires_at <= :now THEN :amount ELSE count + :amount END, '
+            ' expires_at = CASE WHEN expires_at <= :now OR :elastic THEN :expires_at ELSE expires_at END '
+            'RETURNING count',
+            dict(key=key, amount=amount, expires_at=now + expiry, now=now, elastic=bool(elastic_expiry)),
+        ).fetchone()[0]
+
+        self._calls += 1
+        if self._calls % self.SWEEP_EVERY == 0:
+            self.sweep(now)
+        return count
+
+    def get(self, key):
+        row = self._connection().execute(
+            'SELECT count FROM ratelimit WHERE key = ? AND expires_at > ?', (key, time.time())).fetchone()
+        return row[0] if row else 0
+
+    def get_expiry(self, key):
+        row = self._connection().execute('SELECT expires_at FROM ratelimit WHERE key = ?', (key,)).fetchone()
+        return int(row[0]) if row else int(time.time())
+
+    def check(self):
+        try:
+            self._connection().execute('SELECT 1')
+            return True
+        except sqlite3.Error:
+            return False
+
+    def reset(self):
+        return self._connection().execute('DELETE FROM ratelimit').rowcount
+
+    def clear(self, key):
+        self._connection().execute('DELETE FROM ratelimit WHERE key = ?', (key,))
+
+    def sweep(self, now=None):
+        return self._connection().execute(
+            'DELETE FROM ratelimit WHERE expires_at <= ?', (now or time.time(),)).rowcount
@@ -1,15 +1,30 @@
-from flask import Blueprint, flash, has_request_context, redirect, render_template, request, url_for
+import os
+import uuid
+
+from flask import Blueprint, abort, current_app, flash, get_flashed_messages, has_request_context, jsonify, redirect, render_template, request, stream_template, url_for
 from flask_login import current_user, login_required, login_user, logout_user
 from flask_limiter import Limiter
 from markupsafe import escape
-from app.forms import AddMovieForm, DeleteMovieForm, LoginForm, SettingsForm, SignupForm
-from app.models import GameDetails, Movie, User
+from werkzeug.exceptions import HTTPException
+from app.forms import AddMovieForm, DeleteMovieForm, ImportGamesForm, JobForm, LoginForm, SettingsForm, SignupForm, WatchlistForm, WatchlistStatusForm
+from app.models import GameDetails, Job, Movie, User, WatchlistEntry
+from app.cache import cached_fragment, forget_user
 from app.extensions import db, limiter
+from app.http_cache import bump_version, conditional
+from app.instrumentation import query_budget
+from app.jobs import enqueue
+from app.queries import GAME_SORTS, game_count, game_page, movie_count, movie_page
+from app.search import search_games, search_movies
+from app.stats import UNKNOWN, distribution
+from app.watchlist import add_statement, watchlist_page
 
 main_bp = Blueprint('main', __name__)
 auth_bp = Blueprint('auth', __name__)
 movies_bp = Blueprint('movies', __name__, url_prefix='/movies')
 games_bp = Blueprint('games', __name__, url_prefix='/games')
+api_bp = Blueprint('api', __name__, url_prefix='/api/v1')
+watchlist_bp = Blueprint('watchlist', __name__, url_prefix='/watchlist')
+jobs_bp = Blueprint('jobs', __name__, url_prefix='/jobs')
 
 def get_rate_limit_key():
     if has_request_context():
@@ -19,11 +34,64 @@ def get_rate_limit_key():
             return request.remote_addr
     return "global"
 
+def movie_list_args():
+    per_page = min(request.args.get('per_page', current_app.config['MOVIES_PER_PAGE'], type=int),
+                   current_app.config['MOVIES_MAX_PER_PAGE'])
+    return dict(after=request.args.get('after', type=int), per_page=max(per_page, 1))
+
+def game_list_args():
+    sort = request.args.get('sort', 'id')
+    if sort not in GAME_SORTS:
+        abort(400)
+
+    year_from = request.args.get('year_from', type=int)
+    year_to = request.args.get('year_to', type=int)
+    if any(year is not None and not 1 <= year <= 9999 for year in (year_from, year_to)):
+        abort(400)
+
+    per_page = min(request.args.get('per_page', current_app.config['GAMES_PER_PAGE'], type=int),
+                   current_app.config['GAMES_MAX_PER_PAGE'])
+    return dict(
+        sort=sort,
+        after=request.args.get('after'),
+        year_from=year_from,
+        year_to=year_to,
+        per_page=max(per_page, 1),
+    )
+
 @main_bp.route('/')
+@query_budget(1)
 def index():
     return render_template('index.html')
 
+@main_bp.route('/cache-stats')
+@query_budget(1)
+@login_required
+def cache_stats():
+    return jsonify(current_app.extensions['fragment_cache'].stats())
+
+@main_bp.route('/search')
+@query_budget(4)
+def search():
+    query = request.args.get('q', '').strip()
+    limit = current_app.config['SEARCH_RESULTS_LIMIT']
+    movies = search_movies(query, limit=limit) if query else []
+    games = search_games(query, limit=limit) if query else []
+    return render_template('search.html', query=query, movie_results=movies, game_results=games)
+
+@main_bp.route('/stats')
+@query_budget(5)
+@conditional('movies', 'games')
+def stats():
+    return render_template('stats.html',
+                           movies_by_decade=distribution('movie_year', width=10),
+                           movies_by_year=distribution('movie_year'),
+                           games_by_year=distribution('game_year'),
+                           games_by_metacritic=distribution('game_metacritic'),
+                           unknown=UNKNOWN)
+
 @auth_bp.route('/login', methods=["GET", "POST"])
+@query_budget(3)
 @limiter.limit("100 per hour", key_func=get_rate_limit_key, methods=["POST"])
 def login():
     form = LoginForm()
@@ -33,7 +101,11 @@ def login():
 
         user: User = db.session.execute(db.select(User).where(User.username == username)).scalars().first()
 
-        if user.username == username and user.validate_password(password):
+        if user is not None and user.validate_password(password):
+            if user.password_needs_rehash():
+                user.set_password(password)
+                db.session.commit()
+                forget_user(user.id)
             login_user(user)
             flash(f'{user.name} sucessfully logged in.')
             return redirect(url_for('main.index'))
@@ -44,6 +116,7 @@ def login():
     return render_template('login.html', form=form)
 
 @auth_bp.route('/signup', methods=["GET", "POST"])
+@query_budget(2)
 @limiter.limit("3 per day", key_func=get_rate_limit_key, methods=["POST"])
 def signup():
     form = SignupForm()
@@ -65,6 +138,7 @@ def signup():
     return render_template('sign_up.html', form=form)
     
 @auth_bp.route('/logout')
+@query_budget(1)
 @login_required
 def logout():
     logout_user()
@@ -72,6 +146,7 @@ def logout():
     return redirect(url_for('auth.login'))
 
 @main_bp.route('/settings', methods=['GET', 'POST'])
+@query_budget(3)
 @login_required
 @limiter.limit("10 per hour", key_func=get_rate_limit_key)
 def settings():
@@ -80,6 +155,7 @@ def settings():
         new_name = form.name.data
         current_user.name = new_name
         db.session.commit()
+        forget_user(current_user.id)
         flash('Name change successful.')
         return redirect(url_for('main.settings'))
     
@@ -87,31 +163,54 @@ def settings():
 
 
 @movies_bp.route('/', methods=['GET', 'POST'])
+@query_budget(4)
+@conditional('movies')
+@cached_fragment('movies')
 def movies():
     add_movie_form = AddMovieForm()
     delete_movie_form = DeleteMovieForm()
+    args = movie_list_args()
+    stream = current_app.config['MOVIES_STREAM']
+
+    context = dict(
+        movies=movie_page(stream=stream, **args),
+        movie_count=movie_count(),
+        add_movie_form=add_movie_form,
+        delete_movie_form=delete_movie_form,
+        watchlist_form=WatchlistForm(),
+        **args,
+    )
 
-    return render_template('movies.html', add_movie_form=add_movie_form, delete_movie_form=delete_movie_form)
+    if stream:
+        # Pop flashes now: the session is saved before a streamed body is rendered
+        get_flashed_messages()
+        return stream_template('movies.html', **context)
+
+    return render_template('movies.html', **context)
 
 @movies_bp.route('/delete/<int:movie_id>', methods=['POST'])
+@query_budget(3)
 @login_required
 @limiter.limit("100 per hour", key_func=get_rate_limit_key)
 def delete_movie(movie_id):
     delete_movie_form = DeleteMovieForm()
 
     if delete_movie_form.validate_on_submit():
-        movie = db.session.execute(db.select(Movie).where(Movie.id == movie_id)).scalars().first()
+        result = db.session.execute(db.delete(Movie).where(Movie.id == movie_id))
         
-        if not movie:
+        if not result.rowcount:
+            db.session.rollback()
             flash('Movie not found.')
             return redirect(url_for('movies.movies'))
 
-        db.session.delete(movie)
+        bump_version('movies')
         db.session.commit()
         flash('Item deleted')
         return redirect(url_for('movies.movies'))
-    
+    return redirect(url_for('movies.movies'))
+
 @movies_bp.route('/add', methods=['POST'])
+@query_budget(3)
 @login_required
 @limiter.limit("10 per hour", key_func=get_rate_limit_key)
 def add_movie():
@@ -120,42 +219,342 @@ def add_movie():
     if add_movie_form.validate_on_submit():
         movie = Movie()
         movie.title = add_movie_form.title.data
-        movie.year = add_movie_form.year.data
+        movie.year = int(add_movie_form.year.data)
         db.session.add(movie)
+        bump_version('movies')
         db.session.commit()
         flash('Item added')
         return redirect(url_for('movies.movies'))
     return redirect(url_for('movies.movies'))
 
 @movies_bp.route('/edit/<int:movie_id>', methods=["GET", "POST"])
+@query_budget(3)
 @limiter.limit("30 per hour", key_func=get_rate_limit_key, methods=["POST"])
+@conditional('movies')
 def edit(movie_id):
-    movie = db.session.execute(db.select(Movie).where(Movie.id == movie_id)).scalars().first()
-
     if request.method == "POST":
         if not current_user.is_authenticated:
             flash('Sign in to edit movies.')
             return redirect(url_for('movies.movies'))
         
-        title = request.form.get('title')
-        year = request.form.get('year')
+        title = request.form.get('title', '')
+        year = request.form.get('year', '')
 
         if not title or not year.isdigit() or len(year) != 4 or len(title) > 60:
             flash('Invalid input.')
             return redirect(url_for('movies.edit', movie_id=movie_id))
     
-        movie.title = title
-        movie.year = year
+        result = db.session.execute(db.update(Movie).where(Movie.id == movie_id).values(title=title, year=int(year)))
+        if not result.rowcount:
+            abort(404)
+
+        bump_version('movies')
         db.session.commit()
 
         link = url_for("movies.movies")
         flash(f'Successfully updated! Click <a href={link}>here</a> to return to the movies list.')
         return redirect(url_for('movies.edit', movie_id=movie_id))
     
-    return render_template('edit.html', movie=movie)
+    return render_template('edit.html', movie=db.get_or_404(Movie, movie_id))
 
 @games_bp.route('/')
+@query_budget(6)
+@conditional('games')
+@cached_fragment('games')
 def games():
-    games = db.session.execute(db.select(GameDetails)).scalars().fetchmany(10)
-    print(games)
-    return render_template('games.html', game_details=games)
\ No newline at end of file
+    args = game_list_args()
+
+    try:
+        games = game_page(**args)
+    except ValueError:
+        abort(400)
+
+    return render_template('games.html',
+                           game_details=games,
+                           game_count=game_count(args['year_from'], args['year_to'], args['sort']),
+                           sorts=GAME_SORTS,
+                           watchlist_form=WatchlistForm(),
+                           **args)
+
+@watchlist_bp.route('/')
+@query_budget(2)
+@login_required
+def watchlist():
+    per_page = min(request.args.get('per_page', current_app.config['WATCHLIST_PER_PAGE'], type=int),
+                   current_app.config['WATCHLIST_MAX_PER_PAGE'])
+    per_page = max(per_page, 1)
+    after = request.args.get('after')
+
+    try:
+        entries = watchlist_page(current_user.id, after, per_page)
+    except ValueError:
+        abort(400)
+
+    return render_template('watchlist.html', entries=entries, status_form=WatchlistStatusForm(),
+                           after=after, per_page=per_page)
+
+@watchlist_bp.route('/<any(movie, game):kind>/<int:title_id>', methods=['POST'])
+@query_budget(3)
+@login_required
+@limiter.limit("100 per hour", key_func=get_rate_limit_key)
+def add(kind, title_id):
+    back = url_for('movies.movies' if kind == 'movie' else 'games.games')
+    if not WatchlistForm().validate_on_submit():
+        return redirect(back)
+
+    result = db.session.execute(add_statement(current_user.id, kind, title_id))
+    if result.rowcount:
+        db.session.commit()
+        flash('Added to your watchlist.')
+        return redirect(back)
+
+    db.session.rollback()
+    if db.session.get(Movie if kind == 'movie' else GameDetails, title_id) is None:
+        abort(404)
+    flash('Already on your watchlist.')
+    return redirect(back)
+
+@watchlist_bp.route('/<int:entry_id>/status', methods=['POST'])
+@query_budget(2)
+@login_required
+def update_status(entry_id):
+    form = WatchlistStatusForm()
+    if form.validate_on_submit():
+        result = db.session.execute(
+            db.update(WatchlistEntry)
+            .where(WatchlistEntry.id == entry_id, WatchlistEntry.user_id == current_user.id)
+            .values(status=form.status.data))
+        if not result.rowcount:
+            abort(404)
+        db.session.commit()
+    return redirect(url_for('watchlist.watchlist'))
+
+@watchlist_bp.route('/<int:entry_id>/remove', methods=['POST'])
+@query_budget(2)
+@login_required
+def remove(entry_id):
+    if WatchlistForm().validate_on_submit():
+        result = db.session.execute(
+            db.delete(WatchlistEntry).where(WatchlistEntry.id == entry_id, WatchlistEntry.user_id == current_user.id))
+        if not result.rowcount:
+            abort(404)
+        db.session.commit()
+        flash('Removed from your watchlist.')
+    return redirect(url_for('watchlist.watchlist'))
+
+
+def job_to_dict(job):
+    return dict(id=job.id, kind=job.kind, status=job.status, progress=job.progress, total=job.total,
+                attempts=job.attempts, max_attempts=job.max_attempts, error=job.error, result=job.result,
+                created_at=job.created_at, finished_at=job.finished_at)
+
+@jobs_bp.route('/')
+@query_budget(2)
+@login_required
+def jobs():
+    recent = db.session.execute(db.select(Job).order_by(Job.id.desc()).limit(50)).scalars()
+    return render_template('jobs.html', jobs=recent, job_form=JobForm(), import_form=ImportGamesForm())
+
+@jobs_bp.route('/<any("reindex-search", "rebuild-stats"):kind>', methods=['POST'])
+@query_budget(2)
+@login_required
+@limiter.limit("10 per hour", key_func=get_rate_limit_key)
+def enqueue_job(kind):
+    if JobForm().validate_on_submit():
+        job = enqueue(kind)
+        db.session.commit()
+        flash(f'Queued job {job.id}.')
+    return redirect(url_for('.jobs'))
+
+@jobs_bp.route('/import-games', methods=['POST'])
+@query_budget(2)
+@login_required
+@limiter.limit("10 per hour", key_func=get_rate_limit_key)
+def enqueue_import():
+    form = ImportGamesForm()
+    if not form.validate_on_submit():
+        flash('Choose a .jsonl or .csv games dump.')
+        return redirect(url_for('.jobs'))
+
+    # The worker reads the upload from disk and removes it once imported
+    directory = current_app.config['JOB_UPLOAD_DIR'] or os.path.join(current_app.instance_path, 'uploads')
+    os.makedirs(directory, exist_ok=True)
+    extension = os.path.splitext(form.dump.data.filename)[1].lower()
+    path = os.path.join(directory, f'{uuid.uuid4().hex}{extension}')
+    form.dump.data.save(path)
+
+    job = enqueue('import-games', dict(path=path, format='csv' if extension == '.csv' else 'jsonl', remove=True))
+    db.session.commit()
+    flash(f'Queued job {job.id}.')
+    return redirect(url_for('.jobs'))
+
+@jobs_bp.route('/<int:job_id>')
+@query_budget(2)
+@login_required
+def job_status(job_id):
+    return jsonify(job_to_dict(db.get_or_404(Job, job_id)))
+
+def movie_to_dict(movie):
+    return dict(id=movie.id, title=movie.title, year=movie.year)
+
+def game_to_dict(game, detail=False):
+    data = dict(id=game.id, slug=game.slug, name=game.name, metacritic=game.metacritic,
+                released=game.released.isoformat() if game.released else None, website=game.website,
+                platforms=[platform.name for platform in game.platforms],
+                genres=[genre.name for genre in game.genres])
+    if detail:
+        data['description'] = game.description
+    return data
+
+def clean_movie(data, partial=False):
+    if not isinstance(data, dict):
+        raise ValueError('expected an object')
+
+    movie = {}
+    if 'title' in data or not partial:
+        title = data.get('title')
+        if not isinstance(title, str) or not 1 <= len(title.strip()) <= 60:
+            raise ValueError('title must be 1-60 characters')
+        movie['title'] = title.strip()
+    if 'year' in data or not partial:
+        year = str(data.get('year', ''))
+        if not year.isdigit() or len(year) != 4:
+            raise ValueError('year must be 4 digits')
+        movie['year'] = int(year)
+    return movie
+
+def json_body():
+    if not request.is_json:
+        abort(415)
+    data = request.get_json(silent=True)
+    if data is None:
+        abort(400, description='Request body is not valid JSON.')
+    return data
+
+def batch_items(data, key):
+    items = data.get(key) if isinstance(data, dict) else None
+    if not isinstance(items, list) or not items:
+        abort(400, description=f'Expected a non-empty "{key}" list.')
+    limit = current_app.config['API_BATCH_LIMIT']
+    if len(items) > limit:
+        abort(400, description=f'At most {limit} items per batch.')
+    return items
+
+def api_list_args():
+    per_page = min(request.args.get('per_page', current_app.config['API_PER_PAGE'], type=int),
+                   current_app.config['API_MAX_PER_PAGE'])
+    return max(per_page, 1)
+
+@api_bp.errorhandler(HTTPException)
+def api_error(e):
+    return jsonify(error=e.name, description=e.description), e.code
+
+# The app's HTML handlers are registered per status code, which Flask prefers
+# over a blueprint's HTTPException handler, so claim those codes explicitly.
+for code in (400, 404, 500):
+    api_bp.register_error_handler(code, api_error)
+
+@api_bp.errorhandler(ValueError)
+def api_invalid(e):
+    return jsonify(error='Bad Request', description=str(e)), 400
+
+@api_bp.route('/movies')
+@query_budget(2)
+def api_movies():
+    page = movie_page(after=request.args.get('after', type=int), per_page=api_list_args())
+    return jsonify(items=[movie_to_dict(movie) for movie in page], next=page.next_cursor)
+
+@api_bp.route('/movies/<int:movie_id>')
+@query_budget(2)
+def api_movie(movie_id):
+    return jsonify(movie_to_dict(db.get_or_404(Movie, movie_id)))
+
+@api_bp.route('/movies', methods=['POST'])
+@query_budget(3)
+@login_required
+@limiter.limit("60 per minute", key_func=get_rate_limit_key)
+def api_create_movie():
+    movie = Movie(**clean_movie(json_body()))
+    db.session.add(movie)
+    db.session.flush()
+    bump_version('movies')
+    # Serialize before commit: committing expires the instance and reading it
+    # afterwards would cost another SELECT.
+    payload = movie_to_dict(movie)
+    db.session.commit()
+    return jsonify(payload), 201
+
+@api_bp.route('/movies/<int:movie_id>', methods=['PATCH'])
+@query_budget(4)
+@login_required
+@limiter.limit("60 per minute", key_func=get_rate_limit_key)
+def api_update_movie(movie_id):
+    changes = clean_movie(json_body(), partial=True)
+    movie = db.get_or_404(Movie, movie_id)
+    for key, value in changes.items():
+        setattr(movie, key, value)
+    bump_version('movies')
+    payload = movie_to_dict(movie)
+    db.session.commit()
+    return jsonify(payload)
+
+@api_bp.route('/movies/<int:movie_id>', methods=['DELETE'])
+@query_budget(3)
+@login_required
+@limiter.limit("60 per minute", key_func=get_rate_limit_key)
+def api_delete_movie(movie_id):
+    result = db.session.execute(db.delete(Movie).where(Movie.id == movie_id))
+    if not result.rowcount:
+        abort(404)
+    bump_version('movies')
+    db.session.commit()
+    return '', 204
+
+@api_bp.route('/movies/batch', methods=['POST'])
+@query_budget(3)
+@login_required
+@limiter.limit("60 per minute", key_func=get_rate_limit_key)
+def api_create_movies():
+    items = batch_items(json_body(), 'items')
+
+    rows = []
+    for index, item in enumerate(items):
+        try:
+            rows.append(clean_movie(item))
+        except ValueError as e:
+            raise ValueError(f'items[{index}]: {e}') from None
+
+    # All or nothing: one transaction, one executemany INSERT ... RETURNING
+    movies = db.session.execute(db.insert(Movie).returning(Movie), rows).scalars().all()
+    payload = [movie_to_dict(movie) for movie in movies]
+    bump_version('movies')
+    db.session.commit()
+    return jsonify(items=payload), 201
+
+@api_bp.route('/movies/batch-delete', methods=['POST'])
+@query_budget(3)
+@login_required
+@limiter.limit("60 per minute", key_func=get_rate_limit_key)
+def api_delete_movies():
+    ids = batch_items(json_body(), 'ids')
+    # bool is an int subclass: true would delete movie 1
+    if not all(type(movie_id) is int for movie_id in ids):
+        abort(400, description='"ids" must be integers.')
+
+    result = db.session.execute(db.delete(Movie).where(Movie.id.in_(ids)))
+    bump_version('movies')
+    db.session.commit()
+    return jsonify(deleted=result.rowcount)
+
+@api_bp.route('/games')
+@query_budget(4)
+def api_games():
+    args = game_list_args()
+    args['per_page'] = api_list_args()
+    page = game_page(**args)
+    return jsonify(items=[game_to_dict(game) for game in page], next=page.next_cursor)
+
+@api_bp.route('/games/<int:game_id>')
+@query_budget(4)
+def api_game(game_id):
+    return jsonify(game_to_dict(db.get_or_404(GameDetails, game_id), detail=True))
\ No newline at end of file
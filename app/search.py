@@ -0,0 +1,121 @@
+import re
+
+from sqlalchemy import event
+
+from app.extensions import db
+from app.models import GameDetails, Movie
+
+# External-content FTS5 tables: the index stores only tokens and reads the text
+# back from movie/game_details, and triggers keep it in step with every write
+# (ORM, bulk insert or raw SQL alike).
+SEARCH_TABLES = {
+    'movie_fts': """
+        CREATE VIRTUAL TABLE movie_fts USING fts5(
+            title, content='movie', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2', prefix='2 3')
+    """,
+    'game_fts': """
+        CREATE VIRTUAL TABLE game_fts USING fts5(
+            name, description, content='game_details', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2', prefix='2 3')
+    """,
+}
+
+SEARCH_TRIGGERS = [
+    """
+    CREATE TRIGGER IF NOT EXISTS movie_fts_insert AFTER INSERT ON movie BEGIN
+        INSERT INTO movie_fts(rowid, title) VALUES (new.id, new.title);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS movie_fts_delete AFTER DELETE ON movie BEGIN
+        INSERT INTO movie_fts(movie_fts, rowid, title) VALUES ('delete', old.id, old.title);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS movie_fts_update AFTER UPDATE OF title ON movie BEGIN
+        INSERT INTO movie_fts(movie_fts, rowid, title) VALUES ('delete', old.id, old.title);
+        INSERT INTO movie_fts(rowid, title) VALUES (new.id, new.title);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS game_fts_insert AFTER INSERT ON game_details BEGIN
+        INSERT INTO game_fts(rowid, name, description) VALUES (new.id, new.name, new.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS game_fts_delete AFTER DELETE ON game_details BEGIN
+        INSERT INTO game_fts(game_fts, rowid, name, description)
+        VALUES ('delete', old.id, old.name, old.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS game_fts_update AFTER UPDATE OF name, description ON game_details BEGIN
+        INSERT INTO game_fts(game_fts, rowid, name, description)
+        VALUES ('delete', old.id, old.name, old.description);
+        INSERT INTO game_fts(rowid, name, description) VALUES (new.id, new.name, new.description);
+    END
+    """,
+]
+
+
+def install_search_index(connection):
+    existing = {row[0] for row in connection.exec_driver_sql(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND name IN ('movie_fts', 'game_fts')")}
+
+    for table, ddl in SEARCH_TABLES.items():
+        if table not in existing:
+            connection.exec_driver_sql(ddl)
+            # Index whatever rows the content table already holds
+            connection.exec_driver_sql(f"INSERT INTO {table}({table}) VALUES ('rebuild')")
+
+    for ddl in SEARCH_TRIGGERS:
+        connection.exec_driver_sql(ddl)
+
+
+def rebuild_search_index(connection):
+    for table in SEARCH_TABLES:
+        connection.exec_driver_sql(f"INSERT INTO {table}({table}) VALUES ('rebuild')")
+
+
+@event.listens_for(db.metadata, 'after_create')
+def create_search_index(target, connection, **kw):
+    if connection.dialect.name == 'sqlite':
+        install_search_index(connection)
+
+
+@event.listens_for(db.metadata, 'before_drop')
+def drop_search_index(target, connection, **kw):
+    if connection.dialect.name == 'sqlite':
+        for table in SEARCH_TABLES:
+            connection.exec_driver_sql(f'DROP TABLE IF EXISTS {table}')
+
+
+def match_expression(text):
+    # Quote each word so FTS5 operators in user input are treated as text,
+    # and prefix-match every term so "zel br" finds "Zelda: Breath of the Wild".
+    terms = re.findall(r'\w+', text)
+    return ' '.join(f'"{term}"*' for term in terms)
+
+
+def _ranked(model, table, weights, expression, limit):
+    rows = db.session.execute(
+        db.text(f'SELECT rowid FROM {table} WHERE {table} MATCH :expression '
+                f'ORDER BY bm25({table}{weights}) LIMIT :limit'),
+        dict(expression=expression, limit=limit)).scalars().all()
+    if not rows:
+        return []
+
+    found = {item.id: item for item in db.session.execute(db.select(model).where(model.id.in_(rows))).scalars()}
+    return [found[row] for row in rows if row in found]
+
+
+def search_movies(text, limit=20):
+    expression = match_expression(text)
+    return _ranked(Movie, 'movie_fts', '', expression, limit) if expression else []
+
+
+def search_games(text, limit=20):
+    expression = match_expression(text)
+    # A hit in the name outranks one buried in the description
+    return _ranked(GameDetails, 'game_fts', ', 10.0, 1.0', expression, limit) if expression else []
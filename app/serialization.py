@@ -0,0 +1,39 @@
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is optional
+    orjson = None
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    # Flask JSON provider backed by orjson: several times faster than the
+    # stdlib encoder on large API pages and always compact. Falls back to the
+    # default provider for pretty-printing and unsupported options. Dates are
+    # passed through to self.default (HTTP dates, as with the stdlib
+    # provider) and keys are sorted unless sort_keys is turned off.
+    def _option(self):
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        return option | orjson.OPT_SORT_KEYS if self.sort_keys else option
+
+    def dumps(self, obj, **kwargs):
+        if kwargs.get('indent') or kwargs.keys() - {'separators'}:
+            return super().dumps(obj, **kwargs)
+        return orjson.dumps(obj, default=self.default, option=self._option()).decode()
+
+    def loads(self, s, **kwargs):
+        if kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        if (self.compact is None and self._app.debug) or self.compact is False:
+            return super().response(obj)
+        return self._app.response_class(
+            orjson.dumps(obj, default=self.default, option=self._option()), mimetype=self.mimetype)
+
+
+def init_json(app):
+    if orjson is not None:
+        app.json = OrjsonProvider(app)
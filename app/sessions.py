@@ -0,0 +1,204 @@
+import secrets
+import threading
+import time
+
+from flask.sessions import SessionInterface, SessionMixin, session_json_serializer
+from flask_login import user_logged_in
+from sqlalchemy.engine import make_url
+from werkzeug.datastructures import CallbackDict
+
+from app.sqlite import ThreadConnections
+
+
+class MemorySessionStore:
+    # Process-local stand-in for a shared store: sessions are lost on restart
+    # and not seen by other workers, so only use it with a single process.
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, sid):
+        with self._lock:
+            record = self._data.get(sid)
+        if record is None or record[1] <= time.time():
+            return None
+        return record
+
+    def set(self, sid, data, expires_at):
+        with self._lock:
+            self._data[sid] = (data, expires_at)
+
+    def touch(self, sid, expires_at):
+        with self._lock:
+            if sid in self._data:
+                self._data[sid] = (self._data[sid][0], expires_at)
+
+    def delete(self, sid):
+        with self._lock:
+            self._data.pop(sid, None)
+
+    def sweep(self, now=None):
+        now = now or time.time()
+        with self._lock:
+            expired = [sid for sid, (_, expires_at) in self._data.items() if expires_at <= now]
+            for sid in expired:
+                del self._data[sid]
+        return len(expired)
+
+    def __len__(self):
+        return len(self._data)
+
+
+class SQLiteSessionStore:
+    # Sessions shared by every worker pointed at the same file:
+    #
+    #     SESSION_STORAGE_URI = "sqlite:////var/lib/watchlist/sessions.db"
+    def __init__(self, uri, timeout=5, pragmas=None):
+        self.path = make_url(uri).database
+        self.timeout = timeout
+        self._connection = ThreadConnections(self.path, timeout, pragmas)
+        self._connection().execute(
+            'CREATE TABLE IF NOT EXISTS sessions ('
+            ' sid TEXT PRIMARY KEY,'
+            ' data TEXT NOT NULL,'
+            ' expires_at REAL NOT NULL)')
+
+    def get(self, sid):
+        return self._connection().execute(
+            'SELECT data, expires_at FROM sessions WHERE sid = ? AND expires_at > ?', (sid, time.time())).fetchone()
+
+    def set(self, sid, data, expires_at):
+        self._connection().execute(
+            'INSERT INTO sessions (sid, data, expires_at) VALUES (?, ?, ?) '
+            'ON CONFLICT (sid) DO UPDATE SET data = excluded.data, expires_at = excluded.expires_at',
+            (sid, data, expires_at))
+
+    def touch(self, sid, expires_at):
+        self._connection().execute('UPDATE sessions SET expires_at = ? WHERE sid = ?', (expires_at, sid))
+
+    def delete(self, sid):
+        self._connection().execute('DELETE FROM sessions WHERE sid = ?', (sid,))
+
+    def sweep(self, now=None):
+        return self._connection().execute(
+            'DELETE FROM sessions WHERE expires_at <= ?', (now or time.time(),)).rowcount
+
+    def __len__(self):
+        return self._connection().execute('SELECT count(*) FROM sessions').fetchone()[0]
+
+
+class ServerSideSession(CallbackDict, SessionMixin):
+    server_side = True
+
+    def __init__(self, initial=None, sid=None, expires_at=None):
+        def on_update(self):
+            self.modified = True
+            self.accessed = True
+
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.expires_at = expires_at
+        self.stale_sid = None
+        self.modified = False
+        self.accessed = False
+
+    @property
+    def new(self):
+        return self.expires_at is None
+
+    def regenerate(self):
+        # New id for the same data, e.g. at login so a planted id is worthless
+        if self.sid is not None:
+            self.stale_sid = self.sid
+        self.sid = None
+        self.expires_at = None
+        self.modified = True
+
+
+class ServerSideSessionInterface(SessionInterface):
+    # The cookie holds only a random id (256 bits, so it needs no signature)
+    # and the data stays in `store`. Responses only write to the store when
+    # the session changed or is past half its lifetime, and only set the
+    # cookie when the id is new or a permanent session's expiry moves.
+    serializer = session_json_serializer
+
+    def __init__(self, store, sweep_interval=600):
+        self.store = store
+        self.sweep_interval = sweep_interval
+        self._next_sweep = time.time() + sweep_interval
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if sid:
+            record = self.store.get(sid)
+            if record is not None:
+                data, expires_at = record
+                return ServerSideSession(self.serializer.loads(data), sid, expires_at)
+        return ServerSideSession()
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        now = time.time()
+
+        if session.stale_sid is not None:
+            self.store.delete(session.stale_sid)
+
+        if not session:
+            if session.sid is not None and session.modified:
+                self.store.delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path,
+                                       secure=self.get_cookie_secure(app),
+                                       samesite=self.get_cookie_samesite(app),
+                                       httponly=self.get_cookie_httponly(app))
+                response.vary.add('Cookie')
+            return
+
+        if session.accessed:
+            response.vary.add('Cookie')
+
+        lifetime = app.permanent_session_lifetime.total_seconds()
+        new = session.new
+        extended = new or session.modified
+        if new:
+            session.sid = secrets.token_urlsafe(32)
+        if extended:
+            self.store.set(session.sid, self.serializer.dumps(dict(session)), now + lifetime)
+        elif session.expires_at - now < lifetime / 2:
+            self.store.touch(session.sid, now + lifetime)
+            extended = True
+
+        if new or (extended and session.permanent):
+            response.set_cookie(name, session.sid, expires=self.get_expiration_time(app, session),
+                                httponly=self.get_cookie_httponly(app), domain=domain, path=path,
+                                secure=self.get_cookie_secure(app), samesite=self.get_cookie_samesite(app))
+            response.vary.add('Cookie')
+
+        if now >= self._next_sweep:
+            self._next_sweep = now + self.sweep_interval
+            self.store.sweep(now)
+
+
+def _regenerate_on_login(sender, user, **kwargs):
+    from flask import session
+
+    if getattr(session, 'server_side', False):
+        session.regenerate()
+
+
+def init_sessions(app):
+    backend = app.config['SESSION_BACKEND']
+    if backend == 'cookie':
+        return
+    if backend == 'memory':
+        store = MemorySessionStore()
+    elif backend == 'sqlite':
+        if not app.config['SESSION_STORAGE_URI']:
+            raise RuntimeError('SESSION_BACKEND = "sqlite" needs SESSION_STORAGE_URI')
+        store = SQLiteSessionStore(app.config['SESSION_STORAGE_URI'], pragmas=app.config['SQLITE_PRAGMAS'])
+    else:
+        raise RuntimeError(f'Unknown SESSION_BACKEND {backend!r}')
+
+    app.session_interface = ServerSideSessionInterface(store, app.config['SESSION_SWEEP_INTERVAL'])
+    user_logged_in.connect(_regenerate_on_login, app)
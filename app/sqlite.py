@@ -0,0 +1,64 @@
+import os
+import sqlite3
+import threading
+import time
+
+from sqlalchemy import event
+
+
+def _set_pragmas(cursor, pragmas):
+    for name, value in pragmas.items():
+        cursor.execute(f'PRAGMA {name} = {value}')
+
+
+def apply_pragmas(engine, pragmas):
+    # Run on every new pooled connection; journal_mode=WAL is persistent in the
+    # database file, the rest are per-connection settings.
+    @event.listens_for(engine, 'connect')
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            _set_pragmas(cursor, pragmas)
+        finally:
+            cursor.close()
+
+    return set_pragmas
+
+
+class ThreadConnections:
+    # Plain sqlite3 connections for the side stores (rate limits, sessions)
+    # that several workers share by file: one autocommit connection per
+    # thread, reopened after a fork so a worker never shares a file handle
+    # with its parent, tuned like the app's engine. Call it to get this
+    # thread's connection.
+    def __init__(self, path, timeout=5, pragmas=None):
+        if pragmas is None:
+            from app.config import Config
+            pragmas = Config.SQLITE_PRAGMAS
+        self.path = path
+        self.timeout = timeout
+        self.pragmas = dict(pragmas, busy_timeout=int(timeout * 1000))
+        self._local = threading.local()
+
+    def _connect(self):
+        # Processes opening a new file at the same moment race to switch it to
+        # WAL, and SQLite reports the loser as "database is locked" without
+        # waiting out busy_timeout, so retry that until the timeout is spent.
+        deadline = time.monotonic() + self.timeout
+        while True:
+            connection = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None,
+                                         check_same_thread=False)
+            try:
+                _set_pragmas(connection, self.pragmas)
+                return connection
+            except sqlite3.OperationalError as e:
+                connection.close()
+                if 'locked' not in str(e) or time.monotonic() >= deadline:
+                    raise
+            time.sleep(0.01)
+
+    def __call__(self):
+        if getattr(self._local, 'pid', None) != os.getpid():
+            self._local.connection = self._connect()
+            self._local.pid = os.getpid()
+        return self._local.connection
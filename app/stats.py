@@ -0,0 +1,79 @@
+from sqlalchemy import event
+
+from app.extensions import db
+from app.models import CatalogStat
+
+# Bucket for rows whose year, release date or score is unknown
+UNKNOWN = -1
+
+# kind -> (table, SQL computing the bucket from a row). The triggers below
+# write these expressions with new./old. prefixes.
+STATS = {
+    'movie_year': ('movie', "coalesce({row}year, -1)"),
+    'game_year': ('game_details', "coalesce(CAST(strftime('%Y', {row}released) AS INTEGER), -1)"),
+    'game_metacritic': ('game_details', "coalesce({row}metacritic / 10 * 10, -1)"),
+}
+
+# table -> (kinds it feeds, columns those buckets read)
+TRIGGER_TABLES = {
+    'movie': (('movie_year',), 'year'),
+    'game_details': (('game_year', 'game_metacritic'), 'released, metacritic'),
+}
+
+
+def _adjust(kind, row, delta):
+    bucket = STATS[kind][1].format(row=row)
+    return (f"INSERT INTO catalog_stats (kind, bucket, count) VALUES ('{kind}', {bucket}, {delta}) "
+            f"ON CONFLICT (kind, bucket) DO UPDATE SET count = count + ({delta});")
+
+
+def stats_triggers():
+    for table, (kinds, columns) in TRIGGER_TABLES.items():
+        yield (f"CREATE TRIGGER IF NOT EXISTS {table}_stats_insert AFTER INSERT ON {table} BEGIN "
+               + ' '.join(_adjust(kind, 'new.', 1) for kind in kinds) + ' END')
+        yield (f"CREATE TRIGGER IF NOT EXISTS {table}_stats_delete AFTER DELETE ON {table} BEGIN "
+               + ' '.join(_adjust(kind, 'old.', -1) for kind in kinds) + ' END')
+        yield (f"CREATE TRIGGER IF NOT EXISTS {table}_stats_update AFTER UPDATE OF {columns} ON {table} BEGIN "
+               + ' '.join(_adjust(kind, 'old.', -1) + ' ' + _adjust(kind, 'new.', 1) for kind in kinds) + ' END')
+
+
+def install_stats(connection):
+    for ddl in stats_triggers():
+        connection.exec_driver_sql(ddl)
+
+
+def rebuild_stats(connection):
+    connection.exec_driver_sql('DELETE FROM catalog_stats')
+    for kind, (table, bucket) in STATS.items():
+        bucket = bucket.format(row='')
+        connection.exec_driver_sql(
+            f"INSERT INTO catalog_stats (kind, bucket, count) "
+            f"SELECT '{kind}', {bucket}, count(*) FROM {table} GROUP BY {bucket}")
+
+
+@event.listens_for(CatalogStat.__table__, 'after_create')
+def create_stats_triggers(target, connection, **kw):
+    if connection.dialect.name == 'sqlite':
+        install_stats(connection)
+
+
+def total_statement(kind, bucket_from=None, bucket_to=None):
+    statement = db.select(db.func.coalesce(db.func.sum(CatalogStat.count), 0)).where(CatalogStat.kind == kind)
+    if bucket_from is not None:
+        statement = statement.where(CatalogStat.bucket >= bucket_from)
+    if bucket_to is not None:
+        statement = statement.where(CatalogStat.bucket <= bucket_to)
+    return statement
+
+
+def distribution(kind, width=1):
+    # (bucket, count) pairs in bucket order, unknown last; width=10 turns
+    # years into decades.
+    bucket = CatalogStat.bucket
+    if width > 1:
+        bucket = db.case((CatalogStat.bucket == UNKNOWN, UNKNOWN), else_=CatalogStat.bucket // width * width)
+    rows = db.session.execute(
+        db.select(bucket.label('bucket'), db.func.sum(CatalogStat.count))
+        .where(CatalogStat.kind == kind, CatalogStat.count > 0)
+        .group_by('bucket').order_by('bucket')).all()
+    return [row for row in rows if row[0] != UNKNOWN] + [row for row in rows if row[0] == UNKNOWN]
@@ -0,0 +1,27 @@
+import os
+
+from jinja2 import FileSystemBytecodeCache
+
+
+def init_templates(app):
+    # Must run before anything touches app.jinja_env, which is created once
+    # from these options.
+    options = dict(app.jinja_options)
+    if app.config['JINJA_TRIM_BLOCKS']:
+        options.update(trim_blocks=True, lstrip_blocks=True)
+
+    cache_dir = app.config['JINJA_BYTECODE_CACHE_DIR']
+    if cache_dir:
+        os.makedirs(cache_dir, exist_ok=True)
+        # Keyed on template name and source checksum, so workers share one
+        # compile per template and a changed template recompiles by itself.
+        options['bytecode_cache'] = FileSystemBytecodeCache(cache_dir)
+    app.jinja_options = options
+
+
+def compile_templates(app):
+    # Compiles every template so its bytecode lands in the shared cache
+    names = app.jinja_env.list_templates(extensions=['html'])
+    for name in names:
+        app.jinja_env.get_template(name)
+    return names
@@ -0,0 +1,87 @@
+import datetime
+
+from sqlalchemy import event
+from sqlalchemy.dialects.sqlite import insert
+
+from app.extensions import db
+from app.models import GameDetails, Movie, WatchlistEntry
+from app.queries import KeysetPage, decode_cursor, encode_cursor
+
+STATUSES = ('planned', 'watching', 'finished', 'dropped')
+
+# Keep the copied title/year in step with the catalog, and drop entries whose
+# title is deleted (SQLite only enforces foreign keys when asked to).
+WATCHLIST_TRIGGERS = [
+    """
+    CREATE TRIGGER IF NOT EXISTS movie_watchlist_update AFTER UPDATE OF title, year ON movie BEGIN
+        UPDATE watchlist_entry SET title = new.title, year = new.year WHERE movie_id = new.id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS movie_watchlist_delete AFTER DELETE ON movie BEGIN
+        DELETE FROM watchlist_entry WHERE movie_id = old.id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS game_watchlist_update AFTER UPDATE OF name, released ON game_details BEGIN
+        UPDATE watchlist_entry SET title = new.name, year = CAST(strftime('%Y', new.released) AS INTEGER)
+        WHERE game_id = new.id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS game_watchlist_delete AFTER DELETE ON game_details BEGIN
+        DELETE FROM watchlist_entry WHERE game_id = old.id;
+    END
+    """,
+]
+
+
+def install_watchlist_triggers(connection):
+    for ddl in WATCHLIST_TRIGGERS:
+        connection.exec_driver_sql(ddl)
+
+
+@event.listens_for(WatchlistEntry.__table__, 'after_create')
+def create_watchlist_triggers(target, connection, **kw):
+    if connection.dialect.name == 'sqlite':
+        install_watchlist_triggers(connection)
+
+
+def add_statement(user_id, kind, title_id):
+    # One INSERT ... SELECT copies the title across; a title already on the
+    # list, or one that doesn't exist, inserts nothing.
+    now = datetime.datetime.utcnow()
+    if kind == 'movie':
+        source = db.select(db.literal(user_id), Movie.id, Movie.title, Movie.year,
+                           db.literal('planned'), db.literal(now)).where(Movie.id == title_id)
+        columns = ['user_id', 'movie_id', 'title', 'year', 'status', 'added_at']
+    else:
+        year = db.cast(db.func.strftime('%Y', GameDetails.released), db.Integer)
+        source = db.select(db.literal(user_id), GameDetails.id, GameDetails.name, year,
+                           db.literal('planned'), db.literal(now)).where(GameDetails.id == title_id)
+        columns = ['user_id', 'game_id', 'title', 'year', 'status', 'added_at']
+    return insert(WatchlistEntry).from_select(columns, source).on_conflict_do_nothing()
+
+
+def watchlist_page_statement(user_id, after=None, per_page=50):
+    statement = (db.select(WatchlistEntry)
+                 .where(WatchlistEntry.user_id == user_id)
+                 .order_by(WatchlistEntry.added_at.desc(), WatchlistEntry.id.desc())
+                 .limit(per_page + 1))
+    if after is not None:
+        values = decode_cursor(after)
+        try:
+            added_at, entry_id = datetime.datetime.fromisoformat(values[0]), int(values[1])
+        except (IndexError, TypeError) as e:
+            raise ValueError(f'Invalid cursor: {after!r}') from e
+        statement = statement.where(db.tuple_(WatchlistEntry.added_at, WatchlistEntry.id) < (added_at, entry_id))
+    return statement
+
+
+def watchlist_cursor(entry):
+    return encode_cursor([entry.added_at.isoformat(), entry.id])
+
+
+def watchlist_page(user_id, after=None, per_page=50):
+    result = db.session.execute(watchlist_page_statement(user_id, after, per_page)).scalars()
+    return KeysetPage(result, per_page, watchlist_cursor).load()
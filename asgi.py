@@ -0,0 +1,6 @@
+from app import create_app
+from app.asgi import AsyncWatchlist
+from app.config import ProductionConfig
+
+# Optional ASGI entry point (pip install -r requirements-asgi.txt): uvicorn asgi:app
+app = AsyncWatchlist(create_app(ProductionConfig))
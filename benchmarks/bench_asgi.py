@@ -0,0 +1,53 @@
+"""Requests/sec and p99 latency: WSGI app versus the ASGI entry point.
+
+Seeds a temporary database, starts each server in its own process on the
+same data, and drives /movies/ and /games/ with many concurrent clients.
+
+    python benchmarks/bench_asgi.py --movies 20000 --games 20000 --threads 32 --seconds 10
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import loadgen  # noqa: E402
+from seed import seed  # noqa: E402
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+PATHS = ['/movies/', '/games/', '/games/?sort=metacritic', '/movies/?per_page=200']
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--movies', type=int, default=10000)
+    parser.add_argument('--games', type=int, default=10000)
+    parser.add_argument('--processes', type=int, default=2)
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--seconds', type=float, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        db_path = os.path.join(directory, 'bench.db')
+        seed(db_path, movies=args.movies, games=args.games)
+
+        print(f'{"server":<8} {"req/s":>10} {"p50 ms":>10} {"p99 ms":>10} {"errors":>8}')
+        for mode, port in (('wsgi', 8101), ('asgi', 8102)):
+            server = subprocess.Popen([sys.executable, os.path.join(HERE, 'serve.py'), mode,
+                                       '--db', db_path, '--port', str(port)],
+                                      stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            try:
+                base_url = f'http://127.0.0.1:{port}'
+                loadgen.wait_for(base_url)
+                stats = loadgen.run(base_url, PATHS, args.processes, args.threads, args.seconds)
+            finally:
+                server.terminate()
+                server.wait()
+            print(f'{mode:<8} {stats["rps"]:>10.1f} {stats["p50_ms"]:>10.1f} {stats["p99_ms"]:>10.1f} '
+                  f'{stats["errors"]:>8}')
+
+
+if __name__ == '__main__':
+    main()
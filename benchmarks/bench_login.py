@@ -0,0 +1,88 @@
+"""Login throughput versus password hashing cost and pool size.
+
+Each configuration creates a fresh in-memory app with one user, then
+--clients threads log in repeatedly for --seconds. Page views run
+alongside so the report shows how much hashing starves other requests.
+
+    python benchmarks/bench_login.py --clients 8 --seconds 3
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app  # noqa: E402
+from app.config import TestingConfig  # noqa: E402
+from app.extensions import db  # noqa: E402
+from app.models import User  # noqa: E402
+
+METHODS = ['pbkdf2:sha256:100000', 'pbkdf2:sha256:600000', 'scrypt:16384:8:1', 'scrypt:32768:8:1']
+
+
+def run(method, workers, args):
+    class BenchConfig(TestingConfig):
+        RATELIMIT_ENABLED = False
+        PASSWORD_HASH_METHOD = method
+        PASSWORD_HASH_WORKERS = workers
+        PASSWORD_HASH_QUEUE_LIMIT = args.clients * 2
+        PASSWORD_HASH_TIMEOUT = 60
+
+    app = create_app(BenchConfig)
+    with app.app_context():
+        db.create_all()
+        user = User(name='Bench', username='bench')
+        user.set_password('password')
+        db.session.add(user)
+        db.session.commit()
+
+    counts = {'login': 0, 'page': 0}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + args.seconds
+
+    def login_client():
+        client = app.test_client()
+        while time.perf_counter() < deadline:
+            client.post('/login', data=dict(username='bench', password='password'))
+            with lock:
+                counts['login'] += 1
+
+    def page_client():
+        client = app.test_client()
+        while time.perf_counter() < deadline:
+            client.get('/')
+            with lock:
+                counts['page'] += 1
+
+    threads = [threading.Thread(target=login_client) for _ in range(args.clients)]
+    threads.append(threading.Thread(target=page_client))
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    hasher = app.extensions['password_hasher']
+    if hasher._executor is not None:
+        hasher._executor.shutdown()
+
+    print(f'{method:<24} {workers:>8} {counts["login"] / args.seconds:>10.1f} {counts["page"] / args.seconds:>10.1f}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--clients', type=int, default=4)
+    parser.add_argument('--seconds', type=float, default=3)
+    parser.add_argument('--workers', type=int, nargs='+', default=[0, 2])
+    parser.add_argument('--methods', nargs='+', default=METHODS)
+    args = parser.parse_args()
+
+    print(f'{"method":<24} {"workers":>8} {"logins/s":>10} {"pages/s":>10}')
+    for method in args.methods:
+        for workers in args.workers:
+            run(method, workers, args)
+
+
+if __name__ == '__main__':
+    main()
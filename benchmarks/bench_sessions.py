@@ -0,0 +1,93 @@
+"""Latency, cookie traffic and SQL per request for each session backend.
+
+Each backend gets a fresh in-memory app with one user and a few movies.
+One logged-in client then repeats a flash-heavy flow (add to watchlist,
+redirect, list) for --seconds. Reported per request: p50/p99 latency,
+bytes of Set-Cookie sent back, bytes of Cookie sent up, and SQL statements.
+--cold-user-cache empties the identity cache before every request, as a
+freshly started (or differently routed) worker would see it.
+
+    python benchmarks/bench_sessions.py --seconds 3
+    python benchmarks/bench_sessions.py --cold-user-cache
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app  # noqa: E402
+from app.config import TestingConfig  # noqa: E402
+from app.extensions import db  # noqa: E402
+from app.models import Movie, User  # noqa: E402
+
+FLOW = [('POST', '/watchlist/movie/{}'), ('GET', '/movies/'), ('GET', '/watchlist/'), ('GET', '/')]
+
+
+def percentile(values, fraction):
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+def run(backend, args, directory):
+    class BenchConfig(TestingConfig):
+        RATELIMIT_ENABLED = False
+        FRAGMENT_CACHE_MAX_BYTES = 0
+        SESSION_BACKEND = backend
+        SESSION_STORAGE_URI = 'sqlite:///' + os.path.join(directory, f'{backend}-sessions.db')
+
+    app = create_app(BenchConfig)
+    with app.app_context():
+        db.create_all()
+        user = User(name='Bench', username='bench')
+        user.set_password('password')
+        db.session.add(user)
+        db.session.add_all([Movie(title=f'Movie {i}', year=1950 + i % 70) for i in range(200)])
+        db.session.commit()
+
+    client = app.test_client()
+    client.post('/login', data=dict(username='bench', password='password'))
+
+    latencies = []
+    set_cookie_bytes = cookie_bytes = queries = 0
+    deadline = time.perf_counter() + args.seconds
+    index = 0
+    while time.perf_counter() < deadline:
+        method, path = FLOW[index % len(FLOW)]
+        index += 1
+        if args.cold_user_cache:
+            app.extensions['user_cache'].clear()
+        cookie = client.get_cookie('session')
+        cookie_bytes += len(cookie.value) if cookie is not None else 0
+
+        start = time.perf_counter()
+        response = client.open(path.format(index % 200 + 1), method=method)
+        latencies.append(time.perf_counter() - start)
+
+        set_cookie_bytes += sum(len(value) for value in response.headers.getlist('Set-Cookie'))
+        queries += int(response.headers.get('X-Query-Count', 0))
+
+    latencies.sort()
+    count = len(latencies)
+    print(f'{backend:<8} {count / args.seconds:>10.1f} {percentile(latencies, 0.5) * 1000:>10.2f} '
+          f'{percentile(latencies, 0.99) * 1000:>10.2f} {set_cookie_bytes / count:>12.1f} '
+          f'{cookie_bytes / count:>10.1f} {queries / count:>8.2f}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--seconds', type=float, default=3)
+    parser.add_argument('--backends', nargs='+', default=['cookie', 'memory', 'sqlite'])
+    parser.add_argument('--cold-user-cache', action='store_true')
+    args = parser.parse_args()
+
+    print(f'{"backend":<8} {"req/s":>10} {"p50 ms":>10} {"p99 ms":>10} {"set-cookie B":>12} '
+          f'{"cookie B":>10} {"queries":>8}')
+    with tempfile.TemporaryDirectory() as directory:
+        for backend in args.backends:
+            run(backend, args, directory)
+
+
+if __name__ == '__main__':
+    main()
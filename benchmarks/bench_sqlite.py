@@ -0,0 +1,111 @@
+"""Read throughput of the movie list under concurrent writers.
+
+Compares SQLite's defaults (rollback journal, no busy timeout) with the
+pragmas from Config.SQLITE_PRAGMAS. Each reader and writer is its own
+process, like gunicorn workers sharing one database file.
+
+    python benchmarks/bench_sqlite.py --movies 100000 --readers 4 --writers 2 --seconds 5
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+from sqlalchemy import create_engine, text
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.config import Config  # noqa: E402
+from app.sqlite import apply_pragmas  # noqa: E402
+
+PAGE = text('SELECT id, title, year FROM movie WHERE id > :after ORDER BY id LIMIT 50')
+
+
+def make_engine(path, tuned):
+    engine = create_engine(f'sqlite:///{path}')
+    if tuned:
+        apply_pragmas(engine, Config.SQLITE_PRAGMAS)
+    return engine
+
+
+def seed(path, movies):
+    engine = create_engine(f'sqlite:///{path}')
+    with engine.begin() as connection:
+        connection.exec_driver_sql('CREATE TABLE movie (id INTEGER PRIMARY KEY, title VARCHAR(60), year VARCHAR(4))')
+        connection.execute(text('INSERT INTO movie (title, year) VALUES (:title, :year)'),
+                           [dict(title=f'Movie {i}', year=1950 + i % 70) for i in range(movies)])
+    engine.dispose()
+
+
+def reader(path, tuned, movies, deadline, results):
+    engine = make_engine(path, tuned)
+    reads = errors = 0
+    after = 0
+    while time.time() < deadline:
+        try:
+            with engine.connect() as connection:
+                rows = connection.execute(PAGE, dict(after=after)).all()
+            after = rows[-1][0] if rows and after < movies - 100 else 0
+            reads += 1
+        except Exception:
+            errors += 1
+    results.put(('read', reads, errors))
+
+
+def writer(path, tuned, deadline, results):
+    engine = make_engine(path, tuned)
+    writes = errors = 0
+    while time.time() < deadline:
+        try:
+            with engine.begin() as connection:
+                connection.execute(text('INSERT INTO movie (title, year) VALUES (:title, :year)'),
+                                   dict(title='Written', year=2024))
+            writes += 1
+        except Exception:
+            errors += 1
+    results.put(('write', writes, errors))
+
+
+def run(label, tuned, args):
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'bench.db')
+        seed(path, args.movies)
+
+        results = multiprocessing.Queue()
+        deadline = time.time() + args.seconds
+        processes = [multiprocessing.Process(target=reader, args=(path, tuned, args.movies, deadline, results))
+                     for _ in range(args.readers)]
+        processes += [multiprocessing.Process(target=writer, args=(path, tuned, deadline, results))
+                      for _ in range(args.writers)]
+        for process in processes:
+            process.start()
+
+        totals = {'read': [0, 0], 'write': [0, 0]}
+        for _ in processes:
+            kind, count, errors = results.get()
+            totals[kind][0] += count
+            totals[kind][1] += errors
+        for process in processes:
+            process.join()
+
+    print(f'{label:<10} {totals["read"][0] / args.seconds:>12.0f} {totals["read"][1]:>12} '
+          f'{totals["write"][0] / args.seconds:>12.0f} {totals["write"][1]:>12}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--movies', type=int, default=20000)
+    parser.add_argument('--readers', type=int, default=4)
+    parser.add_argument('--writers', type=int, default=2)
+    parser.add_argument('--seconds', type=float, default=3)
+    args = parser.parse_args()
+
+    print(f'{"config":<10} {"reads/s":>12} {"read errors":>12} {"writes/s":>12} {"write errors":>12}')
+    run('default', False, args)
+    run('tuned', True, args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,235 @@
+"""Throughput, p50/p99 latency and peak RSS for every blueprint, against stored baselines.
+
+Seeds a database at the chosen volume (small=1k, medium=100k, large=1M
+movies and games), then measures each blueprint two ways: sequentially
+through the Flask test client (no network, one thread) and over HTTP
+with the multi-process load generator against benchmarks/serve.py.
+
+    python benchmarks/bench_suite.py --size small
+    python benchmarks/bench_suite.py --size medium --db /tmp/medium.db --save
+    python benchmarks/bench_suite.py --size small --mode client --tolerance 0.3
+
+Results are compared with benchmarks/baselines/<size>.json when it exists;
+any scenario that loses more than --tolerance of its throughput, or grows
+p99 or peak RSS by more than that, is reported and the exit status is 1.
+Baselines are only meaningful on the machine that recorded them: rerun
+with --save to record new ones. The fragment cache is off unless
+--fragment-cache is given, so repeated requests measure the views
+themselves rather than cache hits.
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+sys.path.insert(0, os.path.dirname(HERE))
+
+import loadgen  # noqa: E402
+from seed import seed  # noqa: E402
+
+SIZES = {'small': 1000, 'medium': 100000, 'large': 1000000}
+PASSWORD = 'password'
+
+
+def scenarios(rows):
+    # Blueprint -> requests cycled through for that blueprint. Every entry is
+    # (method, path, form data); only GETs are sent over HTTP, since the
+    # production config enforces CSRF on forms.
+    middle = max(rows // 2, 1)
+    return {
+        'main': [('GET', '/', None), ('GET', '/search?q=star', None)],
+        'auth': [('GET', '/login', None), ('GET', '/signup', None),
+                 ('POST', '/login', dict(username='user0', password=PASSWORD)), ('GET', '/logout', None)],
+        'movies': [('GET', '/movies/', None), ('GET', f'/movies/?after={middle}', None),
+                   ('GET', '/movies/?per_page=500', None)],
+        'games': [('GET', '/games/', None), ('GET', '/games/?sort=metacritic', None),
+                  ('GET', '/games/?sort=released&year_from=2000&year_to=2009', None)],
+        'api': [('GET', '/api/v1/movies', None), ('GET', '/api/v1/games?sort=metacritic', None)],
+    }
+
+
+def peak_rss_mb(pid=None):
+    # Peak resident set size of this process, or of a server process and its
+    # workers (Linux only; None elsewhere).
+    if pid is None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / (1024 * 1024) if platform.system() == 'Darwin' else peak / 1024
+
+    try:
+        with open(f'/proc/{pid}/task/{pid}/children') as f:
+            children = [int(child) for child in f.read().split()]
+        total = 0
+        for process in [pid] + children:
+            with open(f'/proc/{process}/status') as f:
+                total += next(int(line.split()[1]) for line in f if line.startswith('VmHWM:'))
+        return total / 1024
+    except (OSError, StopIteration, ValueError):
+        return None
+
+
+def summarize(latencies, elapsed, errors):
+    latencies.sort()
+    return dict(
+        requests=len(latencies),
+        errors=errors,
+        rps=len(latencies) / elapsed,
+        p50_ms=loadgen.percentile(latencies, 0.50) * 1000,
+        p99_ms=loadgen.percentile(latencies, 0.99) * 1000,
+    )
+
+
+def run_client(db_path, rows, args):
+    from app import create_app
+    from app.config import TestingConfig
+
+    class BenchConfig(TestingConfig):
+        SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.abspath(db_path)
+        RATELIMIT_ENABLED = False
+        QUERY_INSTRUMENTATION = False
+        FRAGMENT_CACHE_MAX_BYTES = TestingConfig.FRAGMENT_CACHE_MAX_BYTES if args.fragment_cache else 0
+
+    app = create_app(BenchConfig)
+    results = {}
+    for blueprint, steps in scenarios(rows).items():
+        client = app.test_client()
+        for method, path, data in steps:
+            client.open(path, method=method, data=data)
+
+        latencies = []
+        errors = 0
+        started = time.perf_counter()
+        deadline = started + args.seconds
+        index = 0
+        while time.perf_counter() < deadline:
+            method, path, data = steps[index % len(steps)]
+            index += 1
+            start = time.perf_counter()
+            response = client.open(path, method=method, data=data)
+            latencies.append(time.perf_counter() - start)
+            if response.status_code >= 400:
+                errors += 1
+
+        results[f'client:{blueprint}'] = dict(summarize(latencies, time.perf_counter() - started, errors),
+                                              peak_rss_mb=peak_rss_mb())
+    return results
+
+
+def run_http(db_path, rows, args):
+    results = {}
+    for blueprint, steps in scenarios(rows).items():
+        paths = [path for method, path, data in steps if method == 'GET' and path != '/logout']
+        command = [sys.executable, os.path.join(HERE, 'serve.py'), args.server, '--db', db_path,
+                   '--port', str(args.port), '--threads', str(args.threads)]
+        if not args.fragment_cache:
+            command += ['--fragment-cache-bytes', '0']
+
+        # A fresh server per blueprint, so its peak RSS belongs to that blueprint
+        server = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            base_url = f'http://127.0.0.1:{args.port}'
+            loadgen.wait_for(base_url)
+            stats = loadgen.run(base_url, paths, args.processes, args.threads, args.seconds)
+            stats['peak_rss_mb'] = peak_rss_mb(server.pid)
+        finally:
+            server.terminate()
+            server.wait()
+        results[f'http:{blueprint}'] = stats
+    return results
+
+
+def compare(results, baseline, tolerance):
+    regressions = []
+    for name, stats in results.items():
+        before = baseline.get(name)
+        if before is None:
+            continue
+        if stats['rps'] < before['rps'] * (1 - tolerance):
+            regressions.append(f'{name}: {stats["rps"]:.1f} req/s, baseline {before["rps"]:.1f}')
+        if stats['p99_ms'] > before['p99_ms'] * (1 + tolerance):
+            regressions.append(f'{name}: p99 {stats["p99_ms"]:.1f} ms, baseline {before["p99_ms"]:.1f}')
+        if stats.get('peak_rss_mb') and before.get('peak_rss_mb') and \
+                stats['peak_rss_mb'] > before['peak_rss_mb'] * (1 + tolerance):
+            regressions.append(f'{name}: peak RSS {stats["peak_rss_mb"]:.1f} MB, '
+                               f'baseline {before["peak_rss_mb"]:.1f}')
+    return regressions
+
+
+def report(results):
+    print(f'{"scenario":<16} {"req/s":>10} {"p50 ms":>10} {"p99 ms":>10} {"rss MB":>8} {"errors":>8}')
+    for name, stats in results.items():
+        rss = f'{stats["peak_rss_mb"]:.1f}' if stats.get('peak_rss_mb') else '-'
+        print(f'{name:<16} {stats["rps"]:>10.1f} {stats["p50_ms"]:>10.2f} {stats["p99_ms"]:>10.2f} '
+              f'{rss:>8} {stats["errors"]:>8}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--size', choices=SIZES, default='small')
+    parser.add_argument('--rows', type=int, help='movies and games to seed; overrides --size')
+    parser.add_argument('--db', help='reuse or create this database instead of a temporary one')
+    parser.add_argument('--mode', choices=['client', 'http', 'both'], default='both')
+    parser.add_argument('--server', choices=['wsgi', 'asgi'], default='wsgi')
+    parser.add_argument('--port', type=int, default=8111)
+    parser.add_argument('--processes', type=int, default=2)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--seconds', type=float, default=3)
+    parser.add_argument('--fragment-cache', action='store_true')
+    parser.add_argument('--baseline', help='defaults to benchmarks/baselines/<size>.json')
+    parser.add_argument('--save', action='store_true', help='record these results as the baseline')
+    parser.add_argument('--tolerance', type=float, default=0.2)
+    args = parser.parse_args()
+
+    rows = args.rows or SIZES[args.size]
+    baseline_path = args.baseline or os.path.join(HERE, 'baselines', f'{args.size}.json')
+
+    with tempfile.TemporaryDirectory() as directory:
+        db_path = args.db or os.path.join(directory, 'bench.db')
+        if not os.path.exists(db_path):
+            started = time.perf_counter()
+            seed(db_path, movies=rows, games=rows, password=PASSWORD)
+            print(f'seeded {rows} movies and games in {time.perf_counter() - started:.1f}s')
+
+        results = {}
+        if args.mode in ('client', 'both'):
+            results.update(run_client(db_path, rows, args))
+        if args.mode in ('http', 'both'):
+            results.update(run_http(db_path, rows, args))
+
+    report(results)
+
+    if args.save:
+        os.makedirs(os.path.dirname(baseline_path), exist_ok=True)
+        with open(baseline_path, 'w') as f:
+            json.dump(dict(rows=rows, python=platform.python_version(), machine=platform.machine(),
+                           results=results), f, indent=2, sort_keys=True)
+            f.write('\n')
+        print(f'baseline saved to {baseline_path}')
+        return
+
+    if not os.path.exists(baseline_path):
+        print(f'no baseline at {baseline_path}; run with --save to record one')
+        return
+
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    if baseline.get('rows') != rows:
+        print(f'baseline was recorded with {baseline.get("rows")} rows, not {rows}; skipping comparison')
+        return
+
+    regressions = compare(results, baseline['results'], args.tolerance)
+    for regression in regressions:
+        print(f'REGRESSION {regression}')
+    if regressions:
+        sys.exit(1)
+    print(f'no regressions beyond {args.tolerance:.0%} of {baseline_path}')
+
+
+if __name__ == '__main__':
+    main()
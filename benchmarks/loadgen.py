@@ -0,0 +1,124 @@
+"""Multi-process HTTP load generator.
+
+Each process runs `threads` keep-alive clients that cycle through `paths`
+until the deadline, recording per-request latency. Used by the other
+benchmark scripts; can also be pointed at any running server:
+
+    python benchmarks/loadgen.py http://127.0.0.1:8000 /movies/ /games/ --processes 4 --threads 16
+"""
+import argparse
+import http.client
+import multiprocessing
+import threading
+import time
+from urllib.parse import urlsplit
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+def _process(host, port, paths, threads, deadline, results):
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+
+    def client(offset):
+        connection = http.client.HTTPConnection(host, port, timeout=30)
+        mine = []
+        failed = 0
+        index = offset
+        while time.time() < deadline:
+            path = paths[index % len(paths)]
+            index += 1
+            start = time.perf_counter()
+            try:
+                connection.request('GET', path)
+                response = connection.getresponse()
+                response.read()
+                if response.status >= 500 or response.status == 429:
+                    failed += 1
+            except (OSError, http.client.HTTPException):
+                failed += 1
+                connection.close()
+                connection = http.client.HTTPConnection(host, port, timeout=30)
+                continue
+            mine.append(time.perf_counter() - start)
+        connection.close()
+        with lock:
+            latencies.extend(mine)
+            errors[0] += failed
+
+    workers = [threading.Thread(target=client, args=(i,)) for i in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    results.put((latencies, errors[0]))
+
+
+def run(base_url, paths, processes=2, threads=8, seconds=5):
+    parts = urlsplit(base_url)
+    results = multiprocessing.Queue()
+    deadline = time.time() + seconds
+    started = time.perf_counter()
+
+    workers = [multiprocessing.Process(target=_process,
+                                       args=(parts.hostname, parts.port or 80, paths, threads, deadline, results))
+               for _ in range(processes)]
+    for worker in workers:
+        worker.start()
+
+    latencies = []
+    errors = 0
+    for _ in workers:
+        mine, failed = results.get()
+        latencies.extend(mine)
+        errors += failed
+    for worker in workers:
+        worker.join()
+
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return dict(
+        requests=len(latencies),
+        errors=errors,
+        rps=len(latencies) / elapsed,
+        p50_ms=percentile(latencies, 0.50) * 1000,
+        p99_ms=percentile(latencies, 0.99) * 1000,
+    )
+
+
+def wait_for(base_url, timeout=30):
+    parts = urlsplit(base_url)
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            connection = http.client.HTTPConnection(parts.hostname, parts.port, timeout=1)
+            connection.request('GET', '/')
+            connection.getresponse().read()
+            connection.close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f'Server at {base_url} did not start')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('base_url')
+    parser.add_argument('paths', nargs='+')
+    parser.add_argument('--processes', type=int, default=2)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--seconds', type=float, default=5)
+    args = parser.parse_args()
+
+    stats = run(args.base_url, args.paths, args.processes, args.threads, args.seconds)
+    print(' '.join(f'{key}={value:.1f}' if isinstance(value, float) else f'{key}={value}'
+                   for key, value in stats.items()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+"""Fill a SQLite database with synthetic movies and games.
+
+    python benchmarks/seed.py /tmp/bench.db --movies 100000 --games 100000
+"""
+import argparse
+import datetime
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app  # noqa: E402
+from app.config import TestingConfig  # noqa: E402
+from app.extensions import db  # noqa: E402
+from app.migrations import create_schema  # noqa: E402
+from app.models import GameDetails, Movie, User  # noqa: E402
+
+WORDS = ['Star', 'Night', 'Legend', 'Dark', 'River', 'Empire', 'Ghost', 'City', 'Dragon', 'Silent',
+         'Iron', 'Lost', 'Blue', 'Last', 'Wild', 'Crown', 'Storm', 'Echo', 'Glass', 'Shadow']
+CHUNK = 10000
+
+
+def title(rng, index):
+    return f'{" ".join(rng.sample(WORDS, 3))} {index}'
+
+
+def seed(path, movies=1000, games=1000, users=1, password='password', seed_value=42):
+    class SeedConfig(TestingConfig):
+        SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.abspath(path)
+
+    rng = random.Random(seed_value)
+    app = create_app(SeedConfig)
+
+    with app.app_context():
+        create_schema(db.engine)
+
+        for start in range(0, movies, CHUNK):
+            db.session.execute(db.insert(Movie.__table__), [
+                dict(title=title(rng, i)[:60], year=rng.randint(1950, 2024))
+                for i in range(start, min(start + CHUNK, movies))
+            ])
+            db.session.commit()
+
+        for start in range(0, games, CHUNK):
+            rows = []
+            for i in range(start, min(start + CHUNK, games)):
+                released = rng.random() < 0.95
+                rows.append(dict(
+                    slug=f'game-{i}',
+                    name=title(rng, i),
+                    description=' '.join(rng.choices(WORDS, k=30)),
+                    metacritic=rng.randint(40, 98) if rng.random() < 0.6 else None,
+                    released=datetime.date(rng.randint(1990, 2024), rng.randint(1, 12), rng.randint(1, 28))
+                    if released else None,
+                    website=f'https://example.com/game-{i}',
+                ))
+            db.session.execute(db.insert(GameDetails.__table__), rows)
+            db.session.commit()
+
+        for i in range(users):
+            user = User(name=f'User {i}', username=f'user{i}')
+            user.set_password(password)
+            db.session.add(user)
+        db.session.commit()
+
+        db.session.remove()
+        db.engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('path')
+    parser.add_argument('--movies', type=int, default=1000)
+    parser.add_argument('--games', type=int, default=1000)
+    parser.add_argument('--users', type=int, default=1)
+    args = parser.parse_args()
+    seed(args.path, args.movies, args.games, args.users)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+"""Serve the app against a given database file for load tests.
+
+    python benchmarks/serve.py wsgi --db /tmp/bench.db --port 8001
+    python benchmarks/serve.py asgi --db /tmp/bench.db --port 8002
+
+wsgi uses gunicorn (gthread) when installed, otherwise werkzeug's threaded
+server; asgi uses uvicorn. Rate limiting is disabled so the load
+generator measures serving cost rather than 429s.
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app  # noqa: E402
+from app.config import ProductionConfig  # noqa: E402
+
+
+def make_app(db_path, fragment_cache_bytes=None):
+    class BenchConfig(ProductionConfig):
+        SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.abspath(db_path)
+        RATELIMIT_ENABLED = False
+        RATELIMIT_STORAGE_URI = 'memory://'
+        FRAGMENT_CACHE_MAX_BYTES = (ProductionConfig.FRAGMENT_CACHE_MAX_BYTES
+                                    if fragment_cache_bytes is None else fragment_cache_bytes)
+
+    return create_app(BenchConfig)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('mode', choices=['wsgi', 'asgi'])
+    parser.add_argument('--db', required=True)
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--fragment-cache-bytes', type=int)
+    args = parser.parse_args()
+
+    app = make_app(args.db, args.fragment_cache_bytes)
+
+    if args.mode == 'asgi':
+        import uvicorn
+
+        from app.asgi import AsyncWatchlist
+        uvicorn.run(AsyncWatchlist(app), host='127.0.0.1', port=args.port, log_level='warning')
+        return
+
+    try:
+        from gunicorn.app.base import BaseApplication
+    except ImportError:
+        from werkzeug.serving import run_simple
+        run_simple('127.0.0.1', args.port, app, threaded=True)
+        return
+
+    class Server(BaseApplication):
+        def load_config(self):
+            self.cfg.set('bind', f'127.0.0.1:{args.port}')
+            self.cfg.set('worker_class', 'gthread')
+            self.cfg.set('workers', 1)
+            self.cfg.set('threads', args.threads)
+
+        def load(self):
+            return app
+
+    Server().run()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,20 +1,44 @@
+import asyncio
+import datetime
+import json
+import multiprocessing
+import os
+import subprocess
+import sys
+import tempfile
+import time
 import unittest
+from sqlalchemy import event
 from app import create_app
-from app.extensions import db
+from app.cache import FragmentCache
+from app.extensions import db, limiter
 from app.config import TestingConfig
 from app.models import GameDetails, Movie, User
 
 class WatchlistTestCase(unittest.TestCase):
 
+    # One app for the whole case; each test gets a fresh schema and caches
+    @classmethod
+    def setUpClass(cls):
+        cls.app = create_app(TestingConfig)
+        cls.config = dict(cls.app.config)
+        cls.extensions = dict(cls.app.extensions)
+
     # Setup run before every test
     def setUp(self):
-        self.app = create_app(TestingConfig)
+        self.app.config.update(self.config)
+        self.app.extensions.update(self.extensions)
+        self.app.extensions['user_cache'].clear()
+        self.app.extensions['fragment_cache'] = FragmentCache(max_bytes=self.app.config['FRAGMENT_CACHE_MAX_BYTES'])
+        self.app.extensions['metrics'].clear()
+        with self.app.app_context():
+            limiter.reset()
 
         with self.app.app_context():
             db.create_all()
             user = User(name='Test', username='test')
             user.set_password('123')
-            movie = Movie(title='Test Movie Title', year='2019')
+            movie = Movie(title='Test Movie Title', year=2019)
             game = GameDetails(name='Test Game Title', metacritic='79')
             db.session.add_all([user, movie, game])
             db.session.commit()
@@ -82,6 +106,90 @@ class WatchlistTestCase(unittest.TestCase):
 
         self.assertNotIn('Test sucessfully logged in.', data)
 
+    def test_login_unknown_user(self):
+        response = self.client.post('/login', data=dict(username='nobody', password='123'), follow_redirects=True)
+        self.assertIn('Invalid username or password', response.get_data(as_text=True))
+
+    def test_login_rehashes_outdated_hash(self):
+        from werkzeug.security import generate_password_hash
+
+        with self.app.app_context():
+            user = db.session.get(User, 1)
+            user.password_hash = generate_password_hash('123', 'pbkdf2:sha256:500')
+            db.session.commit()
+            self.assertTrue(user.password_needs_rehash())
+
+        self.login()
+
+        with self.app.app_context():
+            user = db.session.get(User, 1)
+            self.assertTrue(user.password_hash.startswith('pbkdf2:sha256:1000$'))
+            self.assertFalse(user.password_needs_rehash())
+            self.assertTrue(user.validate_password('123'))
+
+    def test_password_hasher_pool(self):
+        from app.hashing import HashingBusy, PasswordHasher
+
+        hasher = PasswordHasher('pbkdf2:sha256:1000', workers=1, queue_limit=1, timeout=30)
+        password_hash = hasher.hash('secret')
+        self.assertTrue(hasher.verify(password_hash, 'secret'))
+        self.assertFalse(hasher.verify(password_hash, 'wrong'))
+        self.assertFalse(hasher.needs_rehash(password_hash))
+
+        hasher._slots.acquire()
+        with self.assertRaises(HashingBusy):
+            hasher.hash('secret')
+        hasher._slots.release()
+
+        self.app.extensions['password_hasher'] = hasher
+        hasher._slots.acquire()
+        response = self.client.post('/login', data=dict(username='test', password='123'))
+        self.assertEqual(response.status_code, 503)
+        self.assertIn('Server Busy - 503', response.get_data(as_text=True))
+        hasher._slots.release()
+        hasher._executor.shutdown()
+
+    def test_password_hasher_prefix_without_hashing(self):
+        from werkzeug.security import generate_password_hash
+
+        from app.hashing import hash_prefix
+
+        for method in ('scrypt', 'scrypt:16384:8:2', 'pbkdf2', 'pbkdf2:sha512', 'pbkdf2:sha256:1000'):
+            self.assertEqual(hash_prefix(method), generate_password_hash('x', method).split('$', 1)[0])
+        self.assertRaises(ValueError, hash_prefix, 'scrypt:1')
+
+    def test_password_hasher_recovers_from_dead_worker(self):
+        import signal
+
+        from app.hashing import PasswordHasher
+
+        hasher = PasswordHasher('pbkdf2:sha256:1000', workers=1, queue_limit=1, timeout=30)
+        password_hash = hasher.hash('secret')
+        broken = hasher._executor
+        for process in list(broken._processes.values()):
+            os.kill(process.pid, signal.SIGKILL)
+            process.join()
+
+        self.assertTrue(hasher.verify(password_hash, 'secret'))
+        self.assertIsNot(hasher._executor, broken)
+        hasher._executor.shutdown()
+
+    def test_password_hasher_timeout_holds_slot(self):
+        from app.hashing import HashingBusy, PasswordHasher
+
+        hasher = PasswordHasher('pbkdf2:sha256:1000', workers=1, queue_limit=1, timeout=0.2)
+        password_hash = hasher.hash('secret')
+
+        # The timed-out call is still running in the pool, so it still counts
+        with self.assertRaisesRegex(HashingBusy, 'timed out'):
+            hasher._run(time.sleep, 1)
+        with self.assertRaisesRegex(HashingBusy, 'Too many'):
+            hasher.verify(password_hash, 'secret')
+
+        time.sleep(1.2)
+        self.assertTrue(hasher.verify(password_hash, 'secret'))
+        hasher._executor.shutdown()
+
     def test_404_page(self):
         response = self.client.get('/nothing')
         data = response.get_data(as_text=True)
@@ -101,6 +209,103 @@ class WatchlistTestCase(unittest.TestCase):
         self.assertIn('Test Movie Title', data)
         self.assertEqual(response.status_code, 200)
     
+    def test_movie_pagination(self):
+        with self.app.app_context():
+            db.session.add_all([Movie(title=f'Paged Movie {i}', year=2000) for i in range(5)])
+            db.session.commit()
+
+        response = self.client.get('/movies/?per_page=2')
+        data = response.get_data(as_text=True)
+        self.assertIn('6 Titles', data)
+        self.assertIn('Test Movie Title', data)
+        self.assertIn('Paged Movie 0', data)
+        self.assertNotIn('Paged Movie 1', data)
+        self.assertIn('after=2', data)
+
+        response = self.client.get('/movies/?per_page=2&after=4')
+        data = response.get_data(as_text=True)
+        self.assertIn('Paged Movie 3', data)
+        self.assertIn('Paged Movie 4', data)
+        self.assertNotIn('Paged Movie 2', data)
+        self.assertNotIn('Next page', data)
+        self.assertIn('First page', data)
+
+    def test_movie_page_streaming(self):
+        self.app.config['MOVIES_STREAM'] = True
+        self.client.post('/login', data=dict(username='test', password='123'))
+        response = self.client.get('/movies/')
+        self.assertTrue(response.is_streamed)
+        data = response.get_data(as_text=True)
+        self.assertIn('Test Movie Title', data)
+        self.assertIn('Test sucessfully logged in.', data)
+
+        response = self.client.get('/movies/')
+        data = response.get_data(as_text=True)
+        self.assertNotIn('Test sucessfully logged in.', data)
+
+    def test_movie_page_shares_delete_form(self):
+        with self.app.app_context():
+            db.session.add_all([Movie(title=f'Movie {i}', year=2000) for i in range(3)])
+            db.session.commit()
+
+        self.login()
+        data = self.client.get('/movies/').get_data(as_text=True)
+        self.assertEqual(data.count('id="delete-movie"'), 1)
+        self.assertEqual(data.count('form="delete-movie"'), 4)
+
+    def test_non_movie_pages_skip_movie_query(self):
+        statements = []
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        with self.app.app_context():
+            event.listen(db.engine, 'before_cursor_execute', record)
+            try:
+                for url in ('/', '/login', '/signup', '/games/', '/nothing'):
+                    self.client.get(url)
+            finally:
+                event.remove(db.engine, 'before_cursor_execute', record)
+
+        self.assertFalse([s for s in statements if 'FROM movie' in s])
+
+    def test_user_loader_is_cached(self):
+        self.login()
+        self.client.get('/settings')
+        statements = []
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        with self.app.app_context():
+            event.listen(db.engine, 'before_cursor_execute', record)
+            try:
+                data = self.client.get('/settings').get_data(as_text=True)
+            finally:
+                event.remove(db.engine, 'before_cursor_execute', record)
+
+        self.assertIn('User: Test', data)
+        self.assertFalse([s for s in statements if 'FROM user' in s])
+
+        self.client.post('/settings', data=dict(name='Renamed'), follow_redirects=True)
+        data = self.client.get('/').get_data(as_text=True)
+        self.assertIn('User: Renamed', data)
+
+    def test_ttl_cache(self):
+        from app.cache import TTLCache
+
+        now = [0]
+        cache = TTLCache(maxsize=2, ttl=10, clock=lambda: now[0])
+        cache.set('a', 1)
+        cache.set('b', 2)
+        self.assertEqual(cache.get('a'), 1)
+        cache.set('c', 3)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), 1)
+        now[0] = 10
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(len(cache), 1)
+
     def test_games_page(self):
         response = self.client.get('/games', follow_redirects=True)
         data = response.get_data(as_text=True)
@@ -108,6 +313,236 @@ class WatchlistTestCase(unittest.TestCase):
         self.assertIn('Test Game Title', data)
         self.assertEqual(response.status_code, 200)
     
+    def test_games_sort_filter_and_paginate(self):
+        with self.app.app_context():
+            db.session.add_all([
+                GameDetails(slug='a', name='Alpha', metacritic=90, released=datetime.date(2015, 5, 1)),
+                GameDetails(slug='b', name='Bravo', metacritic=85, released=datetime.date(2018, 2, 11)),
+                GameDetails(slug='c', name='Charlie', metacritic=85, released=datetime.date(2020, 10, 30)),
+                GameDetails(slug='d', name='Delta', released=datetime.date(2021, 1, 15)),
+            ])
+            db.session.commit()
+
+        data = self.client.get('/games/?sort=metacritic&per_page=2').get_data(as_text=True)
+        self.assertLess(data.index('Alpha'), data.index('Charlie'))
+        self.assertNotIn('Bravo', data)
+        self.assertNotIn('Delta', data)
+        self.assertIn('Next page', data)
+
+        next_url = data.split('Next page')[0].rsplit('href="', 1)[1].split('"')[0].replace('&amp;', '&')
+        data = self.client.get(next_url).get_data(as_text=True)
+        self.assertIn('Bravo', data)
+        self.assertIn('Test Game Title', data)
+        self.assertNotIn('Alpha', data)
+        self.assertNotIn('Charlie', data)
+
+        data = self.client.get('/games/?sort=released&year_from=2018&year_to=2020').get_data(as_text=True)
+        self.assertIn('2 Titles', data)
+        self.assertLess(data.index('Charlie'), data.index('Bravo'))
+        self.assertNotIn('Alpha', data)
+        self.assertNotIn('Delta', data)
+
+        # The header counts what the sort lists: games missing the sort column drop out
+        for query, count in (('', 5), ('sort=metacritic', 4), ('sort=released', 4),
+                             ('sort=metacritic&year_from=2016', 2), ('sort=id&year_to=2016', 1)):
+            self.assertIn(f'{count} Titles', self.client.get(f'/games/?{query}').get_data(as_text=True), query)
+
+        self.assertEqual(self.client.get('/games/?sort=nope').status_code, 400)
+        self.assertEqual(self.client.get('/games/?after=garbage').status_code, 400)
+
+        # Well-formed JSON with the wrong element types never reaches SQLite
+        from app.queries import encode_cursor
+        for sort, cursor in (('metacritic', [{'a': 1}, 1]), ('id', [{'a': 1}]), ('id', [True]),
+                             ('released', [5, 1]), ('released', ['2020-01-01', '1'])):
+            self.assertEqual(self.client.get(f'/games/?sort={sort}&after={encode_cursor(cursor)}').status_code, 400)
+            self.assertEqual(self.client.get(f'/api/v1/games?sort={sort}&after={encode_cursor(cursor)}').status_code, 400)
+
+    def test_catalog_stats(self):
+        from app.models import CatalogStat
+        from app.stats import rebuild_stats
+
+        with self.app.app_context():
+            db.session.add_all([Movie(title='Alien', year=1979), Movie(title='Aliens', year=1986),
+                                Movie(title='Nameless', year=None),
+                                GameDetails(slug='h', name='Hades', metacritic=93, released=datetime.date(2020, 9, 17)),
+                                GameDetails(slug='c', name='Celeste', metacritic=100, released=datetime.date(2018, 1, 25))])
+            db.session.commit()
+            db.session.execute(db.update(Movie).where(Movie.title == 'Aliens').values(year=1989))
+            db.session.execute(db.delete(GameDetails).where(GameDetails.slug == 'c'))
+            db.session.commit()
+
+            snapshot = lambda: sorted(db.session.execute(
+                db.select(CatalogStat.kind, CatalogStat.bucket, CatalogStat.count).where(CatalogStat.count != 0)).all())
+            maintained = snapshot()
+            with db.engine.begin() as connection:
+                rebuild_stats(connection)
+            self.assertEqual(snapshot(), maintained)
+
+        statements = []
+        with self.app.app_context():
+            engine = db.engine
+        listener = lambda *args: statements.append(args[2])
+        event.listen(engine, 'before_cursor_execute', listener)
+        try:
+            movies = self.client.get('/movies/').get_data(as_text=True)
+            games = self.client.get('/games/?year_from=2019').get_data(as_text=True)
+        finally:
+            event.remove(engine, 'before_cursor_execute', listener)
+        self.assertIn('4 Titles', movies)
+        self.assertIn('1 Titles', games)
+        self.assertFalse([sql for sql in statements if 'count(' in sql.lower()])
+
+        data = self.client.get('/stats').get_data(as_text=True)
+        self.assertIn('Movies (4 Titles)', data)
+        self.assertIn('1970s<span class="float-right">1</span>', data)
+        self.assertIn('1980s<span class="float-right">1</span>', data)
+        self.assertIn('Unknown<span class="float-right">1</span>', data)
+        self.assertIn('90-99<span class="float-right">1</span>', data)
+        self.assertIn('70-79<span class="float-right">1</span>', data)
+        self.assertNotIn('100<span', data)
+
+    def test_games_sorts_use_indexes(self):
+        from app.queries import games_statement
+
+        with self.app.app_context():
+            for sort, index in (('metacritic', 'ix_game_details_metacritic_id'),
+                                ('released', 'ix_game_details_released_id')):
+                statement = games_statement(sort).limit(20)
+                sql = str(statement.compile(db.engine, compile_kwargs={'literal_binds': True}))
+                plan = ' '.join(row[-1] for row in db.session.execute(db.text('EXPLAIN QUERY PLAN ' + sql)))
+                self.assertIn(index, plan)
+                self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_search(self):
+        with self.app.app_context():
+            db.session.add_all([
+                Movie(title='The Legend of Zorro', year=2005),
+                GameDetails(slug='zelda', name='The Legend of Zelda', description='Open world adventure'),
+                GameDetails(slug='other', name='Other Game', description='Inspired by the legend of Zelda'),
+            ])
+            db.session.commit()
+
+        data = self.client.get('/search?q=legen').get_data(as_text=True)
+        self.assertIn('The Legend of Zorro', data)
+        self.assertIn('The Legend of Zelda', data)
+        self.assertLess(data.index('The Legend of Zelda'), data.index('Other Game'))
+
+        data = self.client.get('/search?q=test+mov').get_data(as_text=True)
+        self.assertIn('Test Movie Title', data)
+        self.assertNotIn('Zorro', data)
+
+        data = self.client.get('/search?q="OR NOT').get_data(as_text=True)
+        self.assertIn('No matching movies.', data)
+
+        with self.app.app_context():
+            movie = db.session.get(Movie, 1)
+            movie.title = 'Renamed Movie'
+            db.session.delete(db.session.execute(db.select(Movie).where(Movie.year == '2005')).scalar_one())
+            db.session.commit()
+
+        data = self.client.get('/search?q=renamed').get_data(as_text=True)
+        self.assertIn('Renamed Movie', data)
+        data = self.client.get('/search?q=zorro').get_data(as_text=True)
+        self.assertIn('No matching movies.', data)
+        data = self.client.get('/search?q=test').get_data(as_text=True)
+        self.assertNotIn('Renamed Movie', data)
+
+    def test_conditional_get(self):
+        from app.http_cache import bump_version
+
+        response = self.client.get('/movies/')
+        etag = response.headers['ETag']
+        self.assertIn('public', response.headers['Cache-Control'])
+
+        response = self.client.get('/movies/', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.get_data(), b'')
+
+        response = self.client.get('/games/', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+
+        with self.app.app_context():
+            db.session.add(Movie(title='Changed', year=2001))
+            bump_version('movies')
+            db.session.commit()
+
+        response = self.client.get('/movies/', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers['ETag'], etag)
+        self.assertIn('Changed', response.get_data(as_text=True))
+
+        response = self.client.get('/movies/', headers={'If-Modified-Since': response.headers['Last-Modified']})
+        self.assertEqual(response.status_code, 304)
+
+    def test_conditional_get_follows_writes_and_users(self):
+        anonymous = self.client.get('/movies/').headers['ETag']
+        self.login()
+        response = self.client.get('/movies/')
+        etag = response.headers['ETag']
+        self.assertNotEqual(etag, anonymous)
+        self.assertIn('private', response.headers['Cache-Control'])
+        self.assertEqual(self.client.get('/movies/', headers={'If-None-Match': etag}).status_code, 304)
+
+        self.client.post('/movies/add', data=dict(title='Another', year='2002'), follow_redirects=True)
+        self.assertEqual(self.client.get('/movies/', headers={'If-None-Match': etag}).status_code, 200)
+
+        etag = self.client.get('/movies/edit/1').headers['ETag']
+        self.client.post('/settings', data=dict(name='Other'), follow_redirects=True)
+        self.assertEqual(self.client.get('/movies/edit/1', headers={'If-None-Match': etag}).status_code, 200)
+
+    def test_fragment_cache(self):
+        self.assertEqual(self.client.get('/games/').headers['X-Cache'], 'MISS')
+        response = self.client.get('/games/')
+        self.assertEqual(response.headers['X-Cache'], 'HIT')
+        self.assertIn('Test Game Title', response.get_data(as_text=True))
+        self.assertEqual(self.client.get('/games/?sort=metacritic').headers['X-Cache'], 'MISS')
+
+        self.assertEqual(self.client.get('/movies/').headers['X-Cache'], 'MISS')
+        self.login()
+        self.assertNotIn('X-Cache', self.client.get('/movies/').headers)
+        self.client.post('/movies/add', data=dict(title='Fresh Movie', year='2003'), follow_redirects=True)
+        self.client.get('/logout', follow_redirects=True)
+
+        response = self.client.get('/movies/')
+        self.assertEqual(response.headers['X-Cache'], 'MISS')
+        self.assertIn('Fresh Movie', response.get_data(as_text=True))
+
+        self.login()
+        stats = self.client.get('/cache-stats').get_json()
+        self.assertEqual(stats['hits'], 1)
+        self.assertEqual(stats['entries'], 3)
+
+    def test_fragment_cache_eviction(self):
+        from app.cache import FragmentCache
+
+        cache = FragmentCache(max_bytes=10)
+        cache.set('a', (b'12345', 'text/html'), tags=['movies'])
+        cache.set('b', (b'12345', 'text/html'), tags=['games'])
+        cache.get('a')
+        cache.set('c', (b'123', 'text/html'), tags=['games'])
+        self.assertIsNone(cache.get('b'))
+        self.assertIsNotNone(cache.get('a'))
+        cache.set('huge', (b'x' * 11, 'text/html'))
+        self.assertIsNone(cache.get('huge'))
+        cache.invalidate('movies')
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.stats()['bytes'], 3)
+        self.assertEqual(cache.stats()['evictions'], 1)
+
+    def test_static_urls_are_content_hashed(self):
+        data = self.client.get('/').get_data(as_text=True)
+        self.assertRegex(data, r'/static/styles/base.css\?v=[0-9a-f]{12}')
+
+        url = data.split('href="/static/styles/base.css')[1].split('"')[0]
+        response = self.client.get('/static/styles/base.css' + url)
+        self.assertIn('immutable', response.headers['Cache-Control'])
+        self.assertIn('max-age=31536000', response.headers['Cache-Control'])
+        response.close()
+
+        response = self.client.get('/static/styles/base.css')
+        self.assertNotIn('immutable', response.headers.get('Cache-Control', ''))
+        response.close()
+
     def test_add_movie(self):
         self.login()
         response = self.client.post('/movies/add', data=dict(
@@ -159,6 +594,142 @@ class WatchlistTestCase(unittest.TestCase):
         data = response.get_data(as_text=True)
         self.assertIn('Invalid input.', data)
     
+    def test_api_movies(self):
+        response = self.client.get('/api/v1/movies')
+        self.assertEqual(response.get_json(), dict(items=[dict(id=1, title='Test Movie Title', year=2019)], next=None))
+        self.assertEqual(self.client.get('/api/v1/movies/1').get_json()['title'], 'Test Movie Title')
+        response = self.client.get('/api/v1/movies/99')
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.get_json()['error'], 'Not Found')
+
+        response = self.client.post('/api/v1/movies', json=dict(title='Nope', year='2000'))
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.get_json()['error'], 'Unauthorized')
+
+        self.login()
+        response = self.client.post('/api/v1/movies', json=dict(title='Api Movie', year='2010'))
+        self.assertEqual(response.status_code, 201)
+        movie_id = response.get_json()['id']
+
+        response = self.client.patch(f'/api/v1/movies/{movie_id}', json=dict(year='2011'))
+        self.assertEqual(response.get_json(), dict(id=movie_id, title='Api Movie', year=2011))
+        self.assertEqual(self.client.patch(f'/api/v1/movies/{movie_id}', json=dict(year='11')).status_code, 400)
+        self.assertEqual(self.client.post('/api/v1/movies', data='title=x').status_code, 415)
+
+        self.assertEqual(self.client.delete(f'/api/v1/movies/{movie_id}').status_code, 204)
+        self.assertEqual(self.client.delete(f'/api/v1/movies/{movie_id}').status_code, 404)
+
+    def test_json_provider_matches_stdlib(self):
+        from flask.json.provider import DefaultJSONProvider
+
+        obj = dict(b=datetime.date(2020, 9, 17), a=datetime.datetime(2020, 9, 17, 12, 30), c={2: 'x'})
+        expected = DefaultJSONProvider(self.app).dumps(obj, separators=(',', ':'))
+        self.assertEqual(self.app.json.dumps(obj), expected)
+        self.assertIn('"b":"Thu, 17 Sep 2020 00:00:00 GMT"', expected)
+        with self.app.test_request_context():
+            self.assertEqual(self.app.json.response(obj).get_data(as_text=True), expected)
+
+    def test_api_batches(self):
+        self.app.config['API_BATCH_LIMIT'] = 50
+        self.login()
+        items = [dict(title=f'Batch {i}', year='2000') for i in range(50)]
+        response = self.client.post('/api/v1/movies/batch', json=dict(items=items))
+        self.assertEqual(response.status_code, 201)
+        ids = [item['id'] for item in response.get_json()['items']]
+        self.assertEqual(len(ids), 50)
+
+        response = self.client.post('/api/v1/movies/batch', json=dict(items=items + items[:1]))
+        self.assertEqual(response.status_code, 400)
+
+        response = self.client.post('/api/v1/movies/batch', json=dict(items=[dict(title='Ok', year='2000'),
+                                                                               dict(title='Bad', year='x')]))
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('items[1]', response.get_json()['description'])
+
+        page = self.client.get('/api/v1/movies?per_page=20').get_json()
+        self.assertEqual(len(page['items']), 20)
+        page = self.client.get(f"/api/v1/movies?per_page=100&after={page['next']}").get_json()
+        self.assertEqual(len(page['items']), 31)
+        self.assertIsNone(page['next'])
+
+        response = self.client.post('/api/v1/movies/batch-delete', json=dict(ids=[True]))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.client.get('/api/v1/movies/1').status_code, 200)
+        response = self.client.post('/api/v1/movies/batch-delete', json=dict(ids=ids[:10] + [9999]))
+        self.assertEqual(response.get_json(), dict(deleted=10))
+        self.assertNotIn('Batch 0', self.client.get('/movies/').get_data(as_text=True))
+
+    def test_api_games(self):
+        data = self.client.get('/api/v1/games').get_json()
+        self.assertEqual(data['items'][0]['name'], 'Test Game Title')
+        self.assertNotIn('description', data['items'][0])
+        game_id = data['items'][0]['id']
+        self.assertIn('description', self.client.get(f'/api/v1/games/{game_id}').get_json())
+        self.assertEqual(self.client.get('/api/v1/games?after=bad').status_code, 400)
+        self.assertEqual(self.client.get('/api/v1/games?sort=bad').get_json()['error'], 'Bad Request')
+
+    def test_edit_and_delete_missing_movie(self):
+        response = self.client.post('/movies/edit/1', data=dict(title='x', year='2000'))
+        self.assertEqual(response.headers['X-Query-Count'], '0')
+
+        self.login()
+        response = self.client.post('/movies/edit/99', data=dict(title='Ghost', year='2000'))
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(self.client.get('/movies/edit/99').status_code, 404)
+
+        response = self.client.post('/movies/delete/99', follow_redirects=True)
+        self.assertIn('Movie not found.', response.get_data(as_text=True))
+
+        response = self.client.post('/movies/delete/1')
+        self.assertEqual(response.headers['X-Query-Count'], '2')
+
+    def test_query_budget(self):
+        from app.instrumentation import QueryBudgetExceeded, query_budget
+
+        # Routes can't be added to the shared app once it has served requests
+        app = create_app(TestingConfig)
+
+        @app.route('/chatty')
+        @query_budget(2)
+        def chatty():
+            for _ in range(3):
+                db.session.execute(db.select(Movie)).all()
+            return 'done'
+
+        with app.app_context():
+            db.create_all()
+        client = app.test_client()
+
+        with self.assertRaises(QueryBudgetExceeded):
+            client.get('/chatty')
+
+        app.testing = False
+        with self.assertLogs(app.logger, 'WARNING'):
+            response = client.get('/chatty')
+        self.assertEqual(response.headers['X-Query-Count'], '3')
+
+    def test_metrics(self):
+        self.client.get('/movies/')
+        self.login()
+
+        self.app.config['SERVER_TIMING_ENABLED'] = True
+        response = self.client.get('/games/')
+        phases = [entry.split(';')[0] for entry in response.headers['Server-Timing'].split(', ')]
+        self.assertEqual(phases, ['total', 'handler', 'sql', 'render', 'hashing', 'ratelimit'])
+
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.content_type.startswith('text/plain'))
+        body = response.get_data(as_text=True)
+        self.assertIn('watchlist_request_duration_seconds_count{endpoint="movies.movies",phase="render"} 1', body)
+        self.assertIn('watchlist_request_duration_seconds_bucket{endpoint="auth.login",phase="hashing",le="+Inf"} 1', body)
+        self.assertIn('watchlist_sql_queries_total{endpoint="games.games"}', body)
+        self.assertIn('watchlist_fragment_cache_misses_total 1', body.splitlines())
+
+        login_hashing = [line for line in body.splitlines()
+                         if line.startswith('watchlist_request_duration_seconds_sum{endpoint="auth.login",phase="hashing"}')]
+        self.assertGreater(float(login_hashing[0].split()[-1]), 0)
+
     def test_login_protect(self):
         response = self.client.get('/')
         data = response.get_data(as_text=True)
@@ -232,6 +803,119 @@ class WatchlistTestCase(unittest.TestCase):
         result = self.runner.invoke(args=['initdb'])
         self.assertIn('Initialized database.', result.output)
 
+    def test_reindex_search_command(self):
+        result = self.runner.invoke(args=['reindex-search'])
+        self.assertIn('Rebuilt search index.', result.output)
+        data = self.client.get('/search?q=test').get_data(as_text=True)
+        self.assertIn('Test Movie Title', data)
+        self.assertIn('Test Game Title', data)
+
+    def test_rebuild_stats_command(self):
+        with self.app.app_context():
+            db.session.execute(db.text('DELETE FROM catalog_stats'))
+            db.session.commit()
+        self.assertIn('0 Titles', self.client.get('/movies/').get_data(as_text=True))
+
+        result = self.runner.invoke(args=['rebuild-stats'])
+        self.assertIn('Rebuilt catalog stats.', result.output)
+        self.assertIn('1 Titles', self.client.get('/movies/').get_data(as_text=True))
+
+    def test_import_games_command(self):
+        rows = [
+            dict(slug='portal', name='Portal', metacritic=90, released='2007-10-09'),
+            dict(slug='portal-2', name='Portal 2', metacritic='95', released='2011-04-18'),
+            dict(slug='broken', name='Broken', released='not a date'),
+            dict(name='No Slug'),
+            dict(slug='infinite', name='Infinite', metacritic='inf'),
+            dict(slug='portal', name='Portal (Updated)', metacritic=91, released='2007-10-10'),
+        ]
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'games.jsonl')
+            with open(path, 'w') as f:
+                f.write('\n'.join(json.dumps(row) for row in rows) + '\n{not json\n')
+
+            result = self.runner.invoke(args=['import-games', path, '--batch-size', '2'])
+
+        self.assertIn('Imported 2 rows (0 skipped)...', result.output)
+        self.assertIn('Done. Imported 3 games, skipped 4 invalid rows.', result.output)
+
+        with self.app.app_context():
+            portal = db.session.execute(db.select(GameDetails).where(GameDetails.slug == 'portal')).scalar_one()
+            self.assertEqual(portal.name, 'Portal (Updated)')
+            self.assertEqual(portal.metacritic, 91)
+            self.assertEqual(db.session.execute(db.select(db.func.count()).select_from(GameDetails)).scalar_one(), 3)
+
+        data = self.client.get('/search?q=portal').get_data(as_text=True)
+        self.assertIn('Portal 2', data)
+
+    def test_games_list_query_count_is_constant(self):
+        from app.models import Genre, Platform
+
+        with self.app.app_context():
+            platforms = [Platform(slug=f'platform-{i}', name=f'Platform {i}') for i in range(3)]
+            action = Genre(slug='action', name='Action')
+            db.session.add_all([GameDetails(slug=f'game-{i}', name=f'Game {i}', platforms=platforms[:i % 3 + 1],
+                                            genres=[action]) for i in range(40)])
+            db.session.commit()
+
+        counts = []
+        for per_page in (1, 10, 40):
+            response = self.client.get(f'/games/?per_page={per_page}')
+            self.assertEqual(response.status_code, 200)
+            counts.append(int(response.headers['X-Query-Count']))
+        self.assertEqual(len(set(counts)), 1, counts)
+        self.assertIn('Platform 0, Platform 1 &middot; Action', response.get_data(as_text=True))
+
+        response = self.client.get('/api/v1/games?per_page=40')
+        self.assertEqual(response.get_json()['items'][2]['platforms'], ['Platform 0', 'Platform 1'])
+        self.assertEqual(response.get_json()['items'][2]['genres'], ['Action'])
+        self.assertEqual(self.client.get('/api/v1/games/2').get_json()['platforms'], ['Platform 0'])
+
+    def test_import_games_platforms_and_genres(self):
+        from app.models import Genre, Platform
+
+        rows = [
+            dict(slug='hades', name='Hades', platforms=[{'platform': {'id': 4, 'name': 'PC', 'slug': 'pc'}},
+                                                        {'platform': {'name': 'Nintendo Switch'}}],
+                 genres=[{'name': 'Action'}, {'name': 'Indie'}]),
+            dict(slug='celeste', name='Celeste', platforms=['PC', 'PC'], genres='Platformer; Indie'),
+        ]
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'games.jsonl')
+            with open(path, 'w') as f:
+                f.write('\n'.join(json.dumps(row) for row in rows))
+            self.runner.invoke(args=['import-games', path])
+
+            # Re-importing replaces the links; rows without the field keep theirs
+            with open(path, 'w') as f:
+                f.write(json.dumps(dict(slug='hades', name='Hades', platforms=['PlayStation 5'])) + '\n')
+                f.write(json.dumps(dict(slug='celeste', name='Celeste')) + '\n')
+                f.write(json.dumps(dict(slug='bad', name='Bad', platforms=[{'platform': 'PC'}])) + '\n')
+            result = self.runner.invoke(args=['import-games', path])
+        self.assertIn('Imported 2 games, skipped 1 invalid rows', result.output)
+
+        with self.app.app_context():
+            games = {game.slug: game for game in db.session.execute(db.select(GameDetails)).scalars()}
+            self.assertEqual([platform.name for platform in games['hades'].platforms], ['PlayStation 5'])
+            self.assertEqual([genre.name for genre in games['hades'].genres], ['Action', 'Indie'])
+            self.assertEqual([platform.name for platform in games['celeste'].platforms], ['PC'])
+            self.assertEqual([genre.name for genre in games['celeste'].genres], ['Indie', 'Platformer'])
+            self.assertEqual(db.session.execute(db.select(Platform.slug).order_by(Platform.slug)).scalars().all(),
+                             ['nintendo-switch', 'pc', 'playstation-5'])
+            self.assertEqual(db.session.execute(db.select(db.func.count()).select_from(Genre)).scalar(), 3)
+
+    def test_import_games_csv(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'games.csv')
+            with open(path, 'w', newline='') as f:
+                f.write('slug,name,metacritic,released\nhades,Hades,93,2020-09-17\ncelia,Celeste,,2018-01-25\n')
+
+            result = self.runner.invoke(args=['import-games', path])
+
+        self.assertIn('Done. Imported 2 games, skipped 0 invalid rows.', result.output)
+        data = self.client.get('/games/?sort=released').get_data(as_text=True)
+        self.assertLess(data.index('Hades'), data.index('Celeste'))
+
     def test_admin_command(self):
         with self.app.app_context():
             db.drop_all()
@@ -252,5 +936,891 @@ class WatchlistTestCase(unittest.TestCase):
             self.assertEqual(User.query.first().username, 'peter')
             self.assertTrue(User.query.first().validate_password('456'))
 
+    def test_watchlist(self):
+        self.assertEqual(self.client.post('/watchlist/movie/1').status_code, 401)
+
+        self.login()
+        response = self.client.post('/watchlist/movie/1', follow_redirects=True)
+        self.assertIn('Added to your watchlist.', response.get_data(as_text=True))
+        response = self.client.post('/watchlist/movie/1', follow_redirects=True)
+        self.assertIn('Already on your watchlist.', response.get_data(as_text=True))
+        self.client.post('/watchlist/game/1')
+        self.assertEqual(self.client.post('/watchlist/movie/99').status_code, 404)
+
+        data = self.client.get('/watchlist/').get_data(as_text=True)
+        self.assertIn('Test Movie Title - 2019 (Movie)', data)
+        self.assertIn('Test Game Title (Game)', data)
+        self.assertLess(data.index('Test Game Title'), data.index('Test Movie Title'))
+
+        with self.app.app_context():
+            from app.models import WatchlistEntry
+            entry = db.session.execute(db.select(WatchlistEntry).where(WatchlistEntry.movie_id == 1)).scalar_one()
+            entry_id = entry.id
+
+        self.client.post(f'/watchlist/{entry_id}/status', data=dict(status='finished'))
+        self.assertIn('<option value="finished" selected>', self.client.get('/watchlist/').get_data(as_text=True))
+        self.assertEqual(self.client.post('/watchlist/99/status', data=dict(status='finished')).status_code, 404)
+
+        response = self.client.post(f'/watchlist/{entry_id}/remove', follow_redirects=True)
+        data = response.get_data(as_text=True)
+        self.assertIn('Removed from your watchlist.', data)
+        self.assertNotIn('Test Movie Title - 2019 (Movie)', data)
+
+    def test_watchlist_pagination(self):
+        with self.app.app_context():
+            db.session.add_all([Movie(title=f'Movie {i}', year=2000 + i) for i in range(5)])
+            db.session.commit()
+        self.login()
+        for movie_id in range(2, 7):
+            self.client.post(f'/watchlist/movie/{movie_id}')
+
+        with self.app.test_request_context():
+            from app.watchlist import watchlist_page
+            first = watchlist_page(1, per_page=2)
+            second = watchlist_page(1, first.next_cursor, per_page=2)
+            third = watchlist_page(1, second.next_cursor, per_page=2)
+            self.assertEqual([entry.title for entry in [*first, *second, *third]],
+                             [f'Movie {i}' for i in reversed(range(5))])
+            self.assertIsNone(third.next_cursor)
+
+        data = self.client.get('/watchlist/?per_page=2').get_data(as_text=True)
+        self.assertIn('Next page', data)
+        self.assertNotIn('Movie 2', data)
+        self.assertEqual(self.client.get('/watchlist/?after=nope').status_code, 400)
+
+    def test_watchlist_follows_catalog(self):
+        from app.models import WatchlistEntry
+
+        self.login()
+        self.client.post('/watchlist/movie/1')
+        with self.app.app_context():
+            movie = db.session.get(Movie, 1)
+            movie.title, movie.year = 'Renamed', 2020
+            db.session.commit()
+            entry = db.session.execute(db.select(WatchlistEntry)).scalar_one()
+            self.assertEqual((entry.title, entry.year), ('Renamed', 2020))
+
+            db.session.delete(movie)
+            db.session.commit()
+            self.assertEqual(db.session.execute(db.select(db.func.count()).select_from(WatchlistEntry)).scalar(), 0)
+
+    def test_watchlist_uses_index(self):
+        from app.queries import encode_cursor
+        from app.watchlist import watchlist_page_statement
+
+        with self.app.app_context():
+            for after in (None, encode_cursor(['2024-01-01T00:00:00', 5])):
+                statement = watchlist_page_statement(1, after)
+                compiled = statement.compile(db.engine, compile_kwargs={'literal_binds': True})
+                plan = ' '.join(row[-1] for row in db.session.execute(db.text(f'EXPLAIN QUERY PLAN {compiled}')))
+                self.assertIn('ix_watchlist_entry_user_added', plan)
+                self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_jobs_queue_and_run(self):
+        from app.jobs import run_worker
+        from app.models import CatalogStat, Job
+
+        self.login()
+        with self.app.app_context():
+            db.session.execute(db.delete(CatalogStat))
+            db.session.commit()
+
+        # Enqueueing returns straight away; nothing runs until a worker does
+        response = self.client.post('/jobs/rebuild-stats', follow_redirects=True)
+        self.assertIn('Queued job 1.', response.get_data(as_text=True))
+        self.assertEqual(self.client.get('/jobs/1').get_json()['status'], 'queued')
+        self.assertEqual(self.client.post('/jobs/drop-tables').status_code, 404)
+
+        self.assertEqual(run_worker(self.app, burst=True), 1)
+        job = self.client.get('/jobs/1').get_json()
+        self.assertEqual((job['status'], job['attempts']), ('done', 1))
+        with self.app.app_context():
+            self.assertEqual(db.session.execute(db.select(db.func.sum(CatalogStat.count))
+                                                .where(CatalogStat.kind == 'movie_year')).scalar(), 1)
+            self.assertEqual(db.session.get(Job, 1).status, 'done')
+        self.assertIn('#1 rebuild-stats - done', self.client.get('/jobs/').get_data(as_text=True))
+
+    def test_jobs_import_upload(self):
+        import io
+
+        self.login()
+        upload_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(upload_dir.cleanup)
+        self.app.config['JOB_UPLOAD_DIR'] = upload_dir.name
+        self.app.config['IMPORT_BATCH_SIZE'] = 1
+
+        dump = '\n'.join(json.dumps(dict(slug=f'game-{i}', name=f'Game {i}')) for i in range(3)) + '\n{"name": "no slug"}\n'
+        self.client.post('/jobs/import-games', data=dict(dump=(io.BytesIO(dump.encode()), 'games.jsonl')),
+                         content_type='multipart/form-data')
+        self.assertEqual(len(os.listdir(upload_dir.name)), 1)
+
+        from app.jobs import run_worker
+        run_worker(self.app, burst=True)
+        job = self.client.get('/jobs/1').get_json()
+        self.assertEqual(job['status'], 'done')
+        self.assertEqual((job['progress'], job['total']), (4, 4))
+        self.assertEqual((job['result']['imported'], job['result']['skipped']), (3, 1))
+        self.assertEqual(os.listdir(upload_dir.name), [])
+        with self.app.app_context():
+            self.assertEqual(db.session.execute(db.select(db.func.count()).select_from(GameDetails)).scalar(), 4)
+
+    def test_jobs_retry_then_fail(self):
+        from app.jobs import HANDLERS, claim, enqueue, run_worker
+        from app.models import Job
+
+        calls = []
+
+        def flaky(payload, progress):
+            calls.append(payload)
+            if len(calls) < 2:
+                raise RuntimeError('try again')
+            return 'ok'
+
+        def broken(payload, progress):
+            raise RuntimeError('always broken')
+
+        HANDLERS.update(flaky=flaky, broken=broken)
+        self.addCleanup(HANDLERS.pop, 'flaky')
+        self.addCleanup(HANDLERS.pop, 'broken')
+        self.app.config['JOB_RETRY_DELAY'] = 0
+
+        with self.app.app_context():
+            enqueue('flaky', dict(n=1))
+            enqueue('broken', max_attempts=2)
+            db.session.commit()
+            self.assertRaises(ValueError, enqueue, 'missing')
+
+        self.app.logger.disabled = True
+        self.addCleanup(setattr, self.app.logger, 'disabled', False)
+        self.assertEqual(run_worker(self.app, burst=True), 4)
+
+        with self.app.app_context():
+            flaky_job, broken_job = db.session.execute(db.select(Job).order_by(Job.id)).scalars()
+            self.assertEqual((flaky_job.status, flaky_job.attempts, flaky_job.result, flaky_job.error),
+                             ('done', 2, 'ok', None))
+            self.assertEqual((broken_job.status, broken_job.attempts), ('failed', 2))
+            self.assertIn('RuntimeError: always broken', broken_job.error)
+            self.assertIsNone(claim('nobody'))
+
+    def test_jobs_claim_once_and_requeue_stale(self):
+        from app.jobs import claim, enqueue, requeue_stale
+        from app.models import Job
+
+        with self.app.app_context():
+            enqueue('reindex-search')
+            db.session.commit()
+            self.assertEqual(claim('a').id, 1)
+            self.assertIsNone(claim('b'))
+
+            # A worker that vanished mid-job: its job goes back on the queue
+            self.assertEqual(requeue_stale(timeout=60), 0)
+            self.assertEqual(requeue_stale(timeout=-1), 1)
+            self.assertEqual(db.session.get(Job, 1).status, 'queued')
+            self.assertEqual(claim('b').attempts, 2)
+
+    def test_jobs_heartbeat_and_requeued_runs(self):
+        from app.jobs import HANDLERS, claim, enqueue, requeue_stale, run_worker
+        from app.models import Job
+
+        def quiet(payload, progress):
+            time.sleep(0.3)
+
+        def overtaken(payload, progress):
+            # Taken for lost and claimed by another worker mid-run
+            requeue_stale(timeout=-1)
+            claim('other')
+            return 'late'
+
+        HANDLERS.update(quiet=quiet, overtaken=overtaken)
+        self.addCleanup(HANDLERS.pop, 'quiet')
+        self.addCleanup(HANDLERS.pop, 'overtaken')
+        self.app.config['JOB_HEARTBEAT_INTERVAL'] = 0.05
+
+        with self.app.app_context():
+            enqueue('quiet')
+            enqueue('overtaken')
+            db.session.commit()
+        self.app.logger.disabled = True
+        self.addCleanup(setattr, self.app.logger, 'disabled', False)
+        self.assertEqual(run_worker(self.app, burst=True), 2)
+
+        with self.app.app_context():
+            quiet_job, overtaken_job = db.session.execute(db.select(Job).order_by(Job.id)).scalars()
+            self.assertEqual(quiet_job.status, 'done')
+            self.assertGreater(quiet_job.heartbeat_at, quiet_job.started_at)
+            self.assertEqual((overtaken_job.status, overtaken_job.worker, overtaken_job.result),
+                             ('running', 'other', None))
+
+    def test_worker_command(self):
+        result = self.runner.invoke(args=['enqueue', 'reindex-search'])
+        self.assertIn('Queued job 1.', result.output)
+        result = self.runner.invoke(args=['enqueue', 'nope'])
+        self.assertNotEqual(result.exit_code, 0)
+
+        result = self.runner.invoke(args=['worker', '--burst', '--concurrency', '1'])
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn('Job 1 (reindex-search) done.', result.output)
+        self.assertIn('Ran 1 jobs.', result.output)
+        self.assertIn('reindex-search   done', self.runner.invoke(args=['jobs']).output)
+
+def _open_storage(storage_uri, barrier):
+    from app.ratelimit import SQLiteStorage
+
+    barrier.wait()
+    SQLiteStorage(storage_uri).incr('key', expiry=60)
+
+def _signup_attempts(storage_uri, attempts):
+    class SharedLimitConfig(TestingConfig):
+        RATELIMIT_STORAGE_URI = storage_uri
+
+    app = create_app(SharedLimitConfig)
+    with app.app_context():
+        db.create_all()
+    client = app.test_client()
+    return [client.post('/signup', data=dict(
+        username=f'user{os.getpid()}{i}',
+        password='12345678',
+        confirm_password='12345678'
+    )).status_code for i in range(attempts)]
+
+
+class SharedRateLimitTestCase(unittest.TestCase):
+
+    def test_limits_shared_across_processes(self):
+        with tempfile.TemporaryDirectory() as directory:
+            uri = 'sqlite:///' + os.path.join(directory, 'ratelimit.db')
+            with multiprocessing.get_context('fork').Pool(3) as pool:
+                results = pool.starmap(_signup_attempts, [(uri, 2)] * 3)
+
+        statuses = [status for result in results for status in result]
+        # /signup allows 3 POSTs per day per client, however many workers serve them
+        self.assertEqual(statuses.count(302), 3)
+        self.assertEqual(statuses.count(429), 3)
+
+    def test_storage_opened_by_many_processes_at_once(self):
+        # Fresh workers racing to put a new file into WAL mode
+        context = multiprocessing.get_context('fork')
+        for _ in range(25):
+            with tempfile.TemporaryDirectory() as directory:
+                uri = 'sqlite:///' + os.path.join(directory, 'ratelimit.db')
+                barrier = context.Barrier(8)
+                processes = [context.Process(target=_open_storage, args=(uri, barrier)) for _ in range(8)]
+                for process in processes:
+                    process.start()
+                for process in processes:
+                    process.join()
+                self.assertEqual([process.exitcode for process in processes], [0] * 8)
+
+    def test_sqlite_storage_expires_counters(self):
+        from app.ratelimit import SQLiteStorage
+
+        with tempfile.TemporaryDirectory() as directory:
+            storage = SQLiteStorage('sqlite:///' + os.path.join(directory, 'ratelimit.db'))
+            self.assertEqual(storage.incr('key', expiry=60), 1)
+            self.assertEqual(storage.incr('key', expiry=60), 2)
+            self.assertEqual(storage.get('key'), 2)
+            self.assertEqual(storage.incr('gone', expiry=-1), 1)
+            self.assertEqual(storage.get('gone'), 0)
+            self.assertEqual(storage.sweep(), 1)
+            storage.clear('key')
+            self.assertEqual(storage.get('key'), 0)
+
+
+class AsyncServingTestCase(unittest.TestCase):
+
+    def setUp(self):
+        try:
+            from app.asgi import AsyncWatchlist
+        except ImportError as e:
+            self.skipTest(f'ASGI extras not installed: {e}')
+
+        self.directory = tempfile.TemporaryDirectory()
+
+        class FileConfig(TestingConfig):
+            SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.join(self.directory.name, 'asgi.db')
+
+        self.app = create_app(FileConfig)
+        with self.app.app_context():
+            db.create_all()
+            db.session.add_all([Movie(title=f'Async Movie {i}', year=2000) for i in range(3)])
+            db.session.add(GameDetails(slug='async', name='Async Game', metacritic=80, released=datetime.date(2020, 1, 1)))
+            db.session.commit()
+        self.asgi = AsyncWatchlist(self.app)
+        self.loop = asyncio.new_event_loop()
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.session.remove()
+            db.engine.dispose()
+        self.loop.run_until_complete(self.asgi.engine.dispose())
+        self.loop.close()
+        self.directory.cleanup()
+
+    def request(self, path, query_string=b'', headers=(), client='10.0.0.1'):
+        scope = dict(type='http', method='GET', path=path, query_string=query_string, root_path='',
+                     scheme='http', server=('testserver', 80), client=(client, 50000), http_version='1.1',
+                     headers=[(b'host', b'testserver')] + list(headers))
+        messages = []
+
+        async def receive():
+            return dict(type='http.request', body=b'', more_body=False)
+
+        async def send(message):
+            messages.append(message)
+
+        self.loop.run_until_complete(self.asgi(scope, receive, send))
+        self.headers = {name.decode(): value.decode() for name, value in messages[0]['headers']}
+        return messages[0]['status'], b''.join(m.get('body', b'') for m in messages[1:]).decode()
+
+    def test_async_movie_list(self):
+        status, body = self.request('/movies/', b'per_page=2')
+        self.assertEqual(status, 200)
+        self.assertIn('3 Titles', body)
+        self.assertIn('Async Movie 1', body)
+        self.assertNotIn('Async Movie 2', body)
+        self.assertIn('after=2', body)
+
+    def test_async_game_list(self):
+        status, body = self.request('/games/', b'sort=metacritic')
+        self.assertEqual(status, 200)
+        self.assertIn('Async Game', body)
+        self.assertEqual(self.request('/games/', b'sort=nope')[0], 400)
+
+    def test_async_views_keep_request_hooks(self):
+        status, body = self.request('/movies/')
+        self.assertEqual((status, self.headers['x-cache']), (200, 'MISS'))
+        self.assertEqual(self.headers['x-query-count'], '3')
+        self.assertIn('public', self.headers['cache-control'])
+        self.assertIn('x-ratelimit-remaining', self.headers)
+        etag = self.headers['etag']
+
+        self.request('/movies/')
+        self.assertEqual(self.headers['x-cache'], 'HIT')
+        status, body = self.request('/movies/', headers=[(b'if-none-match', etag.encode())])
+        self.assertEqual((status, body), (304, ''))
+
+        histograms = self.app.extensions['metrics']._data
+        self.assertEqual(histograms[('movies.movies', 'total')][2], 3)
+
+        # The default limit counts async requests too
+        self.request('/games/')
+        remaining = int(self.headers['x-ratelimit-remaining'])
+        for _ in range(remaining + 1):
+            status, body = self.request('/games/')
+        self.assertEqual(status, 429)
+
+    def test_async_clients_have_their_own_limits(self):
+        self.request('/movies/', client='10.0.0.1')
+        self.request('/movies/', client='10.0.0.1')
+        first = int(self.headers['x-ratelimit-remaining'])
+        self.request('/movies/', client='10.0.0.2')
+        self.assertEqual(int(self.headers['x-ratelimit-remaining']), first + 1)
+
+    def test_async_view_errors_use_the_500_handler(self):
+        async def broken(session):
+            raise RuntimeError('boom')
+
+        self.asgi.views['/movies/'] = (broken, 'movies')
+        self.app.testing = False
+        self.app.logger.disabled = True
+        self.addCleanup(setattr, self.app.logger, 'disabled', False)
+        status, body = self.request('/movies/')
+        self.assertEqual(status, 500)
+        self.assertIn('Internal Server Error - 500', body)
+
+    def test_other_requests_fall_through_to_flask(self):
+        status, body = self.request('/')
+        self.assertEqual(status, 200)
+        self.assertIn('Welcome to my awesome homepage.', body)
+
+        status, body = self.request('/movies/', headers=[(b'cookie', b'session=abc')])
+        self.assertEqual(status, 200)
+        self.assertIn('Async Movie 0', body)
+
+
+class SQLiteTuningTestCase(unittest.TestCase):
+
+    def test_pragmas_applied_to_file_database(self):
+        with tempfile.TemporaryDirectory() as directory:
+            class FileConfig(TestingConfig):
+                SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.join(directory, 'tuned.db')
+
+            app = create_app(FileConfig)
+            with app.app_context():
+                pragma = lambda name: db.session.execute(db.text(f'PRAGMA {name}')).scalar()
+                self.assertEqual(pragma('journal_mode'), 'wal')
+                self.assertEqual(pragma('synchronous'), 1)
+                self.assertEqual(pragma('busy_timeout'), TestingConfig.SQLITE_PRAGMAS['busy_timeout'])
+                self.assertEqual(pragma('cache_size'), TestingConfig.SQLITE_PRAGMAS['cache_size'])
+                db.session.remove()
+                db.engine.dispose()
+
+
+class ServerSideSessionTestCase(unittest.TestCase):
+
+    def make_app(self, backend='memory', **settings):
+        class SessionConfig(TestingConfig):
+            SESSION_BACKEND = backend
+
+        for key, value in settings.items():
+            setattr(SessionConfig, key, value)
+        app = create_app(SessionConfig)
+        with app.app_context():
+            db.create_all()
+            user = User(name='Test', username='test')
+            user.set_password('123')
+            db.session.add(user)
+            db.session.commit()
+        return app
+
+    def test_cookie_holds_only_an_id(self):
+        app = self.make_app()
+        store = app.session_interface.store
+        client = app.test_client()
+
+        response = client.post('/login', data=dict(username='test', password='wrong'))
+        first_sid = client.get_cookie('session').value
+        self.assertEqual(len(first_sid), 43)
+        self.assertNotIn('.', first_sid)
+        self.assertIsNotNone(store.get(first_sid))
+
+        # Logging in swaps the id and drops the old record
+        response = client.post('/login', data=dict(username='test', password='123'))
+        sid = client.get_cookie('session').value
+        self.assertIn('Set-Cookie', response.headers)
+        self.assertNotEqual(sid, first_sid)
+        self.assertIsNone(store.get(first_sid))
+
+        # Flashes and other changes go to the store, not the cookie
+        response = client.get('/')
+        self.assertIn('Test sucessfully logged in.', response.get_data(as_text=True))
+        self.assertNotIn('Set-Cookie', response.headers)
+        response = client.post('/settings', data=dict(name='Renamed'))
+        self.assertNotIn('Set-Cookie', response.headers)
+        self.assertIn('Name change successful.', client.get('/settings').get_data(as_text=True))
+
+        # A forged or unknown id is just an empty session
+        client.set_cookie('session', 'x' * 43)
+        self.assertEqual(client.get('/settings').status_code, 401)
+
+    def test_user_snapshot_skips_select(self):
+        app = self.make_app()
+        client = app.test_client()
+        client.post('/login', data=dict(username='test', password='123'))
+        client.get('/')
+
+        data, _ = app.session_interface.store.get(client.get_cookie('session').value)
+        self.assertIn('_user', data)
+        self.assertNotIn('password_hash', data)
+
+        # A worker with a cold identity cache still finds the user in the session
+        app.extensions['user_cache'].clear()
+        with app.app_context():
+            baseline = int(app.test_client().get('/watchlist/').headers['X-Query-Count'])
+        response = client.get('/watchlist/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(int(response.headers['X-Query-Count']), baseline + 1)
+        self.assertIn("Test's Watchlist", response.get_data(as_text=True))
+
+        # A user rebuilt from the session snapshot loads the hash when asked
+        from app.cache import load_cached_user
+        with app.test_request_context():
+            snapshot = json.loads(data)['_user'][1]
+            app.extensions['user_cache'].set('1', snapshot)
+            self.assertTrue(load_cached_user(1).validate_password('123'))
+        app.extensions['user_cache'].clear()
+
+        # Renaming drops the snapshot along with the cache entry
+        client.post('/settings', data=dict(name='Renamed'))
+        app.extensions['user_cache'].clear()
+        self.assertIn("Renamed's Watchlist", client.get('/watchlist/').get_data(as_text=True))
+
+    def test_expiry_and_sweep(self):
+        app = self.make_app(PERMANENT_SESSION_LIFETIME=datetime.timedelta(seconds=60))
+        store = app.session_interface.store
+        client = app.test_client()
+        client.post('/login', data=dict(username='test', password='123'))
+        sid = client.get_cookie('session').value
+
+        data, expires_at = store.get(sid)
+        store.set(sid, data, expires_at - 50)
+        client.get('/')
+        self.assertGreater(store.get(sid)[1], expires_at - 50)
+
+        store.set('stale', data, 0)
+        self.assertEqual(len(store), 2)
+        self.assertEqual(store.sweep(), 1)
+
+        store.set(sid, data, 0)
+        self.assertEqual(client.get('/settings').status_code, 401)
+
+    def test_sqlite_store_shared_between_workers(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        uri = 'sqlite:///' + os.path.join(directory.name, 'sessions.db')
+
+        first = self.make_app('sqlite', SESSION_STORAGE_URI=uri)
+        second = self.make_app('sqlite', SESSION_STORAGE_URI=uri)
+
+        client = first.test_client()
+        client.post('/login', data=dict(username='test', password='123'))
+        other = second.test_client()
+        other.set_cookie('session', client.get_cookie('session').value)
+        self.assertEqual(other.get('/settings').status_code, 200)
+
+        client.get('/logout')
+        self.assertEqual(other.get('/settings').status_code, 401)
+
+    def test_cookie_backend_is_default(self):
+        from flask.sessions import SecureCookieSessionInterface
+
+        self.assertIsInstance(create_app(TestingConfig).session_interface, SecureCookieSessionInterface)
+
+
+class SchemaTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+        class FileConfig(TestingConfig):
+            SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.join(self.directory.name, 'schema.db')
+
+        self.app = create_app(FileConfig)
+        self.runner = self.app.test_cli_runner()
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.session.remove()
+            db.engine.dispose()
+        self.directory.cleanup()
+
+    def tables(self):
+        with self.app.app_context():
+            return set(db.inspect(db.engine).get_table_names())
+
+    def test_create_app_leaves_schema_alone(self):
+        self.assertEqual(self.tables(), set())
+
+    def test_upgrade_fresh_database(self):
+        from app.migrations import current_version, head
+
+        result = self.runner.invoke(args=['db', 'upgrade'])
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertLessEqual({'movie', 'game_details', 'user', 'movie_fts', 'schema_version'}, self.tables())
+        with self.app.app_context(), db.engine.connect() as connection:
+            self.assertEqual(current_version(connection), head())
+
+        result = self.runner.invoke(args=['db', 'upgrade'])
+        self.assertIn('Schema is up to date.', result.output)
+        self.assertIn(f'Schema version {head()}', self.runner.invoke(args=['db', 'current']).output)
+
+    def test_upgrade_unversioned_database(self):
+        # A database created on boot by older releases: tables, data, no versions
+        with self.app.app_context():
+            db.create_all()
+            db.session.add(Movie(title='Kept', year=1999))
+            db.session.commit()
+
+        result = self.runner.invoke(args=['db', 'upgrade'])
+        self.assertIn('Applying 1: baseline...', result.output)
+        with self.app.app_context():
+            self.assertEqual(db.session.execute(db.select(Movie.title)).scalar_one(), 'Kept')
+
+    def test_upgrade_converts_columns_in_batches(self):
+        from app.migrations import stamp
+        from app.search import install_search_index
+
+        # The layout as of version 1: text years and release dates
+        with self.app.app_context(), db.engine.begin() as connection:
+            connection.exec_driver_sql('CREATE TABLE movie (id INTEGER PRIMARY KEY, title VARCHAR(60), year VARCHAR(4))')
+            connection.exec_driver_sql(
+                'CREATE TABLE game_details (id INTEGER PRIMARY KEY, slug VARCHAR, name VARCHAR, description VARCHAR, '
+                'metacritic INTEGER, released VARCHAR, website VARCHAR)')
+            connection.exec_driver_sql('CREATE UNIQUE INDEX ix_game_details_slug ON game_details (slug)')
+            connection.exec_driver_sql('CREATE TABLE game_platforms (id INTEGER PRIMARY KEY, game_id INTEGER, platform VARCHAR)')
+            db.metadata.create_all(connection)
+            install_search_index(connection)
+            stamp(connection, 1)
+
+            connection.exec_driver_sql(
+                "INSERT INTO movie (title, year) VALUES ('Alien', '1979'), ('Heat', ' 1995'), "
+                "('Unknown', 'n/a'), ('Blank', NULL), ('Brazil', '1985')")
+            connection.exec_driver_sql(
+                "INSERT INTO game_details (slug, name, released) VALUES ('a', 'Hades', '2020-09-17'), "
+                "('b', 'Celeste', '2018-01-25T00:00:00'), ('c', 'Braid', 'August 2008'), ('d', 'Fez', NULL)")
+            connection.exec_driver_sql(
+                "INSERT INTO user (name, username, password_hash) VALUES ('Admin', 'admin', ''), ('Other', 'other', '')")
+
+        self.app.config['MIGRATION_BATCH_SIZE'] = 2
+        result = self.runner.invoke(args=['db', 'upgrade'])
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn('Applying 2: movie.year as integer', result.output)
+        self.assertIn('Applying 3: game_details.released as date', result.output)
+        self.assertIn('Applying 4: catalog_stats summary table', result.output)
+        self.assertIn('Applying 5: per-user watchlists', result.output)
+        self.assertIn('Applying 6: background job queue', result.output)
+        self.assertIn('Applying 7: game platforms and genres', result.output)
+
+        with self.app.app_context():
+            self.assertEqual(db.session.execute(db.select(Movie.title, Movie.year).order_by(Movie.id)).all(),
+                             [('Alien', 1979), ('Heat', 1995), ('Unknown', None), ('Blank', None), ('Brazil', 1985)])
+            self.assertEqual(db.session.execute(db.select(GameDetails.released).order_by(GameDetails.id)).scalars().all(),
+                             [datetime.date(2020, 9, 17), datetime.date(2018, 1, 25), None, None])
+
+            inspector = db.inspect(db.engine)
+            self.assertIn('ix_movie_title', {index['name'] for index in inspector.get_indexes('movie')})
+            self.assertEqual({'ix_game_details_slug', 'ix_game_details_metacritic_id', 'ix_game_details_released_id'},
+                             {index['name'] for index in inspector.get_indexes('game_details')})
+            self.assertNotIn('_movie_rebuild', inspector.get_table_names())
+            self.assertIn('game_platforms_legacy', inspector.get_table_names())
+            self.assertIn('platform_id', {column['name'] for column in inspector.get_columns('game_platforms')})
+
+            # The old shared movie list becomes the first user's watchlist
+            from app.models import WatchlistEntry
+            self.assertEqual(db.session.execute(db.select(WatchlistEntry.user_id, WatchlistEntry.title, WatchlistEntry.year)
+                                                .order_by(WatchlistEntry.movie_id)).all(),
+                             [(1, 'Alien', 1979), (1, 'Heat', 1995), (1, 'Unknown', None), (1, 'Blank', None),
+                              (1, 'Brazil', 1985)])
+
+            # Search triggers come back with the rebuilt tables
+            db.session.add(Movie(title='Aliens', year=1986))
+            db.session.commit()
+        client = self.app.test_client()
+        self.assertIn('Aliens - 1986', client.get('/search?q=alien').get_data(as_text=True))
+        self.assertIn('6 Titles', client.get('/movies/').get_data(as_text=True))
+
+    def game_triggers(self):
+        with self.app.app_context(), db.engine.connect() as connection:
+            return set(connection.exec_driver_sql(
+                "SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = 'game_details'").scalars())
+
+    def legacy_games(self, released_type):
+        from app.migrations import stamp
+
+        # Slugs without the unique index, as some older databases have them
+        with self.app.app_context(), db.engine.begin() as connection:
+            connection.exec_driver_sql(
+                'CREATE TABLE game_details (id INTEGER PRIMARY KEY, slug VARCHAR, name VARCHAR, description VARCHAR, '
+                f'metacritic INTEGER, released {released_type}, website VARCHAR)')
+            db.metadata.create_all(connection)
+            stamp(connection, 2)
+            connection.exec_driver_sql(
+                "INSERT INTO game_details (slug, name, released) VALUES ('hades', 'Hades', '2020-09-17'), "
+                "('hades', 'Hades II', '2024-05-06'), ('celeste', 'Celeste', NULL), (NULL, 'Braid', NULL), "
+                "(NULL, 'Fez', NULL)")
+
+    def assert_games_migrated(self):
+        from app.migrations import applied_versions
+
+        with self.app.app_context():
+            self.assertEqual(db.session.execute(db.select(GameDetails.slug).order_by(GameDetails.id)).scalars().all(),
+                             ['hades', 'hades-2', 'celeste', None, None])
+            self.assertIn('ix_game_details_slug', {index['name'] for index in db.inspect(db.engine).get_indexes('game_details')})
+            with db.engine.connect() as connection:
+                self.assertIn(3, applied_versions(connection))
+        self.assertLessEqual({'game_fts_insert', 'game_fts_delete', 'game_fts_update'}, self.game_triggers())
+
+    def test_upgrade_dedupes_legacy_slugs(self):
+        self.legacy_games('VARCHAR')
+        result = self.runner.invoke(args=['db', 'upgrade'])
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assert_games_migrated()
+
+    def test_upgrade_finishes_half_converted_games(self):
+        # A swap that committed its DDL but failed on the unique index, before
+        # the search triggers were reinstalled and version 3 recorded
+        self.legacy_games('DATE')
+        with self.app.app_context(), db.engine.begin() as connection:
+            for name in self.game_triggers():
+                connection.exec_driver_sql(f'DROP TRIGGER {name}')
+
+        result = self.runner.invoke(args=['db', 'upgrade'])
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assert_games_migrated()
+
+
+class ProductionTemplatesTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+        class ProductionLikeConfig(TestingConfig):
+            TEMPLATES_AUTO_RELOAD = False
+            JINJA_BYTECODE_CACHE_DIR = os.path.join(self.directory.name, 'jinja')
+            COMPRESS_ENABLED = True
+            COMPRESS_MIN_SIZE = 500
+
+        self.app = create_app(ProductionLikeConfig)
+        with self.app.app_context():
+            db.create_all()
+            db.session.add_all([Movie(title=f'Compressed Movie {i}', year=2000) for i in range(20)])
+            db.session.commit()
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_compile_templates_command(self):
+        result = self.app.test_cli_runner().invoke(args=['compile-templates'])
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn('Compiled', result.output)
+        self.assertTrue(os.listdir(os.path.join(self.directory.name, 'jinja')))
+        self.assertFalse(self.app.jinja_env.auto_reload)
+
+    def test_output_is_trimmed(self):
+        body = self.client.get('/movies/').get_data(as_text=True)
+        self.assertNotIn('{%', body)
+        self.assertFalse([line for line in body.splitlines() if line and not line.strip()])
+
+    def test_gzip_with_encoded_etag(self):
+        import gzip
+
+        plain = self.client.get('/movies/')
+        self.assertNotIn('Content-Encoding', plain.headers)
+        self.assertIn('Accept-Encoding', plain.headers['Vary'])
+
+        response = self.client.get('/movies/', headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(response.get_data()), plain.get_data())
+        self.assertEqual(response.headers['ETag'], plain.headers['ETag'][:-1] + '-gzip"')
+
+        response = self.client.get('/movies/', headers={'Accept-Encoding': 'gzip',
+                                                         'If-None-Match': response.headers['ETag']})
+        self.assertEqual(response.status_code, 304)
+        self.assertTrue(response.headers['ETag'].endswith('-gzip"'))
+
+        # Small bodies aren't worth it
+        response = self.client.get('/api/v1/movies/1', headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('Content-Encoding', response.headers)
+
+
+class BuildAssetsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+        class AssetsConfig(TestingConfig):
+            ASSETS_DIR = os.path.join(self.directory.name, 'static')
+
+        self.config = AssetsConfig
+        result = create_app(AssetsConfig).test_cli_runner().invoke(args=['build-assets', '--no-images'])
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn('Built 7 assets', result.output)
+        with open(os.path.join(AssetsConfig.ASSETS_DIR, 'manifest.json')) as f:
+            self.manifest = json.load(f)
+
+    def test_manifest(self):
+        built = self.manifest['files']['styles/base.css']
+        self.assertRegex(built, r'^styles/base\.[0-9a-f]{12}\.css$')
+        path = os.path.join(self.config.ASSETS_DIR, built)
+        self.assertTrue(os.path.exists(path + '.gz'))
+        self.assertLess(os.path.getsize(path + '.gz'), os.path.getsize(path))
+        # Already-compressed formats are copied as they are
+        gif = os.path.join(self.config.ASSETS_DIR, self.manifest['files']['images/all_might.gif'])
+        self.assertFalse(os.path.exists(gif + '.gz'))
+
+    def test_refuses_to_wipe_other_directories(self):
+        runner = create_app(self.config).test_cli_runner()
+        app_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'app')
+        for output in (app_dir, os.path.dirname(app_dir), os.path.join(app_dir, 'static', 'built')):
+            result = runner.invoke(args=['build-assets', '--no-images', '--output', output])
+            self.assertNotEqual(result.exit_code, 0)
+            self.assertIn('Refusing to build assets', result.output)
+        self.assertTrue(os.path.exists(os.path.join(app_dir, '__init__.py')))
+
+        other = os.path.join(self.directory.name, 'other')
+        os.makedirs(other)
+        open(os.path.join(other, 'keep.txt'), 'w').close()
+        result = runner.invoke(args=['build-assets', '--no-images', '--output', other])
+        self.assertIn('Refusing to replace', result.output)
+        self.assertTrue(os.path.exists(os.path.join(other, 'keep.txt')))
+
+        # A previous build is replaced
+        result = runner.invoke(args=['build-assets', '--no-images'])
+        self.assertEqual(result.exit_code, 0, result.output)
+
+    def test_serves_precompressed_immutable_files(self):
+        import gzip
+
+        client = create_app(self.config).test_client()
+        built = self.manifest['files']['styles/base.css']
+        data = client.get('/').get_data(as_text=True)
+        self.assertIn(f'href="/static/{built}"', data)
+        self.assertNotIn('base.css?v=', data)
+
+        with open(os.path.join(os.path.dirname(__file__), 'app', 'static', 'styles', 'base.css'), 'rb') as f:
+            source = f.read()
+        response = client.get(f'/static/{built}', headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(response.mimetype, 'text/css')
+        self.assertIn('Accept-Encoding', response.headers['Vary'])
+        self.assertTrue(response.cache_control.immutable)
+        self.assertEqual(response.cache_control.max_age, 365 * 24 * 60 * 60)
+        self.assertEqual(gzip.decompress(response.get_data()), source)
+
+        response = client.get(f'/static/{built}')
+        self.assertNotIn('Content-Encoding', response.headers)
+        self.assertEqual(response.get_data(), source)
+
+        # Unbuilt names still come from app/static
+        self.assertEqual(client.get('/static/styles/base.css').get_data(), source)
+
+    def test_gif_variants_in_page(self):
+        # Stand in for gif2webp/ffmpeg output, which may not be installed here
+        gif = self.manifest['files']['images/all_might.gif']
+        webp = gif.replace('.gif', '.webp')
+        with open(os.path.join(self.config.ASSETS_DIR, webp), 'wb') as f:
+            f.write(b'RIFF')
+        self.manifest['variants']['images/all_might.gif'] = dict(webp=webp)
+        with open(os.path.join(self.config.ASSETS_DIR, 'manifest.json'), 'w') as f:
+            json.dump(self.manifest, f)
+
+        client = create_app(self.config).test_client()
+        data = client.get('/').get_data(as_text=True)
+        self.assertIn(f'<source srcset="/static/{webp}" type="image/webp">', data)
+        self.assertIn(f'<img src="/static/{gif}">', data)
+        self.assertEqual(client.get(f'/static/{webp}').mimetype, 'image/webp')
+
+
+class StartupTestCase(unittest.TestCase):
+
+    # Production settings (scrypt, file database, bytecode cache) with every
+    # path moved into a temporary directory, passed as argv[1]
+    SCRIPT = '''
+import os, sys, time
+started = time.perf_counter()
+from app import create_app
+from app.config import ProductionConfig
+
+class StartupConfig(ProductionConfig):
+    SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.join(sys.argv[1], 'startup.db')
+    ASSETS_DIR = os.path.join(sys.argv[1], 'assets')
+    JINJA_BYTECODE_CACHE_DIR = os.path.join(sys.argv[1], 'jinja')
+
+app = create_app(StartupConfig)
+booted = time.perf_counter()
+from app.extensions import db
+from app.migrations import create_schema
+with app.app_context():
+    create_schema(db.engine)
+schema = time.perf_counter()
+assert app.test_client().get('/').status_code == 200
+print(booted - started, time.perf_counter() - schema)
+'''
+
+    def test_startup_budget(self):
+        # Import + create_app + first request, in a fresh interpreter: about
+        # 0.4-0.7s on a dev machine. Loosen with STARTUP_BUDGET (seconds) on
+        # slow CI runners.
+        budget = float(os.getenv('STARTUP_BUDGET', 1))
+        with tempfile.TemporaryDirectory() as directory:
+            output = subprocess.run([sys.executable, '-c', self.SCRIPT, directory], capture_output=True, text=True,
+                                    check=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout
+        boot, first_request = map(float, output.split())
+        self.assertLess(boot + first_request, budget)
+
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file